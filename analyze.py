@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## Analysis of a directory of session logs.
+## ---------------------------------------------------------------- ##
+## Every log is summarized on its own, per task and condition: RT
+## distribution, accuracy, inter-key intervals and task-switch cost.
+## Logs are processed in parallel by a pool of processes, and every
+## summary is cached (CACHE_NAME, in the log directory) with the size
+## and modification time of its log, or its hash with --hash. A log
+## that did not change is never read again, so re-running after
+## adding a few participants only processes the new files.
+##
+## Binary logs (see dual.BinaryLog) are used when they exist, as
+## they are read much faster than the text ones.
+## ---------------------------------------------------------------- ##
+
+import os
+import sys
+import json
+import argparse
+import concurrent.futures
+import numpy as np
+
+import dual
+
+
+CACHE_NAME = ".analysis-cache.json"
+CACHE_VERSION = 1
+LOG_FIELDS = 7       # Fields of a row written by the panels, after stddata
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+COLUMNS = ("participant", "task", "condition", "n", "accuracy",
+           "rt_mean", "rt_sd") + \
+          tuple("rt_q%d" % int(q * 100) for q in QUANTILES) + \
+          ("iki_mean", "iki_switch", "iki_repeat", "switch_cost")
+
+
+def ReadTextLog(fname):
+    """Reads a text log into the same columns as dual.ReadBinaryLog"""
+    task = []
+    cond = []
+    correct = []
+    tme = []
+    rt = []
+    with open(fname, "r") as stream:
+        for line in stream:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < LOG_FIELDS:
+                continue
+            t, c, r, ok, tm, dt, index = fields[-LOG_FIELDS:]
+            task.append(dual.Code(dual.TASK_CODES, t))
+            cond.append(dual.Code(dual.CONDITION_CODES, c))
+            correct.append(ok == "True")
+            tme.append(float(tm))
+            rt.append(float(dt))
+    return {"task" : np.array(task, dtype=np.uint8),
+            "condition" : np.array(cond, dtype=np.uint8),
+            "correct" : np.array(correct, dtype=np.bool_),
+            "time" : np.array(tme),
+            "rt" : np.array(rt)}
+
+
+def ReadLog(fname):
+    binary = fname + dual.BINLOG_SUFFIX
+    if os.path.exists(binary):
+        return dual.ReadBinaryLog(binary)
+    return ReadTextLog(fname)
+
+
+def Mean(x):
+    return float(x.mean()) if len(x) else None
+
+
+def Summarize(fname):
+    """Summarizes one log; returns a list of rows, one per task and
+    condition, as dicts of COLUMNS (without the participant)
+    """
+    log = ReadLog(fname)
+    order = np.argsort(log["time"], kind="stable")
+    task = log["task"][order]
+    cond = log["condition"][order]
+    tme = log["time"][order]
+
+    # Inter-key intervals, attributed to the second key; a switch is
+    # a key of a different task than the one before it
+    iki = np.diff(tme, prepend=np.nan)
+    switch = np.r_[False, task[1:] != task[:-1]]
+
+    rows = []
+    for t, tname in enumerate(dual.TASK_CODES):
+        for c, cname in enumerate(dual.CONDITION_CODES):
+            mask = (task == t) & (cond == c)
+            if not mask.any():
+                continue
+            rt = log["rt"][order][mask]
+            quantiles = np.quantile(rt, QUANTILES)
+            intervals = mask & ~np.isnan(iki)
+            sw = Mean(iki[intervals & switch])
+            rp = Mean(iki[intervals & ~switch])
+            row = {"task" : tname,
+                   "condition" : cname,
+                   "n" : int(mask.sum()),
+                   "accuracy" : float(log["correct"][order][mask].mean()),
+                   "rt_mean" : float(rt.mean()),
+                   "rt_sd" : float(rt.std())}
+            for q, v in zip(QUANTILES, quantiles):
+                row["rt_q%d" % int(q * 100)] = float(v)
+            row["iki_mean"] = Mean(iki[intervals])
+            row["iki_switch"] = sw
+            row["iki_repeat"] = rp
+            row["switch_cost"] = sw - rp if sw is not None and rp is not None \
+                else None
+            rows.append(row)
+    return rows
+
+
+def Signature(fname, use_hash=False):
+    """What a cached summary must match to be still valid"""
+    sig = {}
+    for key, path in (("text", fname), ("binary", fname + dual.BINLOG_SUFFIX)):
+        if not os.path.exists(path):
+            continue
+        if use_hash:
+            sig[key] = dual.HashFile(path).hex()
+        else:
+            st = os.stat(path)
+            sig[key] = [st.st_size, st.st_mtime_ns]
+    return sig
+
+
+def LoadCache(fname, version=CACHE_VERSION):
+    try:
+        with open(fname, "r") as stream:
+            cache = json.load(stream)
+        if cache.get("version") == version:
+            return cache["files"]
+    except (IOError, OSError, ValueError):
+        pass
+    return {}
+
+
+def SaveCache(files, fname, version=CACHE_VERSION):
+    with open(fname + ".tmp", "w") as out:
+        json.dump({"version" : version, "files" : files}, out)
+    os.replace(fname + ".tmp", fname)
+
+
+def FindLogs(directory):
+    """The text logs of a directory (binary logs, input captures,
+    samples and journals go with them)
+    """
+    logs = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.startswith(".") or not os.path.isfile(path):
+            continue
+        if name.endswith((dual.BINLOG_SUFFIX, dual.INPUT_SUFFIX,
+                          dual.SAMPLE_SUFFIX, dual.JOURNAL_SUFFIX,
+                          ".tmp")):
+            continue
+        logs.append(path)
+    return logs
+
+
+def Analyze(directory, workers=None, use_hash=False, cache_name=None):
+    """Summarizes all the logs of DIRECTORY, using and updating the
+    cache. Returns the rows of the table, the number of logs, and the
+    number of logs that had to be read.
+    """
+    if cache_name is None:
+        cache_name = os.path.join(directory, CACHE_NAME)
+    cache = LoadCache(cache_name)
+    logs = FindLogs(directory)
+
+    todo = []
+    signatures = {}
+    for path in logs:
+        name = os.path.basename(path)
+        signatures[name] = Signature(path, use_hash)
+        entry = cache.get(name)
+        if entry is None or entry["signature"] != signatures[name]:
+            todo.append(path)
+
+    if todo:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        chunk = max(1, len(todo) // (4 * workers))
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            for path, rows in zip(todo, pool.map(Summarize, todo,
+                                                 chunksize=chunk)):
+                name = os.path.basename(path)
+                cache[name] = {"signature" : signatures[name], "rows" : rows}
+
+    # Forget the logs that are gone
+    for name in list(cache):
+        if name not in signatures:
+            del cache[name]
+    if todo or len(cache) != len(signatures):
+        SaveCache(cache, cache_name)
+
+    table = []
+    for path in logs:
+        name = os.path.basename(path)
+        participant = os.path.splitext(name)[0]
+        for row in cache[name]["rows"]:
+            table.append(dict(row, participant=participant))
+    return table, len(logs), len(todo)
+
+
+def FormatValue(v):
+    if v is None:
+        return "NA"
+    if isinstance(v, float):
+        return "%.6g" % v
+    return "%s" % v
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyzes session logs")
+    parser.add_argument("directory")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Tab-separated table (default: standard output)")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--hash", action="store_true",
+                        help="Validate the cache by content, not by mtime")
+    args = parser.parse_args()
+
+    table, nlogs, processed = Analyze(args.directory, args.workers, args.hash)
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        out.write("\t".join(COLUMNS) + "\n")
+        for row in table:
+            out.write("\t".join([FormatValue(row[c]) for c in COLUMNS]) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    sys.stderr.write("%d logs, %d processed\n" % (nlogs, processed))
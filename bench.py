@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## Benchmarks of the hot paths of dual.py, with stored baselines.
+## ---------------------------------------------------------------- ##
+## Every benchmark times an operation a number of times, and keeps
+## the best of several repetitions, as seconds per operation. The
+## results are compared with the baselines saved for this machine
+## (BASELINE_FILE), and the script fails if any benchmark got slower
+## than its baseline by more than the tolerance. Benchmarks without a
+## baseline are only reported.
+##
+##   python bench.py            # Compare with the baselines
+##   python bench.py --save     # Store the current timings
+##   python bench.py -k log     # Only the benchmarks matching 'log'
+##
+## Baselines are only comparable on the same machine, so they are
+## stored per host name and Python version, in a local file that is
+## not part of the repository.
+##
+## The import of dual.py is also checked, with python -X importtime:
+## it must stay within IMPORT_BUDGET, and must not pull in any of the
+## LAZY_MODULES, which are only imported when they are needed.
+## ---------------------------------------------------------------- ##
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import argparse
+import contextlib
+
+import dual
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "benchmarks.json")
+TOLERANCE = 0.30       # Slowdown allowed before failing
+REPEAT = 5             # Repetitions; the best one is kept
+TRIAL_FILE_SIZES = (100, 1000, 10000)
+IMPORT_BUDGET = 0.025  # Seconds allowed to import dual.py
+LAZY_MODULES = ("wx", "yaml", "numpy")
+
+BENCHMARKS = []
+
+
+def Benchmark(number):
+    """Registers a benchmark that runs its operation NUMBER times.
+    The decorated function gets the number of operations, and returns
+    the function to time (so that the setup is not timed).
+    """
+    def register(func):
+        BENCHMARKS.append((func.__name__, number, func))
+        return func
+    return register
+
+
+def Time(setup, number, repeat=REPEAT):
+    """Best time per operation, in seconds, over REPEAT runs"""
+    best = None
+    for r in range(repeat):
+        func = setup(number)
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                start = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / number
+
+
+## ---------------------------------------------------------------- ##
+## Fixtures
+## ---------------------------------------------------------------- ##
+
+TMPDIR = tempfile.mkdtemp(prefix="dualbench")
+
+def TrialFile(n):
+    """A trial file with N entries, made of copies of trials.yaml"""
+    fname = os.path.join(TMPDIR, "trials%d.yaml" % n)
+    if not os.path.exists(fname):
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "trials.yaml")
+        with open(source, "r") as stream:
+            text = stream.read().rstrip("\n")
+        copies = -(-n // len(dual.LoadTrials(source)))
+        with open(fname, "w") as out:
+            out.write("\n".join([text] * copies) + "\n")
+    return fname
+
+
+def Trials(n):
+    """A list of N (typing, subtraction) trials"""
+    base = dual.LoadTrials(TrialFile(100))
+    return [base[i % len(base)] for i in range(n)]
+
+
+## ---------------------------------------------------------------- ##
+## Benchmarks
+## ---------------------------------------------------------------- ##
+
+def LoadTrialsBenchmark(size):
+    """Seconds per trial to parse a file of SIZE entries"""
+    def setup(number):
+        fname = TrialFile(size)
+        return lambda: [dual.LoadTrials(fname) for i in range(number // size)]
+    setup.__name__ = "load_trials_%d" % size
+    return setup
+
+for size in TRIAL_FILE_SIZES:
+    Benchmark(size * max(1, 1000 // size))(LoadTrialsBenchmark(size))
+
+
+@Benchmark(1000)
+def open_trial_cache(number):
+    fname = TrialFile(1000)
+    dual.OpenTrialCache(fname).close()
+    def run():
+        for i in range(number // 1000):
+            cache = dual.OpenTrialCache(fname)
+            list(cache)
+            cache.close()
+    return run
+
+
+@Benchmark(20000)
+def typing_trial(number):
+    def run():
+        for i in range(number):
+            dual.TypingTrial("hard", "apparently")
+    return run
+
+
+@Benchmark(20000)
+def subtraction_trial(number):
+    def run():
+        for i in range(number):
+            dual.SubtractionTrial("hard", "7235708551", "6077746824")
+    return run
+
+
+@Benchmark(100000)
+def correct_response(number):
+    typing = dual.TypingTask()
+    subtraction = dual.SubtractionTask()
+    def run():
+        for i in range(number // 2):
+            typing.correct_response
+            subtraction.correct_response
+    return run
+
+
+@Benchmark(20000)
+def process_response(number):
+    """A headless session answered correctly, keystroke by keystroke"""
+    trials = Trials(number // 20 + 1)
+    def run():
+        session = dual.DualTaskSession(trials)
+        for i in range(number):
+            session.Respond(session.active_task.correct_response, 0)
+    return run
+
+
+@Benchmark(20000)
+def log_data(number):
+    """Cost of LogData for the caller, with the background writer"""
+    row = ["typing", "easy", "A", True, 1.5, 0.25, 3]
+    def run():
+        logger = dual.Logger(os.path.join(TMPDIR, "bench.log"),
+                             background=True,
+                             binary=os.path.join(TMPDIR, "bench.log.bin"))
+        for i in range(number):
+            logger.LogData(row)
+        logger.Close()
+    return run
+
+
+@Benchmark(20000)
+def publish_response(number):
+    """Cost of publishing a response for the UI thread, to one
+    synchronous and one queued subscriber
+    """
+    task = dual.TypingTask()
+    event = task.Respond("A", 0)
+    def run():
+        bus = dual.EventBus()
+        bus.Subscribe(dual.ResponseEvent, lambda e: None)
+        bus.Subscribe(dual.ResponseEvent, lambda e: None, queued=True,
+                      maxsize=number)
+        for i in range(number):
+            bus.Publish(event)
+        bus.Close()
+    return run
+
+
+@Benchmark(100000)
+def input_record(number):
+    """Cost of recording a mouse event, with the ring spilling to disk"""
+    def run():
+        capture = dual.InputCapture(os.path.join(TMPDIR, "bench.input"))
+        for i in range(number):
+            capture.Record(0, 1, i, i)
+        capture.Close()
+    return run
+
+
+@Benchmark(20000)
+def journal_append(number):
+    """Cost of journaling a transition for the UI thread"""
+    trials = Trials(10)
+    def run():
+        fname = os.path.join(TMPDIR, "bench.journal")
+        if os.path.exists(fname):
+            os.remove(fname)
+        session = dual.DualTaskSession(trials)
+        session.journal = dual.SessionJournal(fname)
+        for i in range(number):
+            session.Decay()
+        session.journal.Close()
+    return run
+
+
+@Benchmark(1000)
+def resume(number):
+    """Reading the journal of a session halfway through a cached
+    trial list of 1000 trials, and resuming it
+    """
+    fname = os.path.join(TMPDIR, "resume.journal")
+    cache = dual.OpenTrialCache(TrialFile(1000))
+    dual.WriteJournalFile(fname, [dual.SessionState(dual.JOURNAL_RESPONSE,
+                                                    10**9, 500, 4, 5, 0,
+                                                    700).Pack()] * 100)
+    def run():
+        for i in range(number):
+            session = dual.DualTaskSession(cache)
+            session.Resume(dual.ReadJournal(fname))
+    return run
+
+
+@Benchmark(20000)
+def point_tick(number):
+    """The headless part of the point tick: the scheduler calling the
+    decay job, on a virtual clock
+    """
+    clock = dual.VirtualClock()
+    scheduler = dual.Scheduler(clock)
+    counter = dual.PointCounter()
+    scheduler.Every(dual.POINT_TICK, lambda: counter.Add(dual.DECAY_POINTS))
+    period = int(dual.POINT_TICK * dual.NS)
+    def run():
+        for i in range(number):
+            clock.Set(clock.Now() + period)
+            scheduler.RunUntil(clock.Now())
+    return run
+
+
+## ---------------------------------------------------------------- ##
+## Import time
+## ---------------------------------------------------------------- ##
+
+def ImportTime(module="dual", repeat=REPEAT):
+    """Best cumulative import time (s) of MODULE in a fresh interpreter,
+    and the LAZY_MODULES that it imported
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)   # Measure with bytecode cached
+    check = ("import sys, %s; print(' '.join(m for m in %r if m in sys.modules))"
+             % (module, LAZY_MODULES))
+    best = None
+    loaded = []
+    for r in range(repeat + 1):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", check],
+                              cwd=here, env=env, capture_output=True,
+                              text=True, check=True)
+        loaded = proc.stdout.split()
+        for line in proc.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[2].strip() == module:
+                us = int(fields[1])
+                if r > 0 and (best is None or us < best):
+                    best = us
+    return best / 1e6, loaded
+
+
+## ---------------------------------------------------------------- ##
+## Baselines
+## ---------------------------------------------------------------- ##
+
+def Machine():
+    return "%s/python%d.%d" % (platform.node(), sys.version_info[0],
+                               sys.version_info[1])
+
+
+def LoadBaselines(fname=BASELINE_FILE):
+    if not os.path.exists(fname):
+        return {}
+    with open(fname, "r") as stream:
+        return json.load(stream)
+
+
+def SaveBaselines(baselines, fname=BASELINE_FILE):
+    with open(fname + ".tmp", "w") as out:
+        json.dump(baselines, out, indent=2, sort_keys=True)
+        out.write("\n")
+    os.replace(fname + ".tmp", fname)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks dual.py")
+    parser.add_argument("--save", action="store_true",
+                        help="Store the timings as the new baselines")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Allowed slowdown, as a fraction")
+    parser.add_argument("-k", default=None,
+                        help="Only run benchmarks whose name contains this")
+    parser.add_argument("--baselines", default=BASELINE_FILE)
+    args = parser.parse_args()
+
+    machine = Machine()
+    baselines = LoadBaselines(args.baselines)
+    mine = baselines.setdefault(machine, {})
+
+    regressions = []
+    missing = []
+    try:
+        for name, number, setup in BENCHMARKS:
+            if args.k is not None and args.k not in name:
+                continue
+            t = Time(setup, number)
+            base = mine.get(name)
+            if base is None:
+                status = "no baseline"
+                if not args.save:
+                    missing.append(name)
+            else:
+                change = t / base - 1
+                status = "%+6.1f%%" % (100 * change)
+                if change > args.tolerance:
+                    status += "  REGRESSION"
+                    regressions.append(name)
+            print("%-22s %12.3f us/op   %s" % (name, t * 1e6, status))
+            if args.save:
+                mine[name] = t
+    finally:
+        shutil.rmtree(TMPDIR, ignore_errors=True)
+
+    name = "import_dual"
+    if args.k is None or args.k in name:
+        t, loaded = ImportTime()
+        status = "budget %.0f ms" % (IMPORT_BUDGET * 1e3)
+        if t > IMPORT_BUDGET:
+            status += "  OVER BUDGET"
+        if loaded:
+            status += "  IMPORTS %s" % ", ".join(loaded)
+        if t > IMPORT_BUDGET or loaded:
+            regressions.append(name)
+        print("%-22s %12.3f ms       %s" % (name, t * 1e3, status))
+
+    if args.save:
+        SaveBaselines(baselines, args.baselines)
+        print("Baselines saved for %s" % machine)
+    else:
+        if missing:
+            print("Warning: %d benchmark(s) without a baseline for %s; "
+                  "run with --save to store them" % (len(missing), machine))
+        if regressions:
+            print("%d regression(s): %s" % (len(regressions),
+                                            ", ".join(regressions)))
+            sys.exit(1)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## Borrows in the subtractions of the Dual Task.
+## ---------------------------------------------------------------- ##
+## What makes a subtraction hard is how many of its columns need a
+## borrow, and where they are. Numbers are handled as arrays of
+## digits of shape (..., 10), the leading digit first, so millions of
+## pairs are processed at once; only the ten columns are looped over.
+##
+## A column "borrows" when, after lending to the column at its right,
+## its top digit is smaller than the bottom one, and so it has to
+## borrow from the column at its left.
+## ---------------------------------------------------------------- ##
+
+import argparse
+import numpy as np
+
+import dual
+
+
+NUMBER_LENGTH = 10
+
+
+def Digits(numbers):
+    """Converts numbers (strings, bytes or integers) into a digit array"""
+    numbers = np.asarray(numbers)
+    if numbers.dtype.kind == "U":
+        numbers = numbers.astype("S%d" % NUMBER_LENGTH)
+    if numbers.dtype.kind == "S":
+        numbers = numbers.astype("S%d" % NUMBER_LENGTH)
+        digits = numbers.view(np.uint8).reshape(numbers.shape + (NUMBER_LENGTH,))
+        return digits - np.uint8(ord("0"))
+    powers = 10 ** np.arange(NUMBER_LENGTH - 1, -1, -1, dtype=np.int64)
+    return ((numbers.astype(np.int64)[..., None] // powers) % 10).astype(np.uint8)
+
+
+def Numbers(digits):
+    """Converts a digit array back into fixed-width byte strings"""
+    digits = np.ascontiguousarray(digits, dtype=np.uint8) + np.uint8(ord("0"))
+    return digits.view("S%d" % NUMBER_LENGTH)[..., 0]
+
+
+def Borrows(top, bottom):
+    """Subtracts BOTTOM from TOP, two digit arrays of the same shape.
+    Returns the borrow vectors (a boolean array, True in the columns
+    that borrow) and the digits of the answer.
+    """
+    top = top.astype(np.int8)
+    bottom = bottom.astype(np.int8)
+    borrow = np.zeros(top.shape, dtype=bool)
+    answer = np.empty(top.shape, dtype=np.uint8)
+    lent = np.zeros(top.shape[:-1], dtype=np.int8)
+    for i in range(NUMBER_LENGTH - 1, -1, -1):
+        d = top[..., i] - lent - bottom[..., i]
+        b = d < 0
+        borrow[..., i] = b
+        answer[..., i] = d + 10 * b
+        lent = b.astype(np.int8)
+    return borrow, answer
+
+
+def BorrowCounts(top, bottom):
+    """The number of borrows of every subtraction"""
+    return Borrows(top, bottom)[0].sum(axis=-1)
+
+
+def Profiles(rng, counts):
+    """Returns borrow vectors with the given number of borrows, placed
+    at random in any column but the leading one.
+    """
+    counts = np.asarray(counts)
+    if (counts < 0).any() or (counts >= NUMBER_LENGTH).any():
+        raise Exception("Borrow counts must be between 0 and %d"
+                        % (NUMBER_LENGTH - 1))
+    keys = rng.random(counts.shape + (NUMBER_LENGTH - 1,))
+    ranks = keys.argsort(axis=-1).argsort(axis=-1)
+    borrow = np.zeros(counts.shape + (NUMBER_LENGTH,), dtype=bool)
+    borrow[..., 1:] = ranks < counts[..., None]
+    return borrow
+
+
+def Uniform(rng, low, high):
+    """Draws integers in [LOW, HIGH), both arrays; much faster than
+    rng.integers with array bounds.
+    """
+    span = np.asarray(high - low)
+    return low + (rng.random(span.shape) * span).astype(np.int64)
+
+
+def Construct(rng, borrow):
+    """Builds subtractions whose borrow vectors are exactly BORROW.
+
+    Columns are filled from the right, each one knowing whether it
+    lends to the one at its right; the digits are drawn uniformly
+    among those that give the wanted borrow, so nothing is rejected.
+    The leading column never borrows, and both numbers keep ten
+    digits. Returns the top and bottom digit arrays.
+    """
+    borrow = np.asarray(borrow, dtype=bool)
+    if borrow[..., 0].any():
+        raise Exception("The leading column cannot borrow")
+    shape = borrow.shape[:-1]
+    top = np.empty(borrow.shape, dtype=np.uint8)
+    bottom = np.empty(borrow.shape, dtype=np.uint8)
+    lent = np.zeros(shape, dtype=np.int64)
+    for i in range(NUMBER_LENGTH - 1, -1, -1):
+        b = borrow[..., i]
+        if i == 0:
+            # 1 <= bottom <= top - lent
+            t = Uniform(rng, 2 + lent, 10)
+            u = Uniform(rng, 1, t - lent + 1)
+        else:
+            # Borrowing: top - lent < bottom <= 9
+            # Otherwise: 0 <= bottom <= top - lent
+            t = np.where(b, Uniform(rng, 0, 9 + lent), Uniform(rng, lent, 10))
+            low = np.where(b, t - lent + 1, 0)
+            high = np.where(b, 10, t - lent + 1)
+            u = Uniform(rng, low, high)
+        top[..., i] = t
+        bottom[..., i] = u
+        lent = b.astype(np.int64)
+    return top, bottom
+
+
+def Audit(fname):
+    """Prints the borrow counts of the subtractions in a trial file"""
+    trials = dual.OpenTrials(fname)
+    if not hasattr(trials, "__getitem__"):
+        trials = list(trials)       # Streamed from the YAML
+    cond = np.array([s.condition for t, s in trials])
+    top = Digits([s.number1 for t, s in trials])
+    bottom = Digits([s.number2 for t, s in trials])
+    borrow, answer = Borrows(top, bottom)
+    counts = borrow.sum(axis=-1)
+    for name in dual.CONDITION_CODES:
+        mask = cond == name
+        if mask.any():
+            c = counts[mask]
+            print("%-5s %3d trials, borrows: min %d, mean %.2f, max %d" %
+                  (name, mask.sum(), c.min(), c.mean(), c.max()))
+    for k in np.flatnonzero((cond == "easy") & (counts > 0)):
+        print("Easy trial %d has %d borrows: %s - %s" %
+              (k, counts[k], trials[k][1].number1, trials[k][1].number2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Audits the borrows of trial files")
+    parser.add_argument("trials", nargs="+")
+    args = parser.parse_args()
+    for fname in args.trials:
+        print(fname)
+        Audit(fname)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## Scripted participants for server.py.
+## ---------------------------------------------------------------- ##
+## Every participant opens its own connection, and answers what the
+## server shows after a random delay, making mistakes now and then.
+## Many participants run at once in a single event loop.
+## ---------------------------------------------------------------- ##
+
+import json
+import random
+import asyncio
+import argparse
+
+import server as dualserver
+
+
+class ScriptedParticipant():
+    """Plays a whole session against the server"""
+    def __init__(self, participant, rt=0.5, error=0.05, trials=None,
+                 seed=None):
+        self.participant = participant
+        self.rt = rt
+        self.error = error
+        self.trials = trials
+        self.random = random.Random(seed)
+        self.keys = 0
+        self.errors = 0
+        self.points = None
+
+    @staticmethod
+    def CorrectKey(state):
+        """The key that answers a state message correctly"""
+        i = state["index"]
+        if state["task"] == "typing":
+            return state["word"][i]
+        else:
+            solution = int(state["number1"]) - int(state["number2"])
+            return ("%.10d" % solution)[i]
+
+    def Choose(self, state):
+        key = self.CorrectKey(state)
+        if self.random.random() < self.error:
+            keys = "0123456789" if key.isdigit() else "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+            key = self.random.choice(keys.replace(key, ""))
+        return key
+
+    async def Run(self, host="127.0.0.1", port=dualserver.DEFAULT_PORT,
+                  path=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+
+        start = {"op" : "start", "participant" : self.participant}
+        if self.trials is not None:
+            start["trials"] = self.trials
+        writer.write((json.dumps(start) + "\n").encode())
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                msg = json.loads(line)
+                if msg["op"] == "state":
+                    await asyncio.sleep(self.random.expovariate(1.0 / self.rt))
+                    writer.write((json.dumps({"op" : "key",
+                                              "key" : self.Choose(msg)})
+                                  + "\n").encode())
+                    await writer.drain()
+                elif msg["op"] == "result":
+                    self.keys += 1
+                    self.errors += not msg["correct"]
+                elif msg["op"] == "finished":
+                    self.points = msg["points"]
+                    break
+                elif msg["op"] == "error":
+                    raise Exception("Server error: %s" % msg["message"])
+        finally:
+            writer.close()
+        return self
+
+
+async def RunAll(participants, **kwargs):
+    return await asyncio.gather(*[p.Run(**kwargs) for p in participants])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scripted Dual Task participants")
+    parser.add_argument("-n", type=int, default=1,
+                        help="Number of simultaneous participants")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=dualserver.DEFAULT_PORT)
+    parser.add_argument("--unix", default=None)
+    parser.add_argument("--trials", default=None,
+                        help="Name of a trial list in the server's --trialdir")
+    parser.add_argument("--rt", type=float, default=0.5,
+                        help="Mean time (s) between keystrokes")
+    parser.add_argument("--error", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    participants = [ScriptedParticipant("client%04d" % i, args.rt, args.error,
+                                        args.trials,
+                                        None if args.seed is None
+                                        else args.seed + i)
+                    for i in range(args.n)]
+    done = asyncio.run(RunAll(participants, host=args.host, port=args.port,
+                              path=args.unix))
+    for p in done:
+        print("%s: %d keys, %d errors, %s points" %
+              (p.participant, p.keys, p.errors, p.points))
@@ -4,32 +4,419 @@
 ## A Python versio of the Dual Task paradigm by Jelmer Borst.
 ## ---------------------------------------------------------------- ##
 ## Goal is to keep all the code into a single file that can be run
-## as a script
+## as a script. The wx interface lives in dualgui.py and is only
+## imported when the experiment is run; everything here (trials,
+## task logic, logs) imports without wx, and without PyYAML until
+## a trial file is actually read.
 ## ---------------------------------------------------------------- ##
 
-import wx
 import types
-import string
 import time
-import yaml
 import sys
 import threading
-
-
-EASY = wx.NewId()
-HARD = wx.NewId()
+import os
+import struct
+import mmap
+import queue
+import atexit
+import array
+import heapq
+import functools
+import itertools
+import zlib
+
+
+EASY = 1
+HARD = 2
 EMPTY_STRING = ""
 
 CONDITIONS = {EASY : "easy", HARD : "hard",
               "easy" : EASY, "hard" : HARD}
 
+# Small integer codes used in the binary files
+CONDITION_CODES = ("easy", "hard")
+TASK_CODES = ("subtraction", "typing")
+
+
+## ---------------------------------------------------------------- ##
+## Timing
+## ---------------------------------------------------------------- ##
+## All the times are integer nanoseconds on a monotonic clock,
+## counted from the epoch of the session. They are only converted
+## to seconds when written to the logs.
+## ---------------------------------------------------------------- ##
+
+NS = 1000000000   # Nanoseconds in a second
+
+class SessionClock():
+    """A monotonic nanosecond clock with a single epoch"""
+    def __init__(self):
+        self.epoch = time.perf_counter_ns()
+        self.wall = time.time()     # Wall-clock time at the epoch
+
+    def Now(self):
+        """Nanoseconds since the epoch"""
+        return time.perf_counter_ns() - self.epoch
+
+    @staticmethod
+    def Seconds(ns):
+        """Converts nanoseconds into seconds"""
+        return ns / NS
+
+CLOCK = SessionClock()   # Used by everything that is not given a clock
+
+
+class VirtualClock(SessionClock):
+    """A clock that only moves when told to, e.g. to replay a session"""
+    def __init__(self, now = 0):
+        self.epoch = 0
+        self.wall = 0.0
+        self.now = now
+
+    def Now(self):
+        return self.now
+
+    def Set(self, now):
+        """Moves the clock forward to NOW (ns)"""
+        if now < self.now:
+            raise Exception("Virtual clock cannot go back from %d to %d"
+                            % (self.now, now))
+        self.now = now
+
+
+LATENCY_SAMPLES = 4096   # Keypresses remembered by a LatencyMonitor
+
+class LatencyMonitor():
+    """Measures the delay between a keypress and the relabeling of
+    the panels that it causes. Samples are kept in a preallocated
+    ring of integers, so measuring does not allocate.
+    """
+    def __init__(self, clock = CLOCK, size = LATENCY_SAMPLES):
+        self.clock = clock
+        self.samples = array.array("q", [0]) * size
+        self.count = 0
+        self.pending = None
+
+    def Press(self, tme):
+        """A key has been pressed at time TME"""
+        self.pending = tme
+
+    def Rendered(self):
+        """The panels have been relabeled after the last keypress"""
+        if self.pending is not None:
+            delay = self.clock.Now() - self.pending
+            self.samples[self.count % len(self.samples)] = delay
+            self.count += 1
+            self.pending = None
+
+    def Values(self):
+        """The remembered delays, in nanoseconds"""
+        return sorted(self.samples[:min(self.count, len(self.samples))])
+
+    def Summary(self):
+        """A one-line summary of the delays, in milliseconds"""
+        vals = self.Values()
+        if not vals:
+            return "Latency: no samples"
+        n = len(vals)
+        pct = lambda p: vals[min(n - 1, int(p * n))] / 1e6
+        return ("Latency (ms) over %d keypresses: mean %.3f, median %.3f, "
+                "95%% %.3f, 99%% %.3f, max %.3f" % (n,
+                                                    sum(vals) / n / 1e6,
+                                                    pct(0.5), pct(0.95),
+                                                    pct(0.99), vals[-1] / 1e6))
+
+
+## ---------------------------------------------------------------- ##
+## Tracing
+## ---------------------------------------------------------------- ##
+## Spans (calls of traced functions) and tracepoints are recorded by
+## the TRACER into preallocated arrays used as a ring buffer, so that
+## recording never allocates nor blocks. When tracing is off, a
+## traced function only checks TRACER.enabled, and a tracepoint is
+## skipped by its 'if TRACER.enabled' guard.
+## ---------------------------------------------------------------- ##
+
+TRACE_SIZE = 65536   # Records kept; older ones are overwritten
+TRACE_POINT = -1     # End time of the records of tracepoints
+
+class Tracer():
+    """Records spans and tracepoints, and reports on them"""
+    def __init__(self, size = TRACE_SIZE, clock = CLOCK):
+        self.clock = clock
+        self.size = size
+        self.enabled = False
+        self.starts = None      # Allocated when first enabled
+        self.counter = itertools.count()   # next() is atomic
+        self.last = -1                     # Last record written
+        self.labels = []                   # Names of the ids
+        self.ids = {}
+
+    def Enable(self, status = True):
+        if status and self.starts is None:
+            size = self.size
+            self.starts = array.array("q", [0]) * size
+            self.ends = array.array("q", [0]) * size
+            self.names = array.array("i", [0]) * size
+            self.threads = array.array("q", [0]) * size
+            self.args = [None] * size
+        self.enabled = status
+
+    def Id(self, name):
+        """The integer id of a span or tracepoint name"""
+        if name not in self.ids:
+            self.ids[name] = len(self.labels)
+            self.labels.append(name)
+        return self.ids[name]
+
+    def Record(self, name, start, end, args = None):
+        """Records a span (or, if END is TRACE_POINT, a tracepoint)"""
+        n = next(self.counter)
+        i = n % self.size
+        self.starts[i] = start
+        self.ends[i] = end
+        self.names[i] = name
+        self.threads[i] = threading.get_ident()
+        self.args[i] = args
+        self.last = max(self.last, n)
+
+    def Point(self, name, *args):
+        """Records a tracepoint with its arguments"""
+        self.Record(self.Id(name), self.clock.Now(), TRACE_POINT, args)
+
+    def Records(self):
+        """Returns the records still in the buffer, oldest first, as
+        (name, start, end, thread, args) tuples
+        """
+        count = self.last + 1
+        first = max(0, count - self.size)
+        return [(self.labels[self.names[j % self.size]],
+                 self.starts[j % self.size],
+                 self.ends[j % self.size],
+                 self.threads[j % self.size],
+                 self.args[j % self.size])
+                for j in range(first, count)]
+
+    def Histograms(self):
+        """Returns the sorted durations (ns) of the spans, by name"""
+        hist = {}
+        for name, start, end, thread, args in self.Records():
+            if end != TRACE_POINT:
+                hist.setdefault(name, []).append(end - start)
+        for name in hist:
+            hist[name].sort()
+        return hist
+
+    def Summary(self):
+        """One line per span name, with durations in microseconds"""
+        lines = []
+        for name, vals in sorted(self.Histograms().items()):
+            n = len(vals)
+            lines.append("%-32s %7d calls, mean %9.1f, median %9.1f, "
+                         "99%% %9.1f, max %9.1f" %
+                         (name, n, sum(vals) / n / 1e3, vals[n // 2] / 1e3,
+                          vals[min(n - 1, int(0.99 * n))] / 1e3,
+                          vals[-1] / 1e3))
+        return "\n".join(lines)
+
+    def WriteChromeTrace(self, fname):
+        """Writes the records in the Chrome trace event format"""
+        events = []
+        tids = {}
+        for name, start, end, thread, args in self.Records():
+            event = {"name" : name,
+                     "pid" : os.getpid(),
+                     "tid" : tids.setdefault(thread, len(tids)),
+                     "ts" : start / 1e3}
+            if end == TRACE_POINT:
+                event["ph"] = "i"
+                event["s"] = "t"
+            else:
+                event["ph"] = "X"
+                event["dur"] = (end - start) / 1e3
+            if args:
+                event["args"] = {"args" : ["%s" % a for a in args]}
+            events.append(event)
+        import json
+        with open(fname, "w") as out:
+            json.dump({"traceEvents" : events, "displayTimeUnit" : "ms"}, out)
+
+TRACER = Tracer()
+if os.environ.get("DUAL_TRACE"):
+    TRACER.Enable()
+
+
+def Traced(name):
+    """Decorates a function so that its calls are recorded as spans"""
+    def decorate(func):
+        tid = TRACER.Id(name)
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            start = TRACER.clock.Now()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                TRACER.Record(tid, start, TRACER.clock.Now())
+        return traced
+    return decorate
+
+
+class ScheduledJob():
+    """A function that a Scheduler calls once, or every PERIOD ns"""
+    def __init__(self, func, deadline, period = None):
+        self.func = func
+        self.deadline = deadline    # Next time (ns) the job is due
+        self.period = period        # None for one-shot jobs
+        self.cancelled = False
+        self.error = None
+        # Jitter statistics: how late (ns) the calls have been
+        self.calls = 0
+        self.late_total = 0
+        self.late_max = 0
+
+    def Cancel(self):
+        """The job will not be called anymore"""
+        self.cancelled = True
+
+    def Jitter(self):
+        """Returns the mean and max lateness of the calls, in ns"""
+        if self.calls == 0:
+            return (0, 0)
+        return (self.late_total / self.calls, self.late_max)
+
+
+class Scheduler():
+    """Runs all the periodic and delayed work of a session.
+
+    Jobs are kept in a heap ordered by absolute deadline, and a
+    periodic job's next deadline is its previous deadline plus its
+    period, so the time spent handling a tick never accumulates into
+    drift. The scheduler can run on its own thread (Start/Stop), or
+    be advanced by hand with RunUntil, e.g. under a virtual clock.
+    """
+    def __init__(self, clock = CLOCK):
+        self.clock = clock
+        self.jobs = []
+        self.counter = 0            # Breaks ties between equal deadlines
+        self.condition = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    def Add(self, job):
+        """Adds a job and wakes up the scheduler thread"""
+        with self.condition:
+            heapq.heappush(self.jobs, (job.deadline, self.counter, job))
+            self.counter += 1
+            self.condition.notify()
+        return job
+
+    def After(self, delay, func):
+        """Calls FUNC once, DELAY seconds from now"""
+        return self.Add(ScheduledJob(func, self.clock.Now() + int(delay * NS)))
+
+    def Every(self, period, func):
+        """Calls FUNC every PERIOD seconds, starting one period from now"""
+        period = int(period * NS)
+        return self.Add(ScheduledJob(func, self.clock.Now() + period, period))
+
+    def Cancel(self, job):
+        with self.condition:
+            job.Cancel()
+            self.condition.notify()
+
+    def NextDeadline(self):
+        """The deadline of the first job still to run, or None"""
+        with self.condition:
+            while self.jobs and self.jobs[0][2].cancelled:
+                heapq.heappop(self.jobs)
+            if self.jobs:
+                return self.jobs[0][0]
+            return None
+
+    def RunUntil(self, now):
+        """Calls, in order, all the jobs due at or before NOW"""
+        while True:
+            with self.condition:
+                if not self.jobs or self.jobs[0][0] > now:
+                    return
+                deadline, n, job = heapq.heappop(self.jobs)
+                if job.cancelled:
+                    continue
+            self.Call(job, deadline, self.clock.Now())
+
+    def Call(self, job, deadline, now):
+        """Calls a job that was due at DEADLINE, and re-arms it"""
+        late = max(0, now - deadline)
+        job.calls += 1
+        job.late_total += late
+        job.late_max = max(job.late_max, late)
+        try:
+            job.func()
+        except Exception as exc:
+            # E.g. a window that does not exist anymore
+            job.error = exc
+            job.Cancel()
+
+        if job.period is not None and not job.cancelled:
+            job.deadline = deadline + job.period
+            self.Add(job)
+
+    def Run(self):
+        """The body of the scheduler thread"""
+        while self.running:
+            with self.condition:
+                deadline = None
+                while self.jobs and self.jobs[0][2].cancelled:
+                    heapq.heappop(self.jobs)
+                if self.jobs:
+                    deadline = self.jobs[0][0]
+                now = self.clock.Now()
+                if deadline is None or deadline > now:
+                    timeout = None
+                    if deadline is not None:
+                        timeout = (deadline - now) / NS
+                    self.condition.wait(timeout)
+                    continue
+            self.RunUntil(self.clock.Now())
+
+    def Start(self):
+        """Starts running the jobs on a separate thread"""
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(group=None, target=self.Run,
+                                           name="Scheduler")
+            self.thread.daemon = True
+            self.thread.start()
+
+    def Stop(self):
+        """Stops the scheduler thread, without waiting for any deadline"""
+        if self.thread is not None:
+            with self.condition:
+                self.running = False
+                self.condition.notify()
+            if self.thread is not threading.current_thread():
+                self.thread.join()
+            self.thread = None
+
+
 class Trial:
-    """An abstract representation of a trial"""
+    """An abstract representation of a trial.
+
+    Trials use __slots__, since a session may hold a great many of
+    them, and compute their expected responses (the 'answer') once,
+    when their content is set.
+    """
+    __slots__ = ("condition",)
+
     def __init__(self, condition):
         self.condition = condition
 
 class TypingTrial(Trial):
     """A typing task trial"""
+    __slots__ = ("_word", "answer")
+
     def __init__(self, condition = "easy", word = EMPTY_STRING * 10):
         super(TypingTrial, self).__init__(condition)
         self.word = word
@@ -45,7 +432,8 @@ class TypingTrial(Trial):
         
         w = val.strip()
         if len(w) == 10:
-            self._word = val.strip()
+            self._word = w
+            self.answer = w.upper()     # The keys to press, in order
         else:
             raise Exception("Wrong length for word '%s': %d" % (w, len(w)))
 
@@ -60,9 +448,11 @@ class TypingTrial(Trial):
 
 class SubtractionTrial(Trial):
     """A subtractiokn task trial"""
+    __slots__ = ("_number1", "_number2", "answer")
+
     def __init__(self, condition, number1, number2):
         super(SubtractionTrial, self).__init__(condition)
-        self.number1 = number1
+        self._number1 = self.chknum(number1)
         self.number2 = number2
 
     @staticmethod
@@ -90,6 +480,7 @@ class SubtractionTrial(Trial):
     @number1.setter
     def number1(self, val):
         self._number1 = self.chknum(val)
+        self.Solve()
 
     @property
     def number2(self):
@@ -98,7 +489,11 @@ class SubtractionTrial(Trial):
     @number2.setter
     def number2(self, val):
         self._number2 = self.chknum(val)
+        self.Solve()
 
+    def Solve(self):
+        """Computes the digits of the solution (the 'answer')"""
+        self.answer = "%.10d" % (int(self._number1) - int(self._number2))
 
     def __repr__(self):
         return "<subtraction: %s - %s (%s, %d)>" % (self.number1,
@@ -111,14 +506,168 @@ class SubtractionTrial(Trial):
 
         
         
+## ---------------------------------------------------------------- ##
+## Binary response logs
+## ---------------------------------------------------------------- ##
+## A columnar, append-only version of the response log. The file
+## starts with a 16-byte header, followed by chunks. Each chunk has
+## an 8-byte header (b"CHNK" and the number of rows N) and then the
+## columns one after the other, little-endian:
+##
+##    time (f8 * N), rt (f8 * N), index (i4 * N), task (u1 * N),
+##    condition (u1 * N), response (S1 * N), correct (u1 * N)
+##
+## padded to a multiple of 8 bytes. Task and condition are indices
+## in TASK_CODES and CONDITION_CODES (255 if unknown).
+## ---------------------------------------------------------------- ##
+
+BINLOG_MAGIC = b"DUALLOG1"
+BINLOG_HEADER = struct.Struct("<8sI4x")     # Magic, version
+BINLOG_VERSION = 1
+BINLOG_SUFFIX = ".bin"                      # Added to the text log's name
+BINLOG_CHUNK = struct.Struct("<4sI")        # b"CHNK", number of rows
+BINLOG_COLUMNS = (("time", "<f8"), ("rt", "<f8"), ("index", "<i4"),
+                  ("task", "u1"), ("condition", "u1"),
+                  ("response", "S1"), ("correct", "u1"))
+UNKNOWN_CODE = 255
+
+
+def Code(codes, val):
+    """Returns the index of VAL in CODES, or UNKNOWN_CODE"""
+    if val in codes:
+        return codes.index(val)
+    return UNKNOWN_CODE
+
+
+def ChunkSize(n):
+    """Size in bytes of a binary log chunk of N rows"""
+    return BINLOG_CHUNK.size + 25 * n + (-(4 * n) % 8)
+
+
+class BinaryLog():
+    """Appends response rows to a columnar binary log"""
+    def __init__(self, pname):
+        self.log = open(pname, "ab")
+        if self.log.tell() == 0:
+            self.log.write(BINLOG_HEADER.pack(BINLOG_MAGIC, BINLOG_VERSION))
+            self.log.flush()
+
+    def Write(self, rows):
+        """Writes ROWS as one chunk. Every row is in the format of
+        ResponseEvent.LogRow: task, condition, response,
+        correct, time, rt, index.
+        """
+        if self.log is None or len(rows) == 0:
+            return
+        tme = array.array("d")
+        rt = array.array("d")
+        index = array.array("i")
+        task = bytearray()
+        condition = bytearray()
+        response = bytearray()
+        correct = bytearray()
+        for r in rows:
+            task.append(Code(TASK_CODES, r[0]))
+            condition.append(Code(CONDITION_CODES, r[1]))
+            response += ("%s" % r[2]).encode("ascii", "replace")[:1] or b" "
+            correct.append(1 if r[3] else 0)
+            tme.append(r[4])
+            rt.append(r[5])
+            index.append(r[6])
+
+        if sys.byteorder == "big":
+            tme.byteswap()
+            rt.byteswap()
+            index.byteswap()
+
+        n = len(rows)
+        chunk = b"".join([BINLOG_CHUNK.pack(b"CHNK", n),
+                          tme.tobytes(), rt.tobytes(), index.tobytes(),
+                          bytes(task), bytes(condition),
+                          bytes(response), bytes(correct)])
+        self.log.write(chunk.ljust(ChunkSize(n), b"\0"))
+        self.log.flush()
+
+    def Close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+def ReadBinaryLog(pname):
+    """Memory-maps a binary log and returns a dict of NumPy columns.
+
+    A chunk that was cut short (e.g. by a crash) is ignored.
+    """
+    import numpy as np
+    with open(pname, "rb") as stream:
+        data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version = BINLOG_HEADER.unpack_from(data, 0)
+    if magic != BINLOG_MAGIC or version != BINLOG_VERSION:
+        raise Exception("Not a binary log: '%s'" % pname)
+
+    parts = dict((name, []) for name, dtype in BINLOG_COLUMNS)
+    offset = BINLOG_HEADER.size
+    while offset + BINLOG_CHUNK.size <= len(data):
+        magic, n = BINLOG_CHUNK.unpack_from(data, offset)
+        size = ChunkSize(n)
+        if magic != b"CHNK" or offset + size > len(data):
+            break
+        pos = offset + BINLOG_CHUNK.size
+        for name, dtype in BINLOG_COLUMNS:
+            col = np.frombuffer(data, dtype=dtype, count=n, offset=pos)
+            parts[name].append(col)
+            pos += col.nbytes
+        offset += size
+
+    columns = {}
+    for name, dtype in BINLOG_COLUMNS:
+        if len(parts[name]) == 1:
+            columns[name] = parts[name][0]
+        else:
+            columns[name] = np.concatenate(parts[name] or
+                                           [np.empty(0, dtype=dtype)])
+    columns["correct"] = columns["correct"].view(np.bool_)
+    return columns
+
+
+LOG_BATCH = 256       # Rows written at once by the background writer
+LOG_INTERVAL = 0.5     # Longest time (s) a row waits before being written
+LOG_QUEUE_SIZE = 10000 # Rows that can be waiting for the writer
+
 class Logger():
-    """Logs responses onto a file"""
-    def __init__(self, pname=None):
+    """Logs responses onto a file.
+
+    In background mode, rows are handed to a bounded queue and written
+    in batches by a separate thread, so that a slow disk never stalls
+    the thread that logs them. The queue is always drained on Close(),
+    which is also called when the interpreter exits.
+    """
+    def __init__(self, pname=None, background=False, batch=LOG_BATCH,
+                 interval=LOG_INTERVAL, maxsize=LOG_QUEUE_SIZE, binary=None,
+                 append=False):
         self.log = None
+        self.binary = None
+        self.queue = None
+        self.thread = None
+        self.error = None
+        self.batch = batch
+        self.interval = interval
         if pname is not None:
-            self.log = open(pname, "w")
+            self.log = open(pname, "a" if append else "w")
+            if binary is not None:
+                self.binary = BinaryLog(binary)
 
         self.stddata = []
+
+        if background and self.log is not None:
+            self.queue = queue.Queue(maxsize)
+            self.thread = threading.Thread(group=None, target=self.Run,
+                                           name="Logger")
+            self.thread.daemon = True
+            self.thread.start()
+            atexit.register(self.Close)
     
     @property
     def stddata(self):
@@ -131,47 +680,1226 @@ class Logger():
         if type(val) == list:
             self._stddata = val
         else:
-            self._stdata = [val]
+            self._stddata = [val]
+
+    @staticmethod
+    def FormatRow(row):
+        """Returns a row as a line of tab-separated values"""
+        return "\t".join(["%s" % j for j in row]) + "\n"
             
     def LogData(self, data):
         """logs a standard row of data in file"""
-        row = self.stddata + data 
         if self.log is not None:
-            for j in row[-1]:
-                self.log.write("%s\t" % j)
-            self.log.write("%s\n" % j)
+            if self.queue is not None:
+                if self.error is not None:
+                    raise Exception("Logger cannot write: %s" % self.error)
+                self.queue.put((self.stddata, data))
+            else:
+                self.WriteRows([(self.stddata, data)])
+                if self.error is not None:
+                    raise self.error
+
+    def WriteRows(self, rows):
+        """Writes a batch of (stddata, data) rows with a single write
+        and flush. The binary log, if any, only gets the data.
+        """
+        try:
+            self.log.write("".join([self.FormatRow(std + data)
+                                    for std, data in rows]))
             self.log.flush()
+            if self.binary is not None:
+                self.binary.Write([data for std, data in rows])
+        except (IOError, OSError) as exc:
+            self.error = exc
 
-            
-class ResponseEvent():
+    def Run(self):
+        """Writes the queued rows, until a None row is found"""
+        pending = []
+        deadline = None
+        done = False
+        while not done:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic())
+            try:
+                row = self.queue.get(timeout=timeout)
+                if row is None:
+                    done = True
+                else:
+                    if not pending:
+                        deadline = time.monotonic() + self.interval
+                    pending.append(row)
+            except queue.Empty:
+                pass
+
+            if pending and (done or
+                            len(pending) >= self.batch or
+                            time.monotonic() >= deadline):
+                self.WriteRows(pending)
+                pending = []
+                deadline = None
+
+    def Close(self):
+        """Writes all the pending rows and closes the file"""
+        if self.thread is not None:
+            if self.thread.is_alive():
+                self.queue.put(None)
+                self.thread.join()
+            self.thread = None
+            atexit.unregister(self.Close)
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        if self.binary is not None:
+            self.binary.Close()
+            self.binary = None
+
+
+## ---------------------------------------------------------------- ##
+## Raw input capture
+## ---------------------------------------------------------------- ##
+## Every low-level input event of the panels (mouse motion, buttons
+## and keys) is recorded by an InputCapture into preallocated
+## columns, used as a ring buffer: recording an event only stores
+## integers, and never allocates nor blocks. Whenever a block of
+## INPUT_BLOCK events is full, a background thread appends it to the
+## capture file, in the chunked format of the binary logs, with the
+## columns:
+##
+##    time (i8 * N, ns), x (i4 * N), y (i4 * N), code (i4 * N),
+##    kind (u1 * N), source (u1 * N)
+##
+## padded to a multiple of 8 bytes. Kind and source are indices in
+## INPUT_KINDS and INPUT_SOURCES; code is the key code of key events.
+## If the writer falls more than the whole ring behind, the events
+## that were overwritten are counted as lost.
+## ---------------------------------------------------------------- ##
+
+INPUT_MAGIC = b"DUALINP1"
+INPUT_VERSION = 1
+INPUT_SUFFIX = ".input"                     # Added to the text log's name
+INPUT_SIZE = 1 << 16                        # Events kept in the ring
+INPUT_BLOCK = 1 << 12                       # Events written at once
+INPUT_COLUMNS = (("time", "<i8"), ("x", "<i4"), ("y", "<i4"),
+                 ("code", "<i4"), ("kind", "u1"), ("source", "u1"))
+INPUT_KINDS = ("motion", "left_down", "left_up", "right_down", "right_up",
+               "key_down", "key_up", "enter", "leave")
+INPUT_SOURCES = ("frame", "typing", "subtraction", "points")
+
+
+def InputChunkSize(n):
+    """Size in bytes of a capture chunk of N events"""
+    return BINLOG_CHUNK.size + 22 * n + (-(22 * n) % 8)
+
+
+class InputCapture():
+    """Records input events into a ring buffer that spills to disk.
+
+    Events are recorded by a single thread (the UI thread). Without a
+    file name, only the last SIZE events are kept, in memory.
+    """
+    def __init__(self, pname=None, size=INPUT_SIZE, block=INPUT_BLOCK,
+                 clock=CLOCK):
+        if size % block != 0 or size < 2 * block:
+            raise Exception("Capture size %d is not a multiple of two or "
+                            "more blocks of %d" % (size, block))
+        self.clock = clock
+        self.size = size
+        self.block = block
+        self.times = array.array("q", [0]) * size
+        self.xs = array.array("i", [0]) * size
+        self.ys = array.array("i", [0]) * size
+        self.codes = array.array("i", [0]) * size
+        self.kinds = bytearray(size)
+        self.sources = bytearray(size)
+        self.count = 0          # Events recorded
+        self.written = 0        # Events written (or lost)
+        self.lost = 0
+        self.error = None
+        self.file = None
+        self.thread = None
+        self.closing = False
+        self.ready = threading.Event()
+        if pname is not None:
+            self.file = open(pname, "ab")
+            if self.file.tell() == 0:
+                self.file.write(BINLOG_HEADER.pack(INPUT_MAGIC, INPUT_VERSION))
+                self.file.flush()
+            self.thread = threading.Thread(group=None, target=self.Run,
+                                           name="InputCapture")
+            self.thread.daemon = True
+            self.thread.start()
+            atexit.register(self.Close)
+
+    def Record(self, kind, source, x, y, code=0, tme=None):
+        """Records an event of KIND (an index in INPUT_KINDS) from
+        SOURCE (an index in INPUT_SOURCES), at position X, Y
+        """
+        n = self.count
+        i = n % self.size
+        self.times[i] = self.clock.Now() if tme is None else tme
+        self.xs[i] = x
+        self.ys[i] = y
+        self.codes[i] = code
+        self.kinds[i] = kind
+        self.sources[i] = source
+        self.count = n + 1
+        if (n + 1) % self.block == 0 and self.thread is not None:
+            self.ready.set()
+
+    def Chunk(self, first, n):
+        """The events FIRST to FIRST + N (in one turn of the ring) as
+        the bytes of a chunk
+        """
+        i = first % self.size
+        cols = [self.times[i:i + n], self.xs[i:i + n], self.ys[i:i + n],
+                self.codes[i:i + n]]
+        if sys.byteorder == "big":
+            for col in cols:
+                col.byteswap()
+        chunk = b"".join([BINLOG_CHUNK.pack(b"CHNK", n)] +
+                         [col.tobytes() for col in cols] +
+                         [bytes(self.kinds[i:i + n]),
+                          bytes(self.sources[i:i + n])])
+        return chunk.ljust(InputChunkSize(n), b"\0")
+
+    def Spill(self, final=False):
+        """Writes the full blocks (and, if FINAL, the rest) to disk"""
+        while True:
+            n = min(self.block, self.count - self.written)
+            if n == 0 or (n < self.block and not final):
+                return
+            chunk = self.Chunk(self.written, n)
+            # The recorder may have gone around the ring while copying
+            if self.count - self.written > self.size:
+                self.lost += n
+            else:
+                try:
+                    self.file.write(chunk)
+                except (IOError, OSError) as exc:
+                    self.error = exc
+                    self.lost += n
+            self.written += n
+
+    def Run(self):
+        """Writes the blocks as they fill up, until closed"""
+        while not self.closing:
+            self.ready.wait()
+            self.ready.clear()
+            self.Spill()
+            self.file.flush()
+
+    def Close(self):
+        """Writes all the events still in the ring and closes the file"""
+        if self.thread is not None:
+            self.closing = True
+            self.ready.set()
+            self.thread.join()
+            self.thread = None
+            atexit.unregister(self.Close)
+        if self.file is not None:
+            self.Spill(final=True)
+            self.file.close()
+            self.file = None
+
+    def Summary(self):
+        return ("Input: %d events, %d written, %d lost" %
+                (self.count, self.written - self.lost, self.lost))
+
+
+def ReadInputCapture(pname):
+    """Memory-maps a capture file and returns a dict of NumPy columns.
+
+    A chunk that was cut short (e.g. by a crash) is ignored.
+    """
+    import numpy as np
+    with open(pname, "rb") as stream:
+        data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version = BINLOG_HEADER.unpack_from(data, 0)
+    if magic != INPUT_MAGIC or version != INPUT_VERSION:
+        raise Exception("Not an input capture: '%s'" % pname)
+
+    parts = dict((name, []) for name, dtype in INPUT_COLUMNS)
+    offset = BINLOG_HEADER.size
+    while offset + BINLOG_CHUNK.size <= len(data):
+        magic, n = BINLOG_CHUNK.unpack_from(data, offset)
+        size = InputChunkSize(n)
+        if magic != b"CHNK" or offset + size > len(data):
+            break
+        pos = offset + BINLOG_CHUNK.size
+        for name, dtype in INPUT_COLUMNS:
+            col = np.frombuffer(data, dtype=dtype, count=n, offset=pos)
+            parts[name].append(col)
+            pos += col.nbytes
+        offset += size
+
+    return dict((name, np.concatenate(parts[name] or
+                                      [np.empty(0, dtype=dtype)]))
+                for name, dtype in INPUT_COLUMNS)
+
+
+## ---------------------------------------------------------------- ##
+## External sample streams
+## ---------------------------------------------------------------- ##
+## A device (an eye tracker, physiology) is read by a process of its
+## own, which writes its samples into a SampleRing: a ring buffer in
+## shared memory, with a 64-byte header (magic, version, channels,
+## capacity, rate, closed flag and, at SAMPLE_COUNT_OFFSET, the
+## number of samples ever written), then the timestamps (i8 *
+## capacity) and the values (f4 * capacity * channels). Timestamps
+## are time.perf_counter_ns(), the monotonic clock that SessionClock
+## counts from, which is the same for all the processes.
+##
+## There is a single writer. It stores the samples first and the
+## count last; a reader copies the samples below the count, and then
+## drops those that the writer may have overwritten meanwhile.
+##
+## In the experiment, a SampleStream drains the ring on a thread of
+## its own, in bulk, as NumPy arrays. Every sample is tagged with the
+## trial and the active task at its time, from the marks that the
+## event bus gives it, and appended to a file in chunks of:
+##
+##    time (i8 * N, ns since the session epoch), trial (i4 * N),
+##    values (f4 * N * channels), task (u1 * N)
+##
+## padded to a multiple of 8 bytes. Task is an index in TASK_CODES
+## (UNKNOWN_CODE when no task is active); trial is -1 before the first.
+## ---------------------------------------------------------------- ##
+
+SAMPLE_MAGIC = b"DUALSMP1"
+SAMPLE_VERSION = 1
+SAMPLE_SUFFIX = ".samples"                  # Added to the text log's name
+SAMPLE_HEADER = struct.Struct("<8sIIIII")   # Magic, version, channels,
+                                            # capacity, rate, closed
+SAMPLE_COUNT_OFFSET = 32
+SAMPLE_DATA_OFFSET = 64
+SAMPLE_SECONDS = 4          # Seconds of samples kept in a ring
+SAMPLE_INTERVAL = 0.02      # Seconds between two drains of the ring
+SAMPLE_FILE_HEADER = struct.Struct("<8sII") # Magic, version, channels
+
+
+def SharedMemory(name=None, size=0):
+    """Creates (with a SIZE) or attaches to (with a NAME) a shared
+    memory segment, which only its creator will remove
+    """
+    from multiprocessing import shared_memory, resource_tracker
+    if name is None:
+        return shared_memory.SharedMemory(create=True, size=size)
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+class SampleRing():
+    """A ring of timestamped samples in shared memory"""
+    def __init__(self, shm, owner=False):
+        import numpy as np
+        self.shm = shm
+        self.owner = owner
+        magic, version, channels, capacity, rate, closed = \
+            SAMPLE_HEADER.unpack_from(shm.buf, 0)
+        if magic != SAMPLE_MAGIC or version != SAMPLE_VERSION:
+            raise Exception("Not a sample ring: '%s'" % shm.name)
+        self.channels = channels
+        self.capacity = capacity
+        self.rate = rate
+        self.times = np.ndarray((capacity,), dtype=np.int64, buffer=shm.buf,
+                                offset=SAMPLE_DATA_OFFSET)
+        self.values = np.ndarray((capacity, channels), dtype=np.float32,
+                                 buffer=shm.buf,
+                                 offset=SAMPLE_DATA_OFFSET + 8 * capacity)
+
+    @classmethod
+    def Create(cls, channels, rate, seconds=SAMPLE_SECONDS):
+        """A new, empty ring holding SECONDS of samples at RATE Hz"""
+        capacity = int(rate * seconds)
+        shm = SharedMemory(size=SAMPLE_DATA_OFFSET +
+                           capacity * (8 + 4 * channels))
+        SAMPLE_HEADER.pack_into(shm.buf, 0, SAMPLE_MAGIC, SAMPLE_VERSION,
+                                channels, capacity, rate, 0)
+        struct.pack_into("<q", shm.buf, SAMPLE_COUNT_OFFSET, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def Attach(cls, name):
+        """The ring created by another process"""
+        return cls(SharedMemory(name))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def count(self):
+        """Samples written since the ring was created"""
+        return struct.unpack_from("<q", self.shm.buf, SAMPLE_COUNT_OFFSET)[0]
+
+    @property
+    def closed(self):
+        return SAMPLE_HEADER.unpack_from(self.shm.buf, 0)[5] != 0
+
+    def Write(self, times, values):
+        """Appends samples: TIMES (n) in perf_counter_ns, and VALUES
+        (n, channels). Only one process may write.
+        """
+        count = self.count
+        n = len(times)
+        if n > self.capacity:
+            times, values = times[-self.capacity:], values[-self.capacity:]
+            count += n - self.capacity
+            n = self.capacity
+        i = count % self.capacity
+        first = min(n, self.capacity - i)
+        self.times[i:i + first] = times[:first]
+        self.values[i:i + first] = values[:first]
+        self.times[:n - first] = times[first:]
+        self.values[:n - first] = values[first:]
+        struct.pack_into("<q", self.shm.buf, SAMPLE_COUNT_OFFSET, count + n)
+
+    def Read(self, start):
+        """Copies the samples from number START on; returns the number
+        of the first one returned (later than START if some were
+        overwritten), their times and their values
+        """
+        import numpy as np
+        end = self.count
+        start = max(start, end - self.capacity)
+        index = np.arange(start, end) % self.capacity
+        times = self.times[index]
+        values = self.values[index]
+        # Those the writer overwrote while copying
+        skip = max(0, self.count - self.capacity - start)
+        return start + skip, times[skip:], values[skip:]
+
+    def Close(self):
+        """Detaches; the owner also tells the writer to stop, and
+        removes the ring
+        """
+        if self.shm is None:
+            return
+        self.times = self.values = None
+        if self.owner:
+            SAMPLE_HEADER.pack_into(self.shm.buf, 0, SAMPLE_MAGIC,
+                                    SAMPLE_VERSION, self.channels,
+                                    self.capacity, self.rate, 1)
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+
+class SampleStream():
+    """Takes in the samples of a SampleRing, on a thread of its own.
+
+    The samples are tagged with the trial and the task that was
+    active at their time, from the marks given to Mark() (or by the
+    events of a bus, with Follow()), and written to PNAME, if any.
+    """
+    def __init__(self, ring, pname=None, clock=CLOCK,
+                 interval=SAMPLE_INTERVAL):
+        self.ring = ring
+        self.clock = clock
+        self.interval = interval
+        self.next = ring.count      # Number of the next sample to read
+        self.received = 0
+        self.lost = 0
+        self.last = None            # Session time of the last sample
+        self.error = None
+        self.mark_times = array.array("q")
+        self.mark_trials = array.array("i")
+        self.mark_tasks = bytearray()
+        self.trial = -1
+        self.task = UNKNOWN_CODE
+        self.file = None
+        if pname is not None:
+            self.file = open(pname, "ab")
+            if self.file.tell() == 0:
+                self.file.write(SAMPLE_FILE_HEADER.pack(SAMPLE_MAGIC,
+                                                        SAMPLE_VERSION,
+                                                        ring.channels))
+                self.file.flush()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(group=None, target=self.Run,
+                                       name="SampleStream")
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.Close)
+
+    def Mark(self, tme, trial=None, task=None):
+        """From TME (ns) on, the trial is TRIAL and the active task is
+        TASK (a task name, or None), when given
+        """
+        if trial is not None:
+            self.trial = trial
+        if task is not None:
+            self.task = Code(TASK_CODES, task)
+        self.mark_times.append(tme)
+        self.mark_trials.append(self.trial)
+        self.mark_tasks.append(self.task)
+
+    def Follow(self, bus):
+        """Marks the trials and task switches published on BUS"""
+        bus.Subscribe(TrialStartEvent,
+                      lambda e: self.Mark(e.time, trial = e.number),
+                      name="samples")
+        bus.Subscribe(TrialEndEvent,
+                      lambda e: self.Mark(e.time, task = EMPTY_STRING),
+                      name="samples")
+        bus.Subscribe(TaskSwitchEvent,
+                      lambda e: self.Mark(e.time, task = e.task.task_name
+                                          if e.task is not None
+                                          else EMPTY_STRING),
+                      name="samples")
+
+    def Tag(self, times):
+        """The trial and task of samples at TIMES (session ns)"""
+        import numpy as np
+        n = len(self.mark_tasks)    # Marks are only ever appended
+        if n == 0:
+            return (np.full(len(times), -1, dtype=np.int32),
+                    np.full(len(times), UNKNOWN_CODE, dtype=np.uint8))
+        marks = np.frombuffer(self.mark_times[:n], dtype=np.int64)
+        trials = np.frombuffer(self.mark_trials[:n], dtype=np.int32)
+        tasks = np.frombuffer(bytes(self.mark_tasks[:n]), dtype=np.uint8)
+        which = np.searchsorted(marks, times, side="right") - 1
+        before = which < 0
+        which[before] = 0
+        return (np.where(before, -1, trials[which]).astype(np.int32),
+                np.where(before, UNKNOWN_CODE, tasks[which]).astype(np.uint8))
+
+    def Drain(self):
+        """Reads, tags and writes the samples that arrived"""
+        first, times, values = self.ring.Read(self.next)
+        self.lost += first - self.next
+        self.next = first + len(times)
+        if len(times) == 0:
+            return
+        self.received += len(times)
+        times = times - self.clock.epoch
+        self.last = int(times[-1])
+        trials, tasks = self.Tag(times)
+        if self.file is not None:
+            n = len(times)
+            chunk = b"".join([BINLOG_CHUNK.pack(b"CHNK", n),
+                              times.astype("<i8").tobytes(),
+                              trials.astype("<i4").tobytes(),
+                              values.astype("<f4").tobytes(),
+                              tasks.tobytes()])
+            try:
+                self.file.write(chunk.ljust(SampleChunkSize(n,
+                                                            self.ring.channels),
+                                            b"\0"))
+                self.file.flush()
+            except (IOError, OSError) as exc:
+                self.error = exc
+
+    def Run(self):
+        while not self.stop.wait(self.interval):
+            self.Drain()
+
+    def Close(self):
+        """Drains the ring one last time and closes the file"""
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join()
+            self.thread = None
+            atexit.unregister(self.Close)
+            self.Drain()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def Summary(self):
+        return ("Samples: %d received at %d Hz, %d lost" %
+                (self.received, self.ring.rate, self.lost))
+
+
+def SampleChunkSize(n, channels):
+    """Size in bytes of a sample chunk of N samples"""
+    size = BINLOG_CHUNK.size + (13 + 4 * channels) * n
+    return size + (-size % 8)
+
+
+def ReadSamples(pname):
+    """Memory-maps a sample file and returns a dict of NumPy columns
+    (values has one column per channel).
+
+    A chunk that was cut short (e.g. by a crash) is ignored.
+    """
+    import numpy as np
+    with open(pname, "rb") as stream:
+        data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, channels = SAMPLE_FILE_HEADER.unpack_from(data, 0)
+    if magic != SAMPLE_MAGIC or version != SAMPLE_VERSION:
+        raise Exception("Not a sample file: '%s'" % pname)
+
+    parts = {"time" : [], "trial" : [], "values" : [], "task" : []}
+    offset = SAMPLE_FILE_HEADER.size
+    while offset + BINLOG_CHUNK.size <= len(data):
+        magic, n = BINLOG_CHUNK.unpack_from(data, offset)
+        size = SampleChunkSize(n, channels)
+        if magic != b"CHNK" or offset + size > len(data):
+            break
+        pos = offset + BINLOG_CHUNK.size
+        for name, dtype, count in (("time", "<i8", n), ("trial", "<i4", n),
+                                   ("values", "<f4", n * channels),
+                                   ("task", "u1", n)):
+            col = np.frombuffer(data, dtype=dtype, count=count, offset=pos)
+            parts[name].append(col)
+            pos += col.nbytes
+        offset += size
+
+    columns = {}
+    for name, dtype in (("time", "<i8"), ("trial", "<i4"),
+                        ("values", "<f4"), ("task", "u1")):
+        columns[name] = np.concatenate(parts[name] or
+                                       [np.empty(0, dtype=dtype)])
+    columns["values"] = columns["values"].reshape(-1, channels)
+    return columns
+
+
+## ---------------------------------------------------------------- ##
+## Events
+## ---------------------------------------------------------------- ##
+## What happens in a session is published as typed events on an
+## EventBus. Every subscriber receives the events of one type (and
+## of its subclasses), either synchronously, on the thread that
+## publishes them (the UI thread, in the GUI), or through a bounded
+## queue emptied by a worker thread of its own. Publishing to a
+## queued subscriber never blocks: when its queue is full the event
+## is dropped and counted, so that a slow consumer cannot delay the
+## next stimulus.
+## ---------------------------------------------------------------- ##
+
+EVENT_QUEUE_SIZE = 10000   # Events that can be waiting for a subscriber
+
+class SessionEvent():
+    """Base class of the events published on an EventBus"""
+    __slots__ = ("time",)
+
+    def __init__(self, time=None):
+        if time is None:
+            time = CLOCK.Now()
+        self.time = time            # The time (ns) at which it happened
+
+
+class ResponseEvent(SessionEvent):
     """A Java-like event object that represents a subject's response"""
-    def __init__(self, source, response, time=time.time(), correct=None, index=0):
-        self.source = source        # The UI panel that generated it
-        self.time = time            # The time at which it was generated
+    __slots__ = ("source", "response", "correct", "index", "condition",
+                 "onset")
+
+    def __init__(self, source, response, time=None, correct=None, index=0,
+                 onset=None):
+        super(ResponseEvent, self).__init__(time)
+        self.source = source        # The task that generated it
         self.response = response    # The subject's response
         self.correct = correct      # What would have been the correct response
         self.index = index          # The index of the response
+        self.condition = source.condition  # As it was when responding
+        self.onset = onset          # When the stimulus was shown (ns)
 
     
     def IsCorrect(self):
         """Checks whether the given response is also the correct response"""
         return self.response == self.correct
-        
-class DualTaskPanel(wx.Panel):
-    """A Dual Task object"""
-    def __init__(self, parent, id, condition = EASY):
-        super(DualTaskPanel, self).__init__(parent=parent, id=id)
+
+    def LogRow(self, onset=None):
+        """Returns the row that the Logger saves for this response,
+        with the RT measured from ONSET (ns), or from the event's own
+        """
+        if onset is None:
+            onset = self.onset
+        if onset is None:
+            raise Exception("No onset for the RT of response '%s' of %s" %
+                            (self.response, self.source.task_name))
+        return [self.source.task_name,
+                CONDITIONS[self.condition],
+                self.response,
+                self.IsCorrect(),
+                SessionClock.Seconds(self.time),
+                SessionClock.Seconds(self.time - onset),
+                self.index]
+
+
+class TrialEvent(SessionEvent):
+    """Something happened to a trial; NUMBER counts them from 0"""
+    __slots__ = ("number", "trial")
+
+    def __init__(self, number, trial, time=None):
+        super(TrialEvent, self).__init__(time)
+        self.number = number
+        self.trial = trial          # The (typing, subtraction) pair
+
+
+class TrialStartEvent(TrialEvent):
+    """A trial is shown"""
+    __slots__ = ()
+
+
+class TrialEndEvent(TrialEvent):
+    """Both tasks of a trial have been answered"""
+    __slots__ = ()
+
+
+class PointChangeEvent(SessionEvent):
+    """The points of a participant changed by CHANGE"""
+    __slots__ = ("points", "change")
+
+    def __init__(self, points, change, time=None):
+        super(PointChangeEvent, self).__init__(time)
+        self.points = points
+        self.change = change
+
+
+class TaskSwitchEvent(SessionEvent):
+    """The response moved from the PREVIOUS task to TASK"""
+    __slots__ = ("previous", "task")
+
+    def __init__(self, previous, task, time=None):
+        super(TaskSwitchEvent, self).__init__(time)
+        self.previous = previous
+        self.task = task
+
+
+class Subscriber():
+    """A handler of the events of one type, called synchronously.
+    Keeps how many events it got, and how long (ns) it took.
+    """
+    queued = False
+
+    def __init__(self, kind, handler, name=None):
+        self.kind = kind
+        self.handler = handler
+        if name is None:
+            name = getattr(handler, "__name__", "%s" % handler)
+        self.name = name
+        self.delivered = 0
+        self.dropped = 0
+        self.busy = 0               # Total time spent in the handler
+        self.max_busy = 0
+
+    def Deliver(self, event):
+        start = time.perf_counter_ns()
+        try:
+            self.handler(event)
+        finally:
+            self.Done(time.perf_counter_ns() - start)
+
+    def Done(self, busy):
+        self.delivered += 1
+        self.busy += busy
+        if busy > self.max_busy:
+            self.max_busy = busy
+
+    def Close(self):
+        pass
+
+    def Summary(self):
+        """A one-line summary of the deliveries, in milliseconds"""
+        n = max(1, self.delivered)
+        return ("%-12s %-18s %6d events, handler mean %.3f max %.3f ms" %
+                (self.name, self.kind.__name__, self.delivered,
+                 self.busy / n / 1e6, self.max_busy / 1e6))
+
+
+class QueuedSubscriber(Subscriber):
+    """A handler called by a worker thread, through a bounded queue.
+
+    Besides the handler times, it measures its backpressure: the
+    depth of the queue (now and at most), the lag between publishing
+    an event and handling it, and the events dropped because the
+    queue was full. Errors of the handler are counted and kept, and
+    do not stop the worker.
+    """
+    queued = True
+
+    def __init__(self, kind, handler, name=None, maxsize=EVENT_QUEUE_SIZE):
+        super(QueuedSubscriber, self).__init__(kind, handler, name)
+        self.queue = queue.Queue(maxsize)
+        self.max_depth = 0
+        self.lag = 0                # Total time spent waiting in the queue
+        self.max_lag = 0
+        self.errors = 0
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(group=None, target=self.Run,
+                                       name="Subscriber %s" % self.name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def depth(self):
+        """Events waiting in the queue"""
+        return self.queue.qsize()
+
+    def Deliver(self, event):
+        """Queues an event, or drops it if the queue is full"""
+        if self.closed:
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait((event, time.perf_counter_ns()))
+        except queue.Full:
+            self.dropped += 1
+            return
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def Run(self):
+        """Handles the queued events, until a None one is found"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            event, published = item
+            start = time.perf_counter_ns()
+            lag = start - published
+            self.lag += lag
+            if lag > self.max_lag:
+                self.max_lag = lag
+            try:
+                self.handler(event)
+            except Exception as exc:
+                self.errors += 1
+                self.error = exc
+            self.Done(time.perf_counter_ns() - start)
+
+    def Close(self):
+        """Handles all the queued events and stops the worker"""
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+
+    def Summary(self):
+        n = max(1, self.delivered)
+        line = super(QueuedSubscriber, self).Summary()
+        line += (", lag mean %.3f max %.3f ms, depth max %d, dropped %d" %
+                 (self.lag / n / 1e6, self.max_lag / 1e6, self.max_depth,
+                  self.dropped))
+        if self.errors:
+            line += ", %d errors (%s)" % (self.errors, self.error)
+        return line
+
+
+class EventBus():
+    """Delivers published events to the subscribers of their type.
+
+    Queued subscribers get an event before the synchronous ones, so
+    that a synchronous handler that closes the bus (e.g. at the end
+    of the session) cannot make them miss it. Synchronous handlers
+    run on the publishing thread, and must be quick.
+    """
+    def __init__(self):
+        self.subscribers = []
+        self.routes = {}    # Event class -> (queued, synchronous) subscribers
+
+    def Subscribe(self, kind, handler, queued=False, name=None,
+                  maxsize=EVENT_QUEUE_SIZE):
+        """Calls HANDLER with every event of type KIND (a subclass of
+        SessionEvent; SessionEvent itself for all the events).
+        Returns the subscriber, which keeps the metrics.
+        """
+        if not (isinstance(kind, type) and issubclass(kind, SessionEvent)):
+            raise Exception("Not an event type: %s" % kind)
+        if queued:
+            sub = QueuedSubscriber(kind, handler, name, maxsize)
+        else:
+            sub = Subscriber(kind, handler, name)
+        self.subscribers.append(sub)
+        self.routes = {}
+        return sub
+
+    def Unsubscribe(self, sub):
+        if sub in self.subscribers:
+            self.subscribers.remove(sub)
+            self.routes = {}
+        sub.Close()
+
+    def Route(self, cls):
+        """The subscribers of the events of class CLS"""
+        subs = [s for s in self.subscribers if issubclass(cls, s.kind)]
+        route = (tuple([s for s in subs if s.queued]),
+                 tuple([s for s in subs if not s.queued]))
+        self.routes[cls] = route
+        return route
+
+    def Wants(self, cls):
+        """Whether anyone is subscribed to the events of class CLS"""
+        queued, sync = self.routes.get(cls) or self.Route(cls)
+        return bool(queued or sync)
+
+    @Traced("EventBus.Publish")
+    def Publish(self, event):
+        queued, sync = self.routes.get(event.__class__) or \
+            self.Route(event.__class__)
+        for sub in queued:
+            sub.Deliver(event)
+        for sub in sync:
+            sub.Deliver(event)
+
+    def Close(self):
+        """Stops the queued subscribers, once their events are handled"""
+        for sub in self.subscribers:
+            sub.Close()
+
+    def Summary(self):
+        """One line per subscriber"""
+        return "\n".join(["Events: " + s.Summary() for s in self.subscribers])
+
+
+## ---------------------------------------------------------------- ##
+## Session journal
+## ---------------------------------------------------------------- ##
+## The state of a session after every transition (start, response,
+## point decay, end, and the start of the point ticker) is appended
+## to a journal, as fixed 24-byte records after a 16-byte header:
+##
+##    kind (u1), active task (u1), typing index (i1), subtraction
+##    index (i1), trial (i4), points (i4), time (i8, ns), CRC-32 of
+##    the first 20 bytes (u4)
+##
+## Records are written, and fsync'ed, by a background thread, all
+## the ones of a JOURNAL_COMMIT window at once, so the UI thread never
+## waits for the disk. Since every record holds the whole state,
+## every JOURNAL_SNAPSHOT records the journal is compacted into a
+## new file with only the records of the last JOURNAL_KEEP seconds,
+## which replaces it atomically. The ticker records are kept too, so
+## that a replay (see replay.py) knows when the point decay ran.
+##
+## The log is written on a clock of its own, so at a crash it may
+## hold more or fewer rows than the journal counts responses. To
+## resume (ResumeState), the session goes back to the last state
+## whose responses are all in the log; the log is cut to that state,
+## its binary log rebuilt from it, and the journal cut to it too. The
+## session then restarts at that keystroke, without replaying
+## anything.
+## ---------------------------------------------------------------- ##
+
+JOURNAL_MAGIC = b"DUALJRN1"
+JOURNAL_VERSION = 1
+JOURNAL_SUFFIX = ".journal"                 # Added to the text log's name
+JOURNAL_RECORD = struct.Struct("<BBbbiiqI")
+JOURNAL_KINDS = ("start", "response", "decay", "finished", "ticker")
+(JOURNAL_START, JOURNAL_RESPONSE, JOURNAL_DECAY, JOURNAL_FINISHED,
+ JOURNAL_TICKER) = range(5)
+JOURNAL_COMMIT = 0.05       # Seconds of records committed together
+JOURNAL_SNAPSHOT = 4096     # Records after which the journal is compacted
+JOURNAL_KEEP = 10.0         # Seconds of records kept by a compaction
+TRIAL_RESPONSES = 20        # Responses in a trial, to both tasks
+
+
+class SessionState():
+    """Where a session is: enough to resume it"""
+    __slots__ = ("kind", "time", "trial", "typing", "subtraction", "active",
+                 "points")
+
+    def __init__(self, kind, time, trial, typing, subtraction, active, points):
+        self.kind = kind            # One of JOURNAL_KINDS
+        self.time = time            # Session time (ns)
+        self.trial = trial          # Number of the current trial
+        self.typing = typing        # Indices of the two tasks
+        self.subtraction = subtraction
+        self.active = active        # Index in TASK_CODES, or UNKNOWN_CODE
+        self.points = points
+
+    @property
+    def finished(self):
+        return self.kind == JOURNAL_FINISHED
+
+    @property
+    def responses(self):
+        """The number of responses given so far, i.e. of log rows"""
+        if self.finished:
+            return self.trial * TRIAL_RESPONSES
+        return self.trial * TRIAL_RESPONSES + self.typing + self.subtraction
+
+    def Pack(self):
+        data = JOURNAL_RECORD.pack(self.kind, self.active, self.typing,
+                                   self.subtraction, self.trial, self.points,
+                                   self.time, 0)
+        return data[:-4] + struct.pack("<I", zlib.crc32(data[:-4]))
+
+    @classmethod
+    def Unpack(cls, data):
+        """The state of a record, or None if it is corrupt"""
+        kind, active, typing, subtraction, trial, points, tme, crc = \
+            JOURNAL_RECORD.unpack(data)
+        if crc != zlib.crc32(data[:-4]) or kind >= len(JOURNAL_KINDS):
+            return None
+        return cls(kind, tme, trial, typing, subtraction, active, points)
+
+    def __repr__(self):
+        return ("SessionState(%s, trial %d, typing %d, subtraction %d, "
+                "active %d, points %d, at %d ns)" %
+                (JOURNAL_KINDS[self.kind], self.trial, self.typing,
+                 self.subtraction, self.active, self.points, self.time))
+
+
+def WriteJournalFile(pname, records):
+    """Writes a whole journal and syncs it to disk"""
+    with open(pname, "wb") as out:
+        out.write(BINLOG_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION))
+        out.write(b"".join(records))
+        out.flush()
+        os.fsync(out.fileno())
+
+
+def SyncDirectory(pname):
+    """Syncs the directory of PNAME, so that a rename in it is durable"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(pname)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class SessionJournal():
+    """Appends session states to a journal, with group commits"""
+    def __init__(self, pname, interval = JOURNAL_COMMIT,
+                 snapshot = JOURNAL_SNAPSHOT, keep = JOURNAL_KEEP):
+        self.pname = pname
+        self.interval = interval
+        self.snapshot = snapshot
+        self.keep = int(keep * NS)
+        if not os.path.exists(pname) or \
+           os.path.getsize(pname) < BINLOG_HEADER.size:
+            WriteJournalFile(pname, [])
+            SyncDirectory(pname)
+        self.file = open(pname, "ab")
+        self.records = (self.file.tell() - BINLOG_HEADER.size) // \
+            JOURNAL_RECORD.size
+        states = ReadJournalStates(pname)
+        self.tickers = [state.Pack() for state in states
+                        if state.kind == JOURNAL_TICKER]
+        self.recent = []            # (time, record) of the last KEEP ns
+        if states:
+            self.recent = [(state.time, state.Pack()) for state in states
+                           if state.time >= states[-1].time - self.keep]
+        self.pending = []
+        self.last = None            # Last record committed
+        self.commits = 0
+        self.error = None
+        self.closing = False
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(group=None, target=self.Run,
+                                       name="SessionJournal")
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.Close)
+
+    def Append(self, state):
+        """Queues a state; it is on disk within the commit interval"""
+        with self.cond:
+            self.pending.append(state)
+            if len(self.pending) == 1:
+                self.cond.notify()
+
+    def Run(self):
+        """Commits the pending states, until closed"""
+        while True:
+            with self.cond:
+                while not self.pending and not self.closing:
+                    self.cond.wait()
+                if not self.closing:
+                    # Let the states of the whole window pile up
+                    self.cond.wait(self.interval)
+                batch = self.pending
+                self.pending = []
+                done = self.closing
+            if batch:
+                self.Commit(batch)
+            if done:
+                return
+
+    def Commit(self, batch):
+        records = [state.Pack() for state in batch]
+        try:
+            self.file.write(b"".join(records))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.commits += 1
+            self.records += len(records)
+            self.last = records[-1]
+            self.tickers.extend([record for state, record
+                                 in zip(batch, records)
+                                 if state.kind == JOURNAL_TICKER])
+            self.recent.extend([(state.time, record) for state, record
+                                in zip(batch, records)])
+            oldest = batch[-1].time - self.keep
+            while self.recent and self.recent[0][0] < oldest:
+                self.recent.pop(0)
+            if self.records >= self.snapshot:
+                self.Compact()
+        except (IOError, OSError) as exc:
+            self.error = exc
+
+    def Compact(self):
+        """Replaces the journal with one holding only the ticker
+        records and the states of the last KEEP ns
+        """
+        recent = [record for tme, record in self.recent]
+        kept = set(map(id, recent))
+        records = [record for record in self.tickers
+                   if id(record) not in kept] + recent
+        WriteJournalFile(self.pname + ".tmp", records)
+        self.file.close()
+        os.replace(self.pname + ".tmp", self.pname)
+        SyncDirectory(self.pname)
+        self.file = open(self.pname, "ab")
+        self.records = len(records)
+
+    def Close(self):
+        """Commits all the pending states and closes the journal"""
+        if self.thread is not None:
+            with self.cond:
+                self.closing = True
+                self.cond.notify()
+            self.thread.join()
+            self.thread = None
+            atexit.unregister(self.Close)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def ReadJournalStates(pname):
+    """All the valid SessionStates of a journal, in order"""
+    if not os.path.exists(pname):
+        return []
+    with open(pname, "rb") as stream:
+        data = stream.read()
+    magic, version = BINLOG_HEADER.unpack(data[:BINLOG_HEADER.size]
+                                          .ljust(BINLOG_HEADER.size, b"\0"))
+    if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+        raise Exception("Not a session journal: '%s'" % pname)
+    states = []
+    for i in range(BINLOG_HEADER.size,
+                   len(data) - JOURNAL_RECORD.size + 1, JOURNAL_RECORD.size):
+        state = SessionState.Unpack(data[i:i + JOURNAL_RECORD.size])
+        if state is not None:
+            states.append(state)
+    return states
+
+
+def ReadJournal(pname):
+    """The last valid SessionState of a journal, or None"""
+    if not os.path.exists(pname):
+        return None
+    with open(pname, "rb") as stream:
+        magic, version = BINLOG_HEADER.unpack(stream.read(BINLOG_HEADER.size)
+                                              .ljust(BINLOG_HEADER.size,
+                                                     b"\0"))
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+            raise Exception("Not a session journal: '%s'" % pname)
+        size = os.fstat(stream.fileno()).st_size
+        n = (size - BINLOG_HEADER.size) // JOURNAL_RECORD.size
+        for i in range(n - 1, -1, -1):
+            stream.seek(BINLOG_HEADER.size + i * JOURNAL_RECORD.size)
+            state = SessionState.Unpack(stream.read(JOURNAL_RECORD.size))
+            if state is not None:
+                return state
+    return None
+
+
+def ReadLogLines(pname):
+    """The complete lines of a text log (a torn last line is left out)"""
+    if not os.path.exists(pname):
+        return []
+    with open(pname, "rb") as stream:
+        data = stream.read()
+    return data[:data.rfind(b"\n") + 1].splitlines(True)
+
+
+def ReplaceFile(pname, data):
+    """Replaces the content of a file atomically"""
+    with open(pname + ".tmp", "wb") as out:
+        out.write(data)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(pname + ".tmp", pname)
+
+
+def ResumeState(jname, logname, binary=None):
+    """The state to resume a session from: the last journaled state
+    whose responses are all in the text log LOGNAME. The log and the
+    journal are cut back to that state, and the BINARY log rebuilt
+    from the text log, so that all three agree. None if there is no
+    journal.
+    """
+    states = ReadJournalStates(jname)
+    if not states:
+        return None
+    lines = ReadLogLines(logname)
+    last = None
+    for i, state in enumerate(states):
+        if state.responses <= len(lines):
+            last = i
+    if last is None or (last < len(states) - 1 and
+                        states[last].responses < len(lines)):
+        # The journal lost the states of rows that are in the log
+        raise Exception("Cannot resume: the log '%s' does not match its "
+                        "journal '%s'" % (logname, jname))
+    state = states[last]
+    lines = lines[:state.responses]
+
+    if last < len(states) - 1:
+        WriteJournalFile(jname + ".tmp", [s.Pack() for s in states[:last + 1]])
+        os.replace(jname + ".tmp", jname)
+    ReplaceFile(logname, b"".join(lines))
+    if binary is not None:
+        rows = []
+        for line in lines:
+            task, cond, resp, correct, tme, rt, index = \
+                line.decode().rstrip("\n").split("\t")[-7:]
+            rows.append([task, cond, resp, correct == "True",
+                         float(tme), float(rt), int(index)])
+        if os.path.exists(binary):
+            os.remove(binary)
+        log = BinaryLog(binary)
+        log.Write(rows)
+        log.Close()
+    SyncDirectory(logname)
+    return state
+
+
+## ---------------------------------------------------------------- ##
+## Headless task logic
+## ---------------------------------------------------------------- ##
+## Everything in this section is plain Python: no wx, no display.
+## The panels of dualgui.py are thin views over these objects, and a
+## DualTaskSession can be driven by a script just like by the GUI.
+## ---------------------------------------------------------------- ##
+
+START_POINTS = 200    # Points at the beginning of a session
+CORRECT_POINTS = 10   # Points gained for every correct response
+DECAY_POINTS = -2     # Points lost at every tick of the point clock
+POINT_TICK = 1.0      # Seconds between two ticks of the point clock
+
+
+class DualTask():
+    """The state of one of the two tasks, independent of the UI"""
+    def __init__(self, condition = EASY):
         self.task_name = None
         self.index = 0
-        self.onset = time.time()
         self.condition = condition
         self.finished = False
-        self.responseListeners = []
-        self.monofont = wx.Font(16,
-                                wx.FONTFAMILY_TELETYPE,  # Monospace
-                                wx.FONTSTYLE_NORMAL,     # Not slanted
-                                wx.FONTWEIGHT_BOLD)
-
+        self.onset = None           # When the task was last activated (ns)
+        self.active = False
+        self.clock = CLOCK
+        self.answers = None         # This task's answers in an AnswerKey,
+        self.offset = 0             # from OFFSET on for the current trial
 
     @property
     def finished(self):
@@ -181,29 +1909,22 @@ class DualTaskPanel(wx.Panel):
     def finished(self, b):
         if type(b) == bool:
             self._finished = b
-        
+
     @property
     def active(self):
-        """Returns whether a panel is currently active:"""
+        """Returns whether a task is currently active"""
         return self._active
 
     @active.setter
     def active(self, status):
-        """Activates or deactivates a panel"""
+        """Activates or deactivates a task; activating it starts the
+        RT of its next response
+        """
         if status == True or status == False:
             self._active = status
-        
-    def AddResponseListener(self, listener):
-        """Adds an object to invoke when a response is made"""
-        if not listener in self.responseListeners: 
-            self.responseListeners.append(listener)
-                
-
-    def BroadcastResponse(self, response):
-        """Invokes the ProcessResponse method of every listener"""
-        for l in self.responseListeners:
-            l.ProcessResponse(response)
-        
+            if status:
+                self.onset = self.clock.Now()
+
     @property
     def condition(self):
         return self._condition
@@ -212,7 +1933,7 @@ class DualTaskPanel(wx.Panel):
     def condition(self, val):
         if val == EASY or val == HARD:
             self._condition = val
-        
+
     @property
     def task_name(self):
         return self._task_name
@@ -221,10 +1942,6 @@ class DualTaskPanel(wx.Panel):
     def task_name(self, val):
         self._task_name = val
 
-    def InitUI(self):
-        """Does nothing, really"""
-        pass
-
     @property
     def index(self):
         return self._index
@@ -236,116 +1953,32 @@ class DualTaskPanel(wx.Panel):
         else:
             self._index = -1
 
-    def ResponseCorrect(self, val):
-        """Returns whether a response is correct"""
-        return True
-
-    def LogResponse(self, response):
-        """Logs a response if the logger is enabled"""
-        tme = time.time()
-        rt = tme - self.onset 
-        if self.logger is not None:
-            data = [self.name,
-                    CONDITIONS[self.condition],
-                    response,
-                    self.ResponseCorrect(response),
-                    tme,
-                    rt]
-            self.logger.log(data)
-
-
-## ---------------------------------------------------------------- ##
-## The Point System
-## ---------------------------------------------------------------- ##
-
-EVT_RESULT_ID = wx.NewId()
- 
-def EVT_RESULT(win, func):
-    """Define Result Event"""
-    win.Connect(-1, -1, EVT_RESULT_ID, func)
- 
-class PointEvent(wx.PyEvent):
-    """Simple event to safely carry point updates in a thread"""
-    def __init__(self, data):
-        """Init Result Event."""
-        wx.PyEvent.__init__(self)
-        self.SetEventType(EVT_RESULT_ID)
-        self.data = data
-            
-class PointPanel(DualTaskPanel):
-    def __init__(self, parent, id):
-        self.pointthread = None
-        super(PointPanel, self).__init__(parent = parent,
-                                         id = id)
-        self.InitUI()
-        self.thread = threading.Thread(group=None, target=self.Run)
-        self.lock = threading.Lock()
-        self.points = 200
-        self.active = True
-
-        # Set up event handler for any worker thread results
-        EVT_RESULT(self, self.UpdatePoints)
-    
-    def Run(self):
-        while self.active:
-            try:
-                time.sleep(1.0)
-                if self is not None and self.active:
-                    wx.PostEvent(self, PointEvent(-2))
-            except RuntimeError:
-                sys.exit(0)
-        
     @property
-    def points(self):
-        return self._points
-    
-    @points.setter
-    def points(self, pnts):
-        self._points = pnts
-        self.SetUp()
-
-    def UpdatePoints(self, evt):
-        inc = evt.data
-        self.points += inc
-        self.Update()
-        
-    def InitUI(self):
-        vbox = wx.BoxSizer(wx.VERTICAL)
-        self.SetSizer(vbox)
-
-        vbox.Add((20, 20), 0, wx.EXPAND | wx.ALL)
-        text = wx.StaticText(self, -1, "Points:")
-        text.SetFont(self.monofont)
-        vbox.Add(text, 0, wx.ALIGN_CENTER)
-        points = wx.StaticText(self, -1, "---")
-        points.SetFont(self.monofont)
-        vbox.Add(points, 0, wx.ALIGN_CENTER)
-
-        self.ptext = points
-
-    def SetUp(self):
-        self.lock.acquire()
-        self.ptext.SetLabel("%d" % self.points)
-        print("Points %d" % self.points)
-        self.lock.release()
+    def correct_response(self):
+        """Returns the correct response at the current index"""
+        return None
 
+    def Respond(self, response, tme=None):
+        """Records a response and moves on to the next index"""
+        if tme is None:
+            tme = self.clock.Now()
+        resp = ResponseEvent(self,
+                             response=response,
+                             time=tme,
+                             correct = self.correct_response,
+                             index = self.index,
+                             onset = self.onset)
+        self.index += 1
+        return resp
 
-## ---------------------------------------------------------------- ##
-## TYPING TASK PANEL
-## ---------------------------------------------------------------- ##
 
-class TypingTaskPanel(DualTaskPanel):
-    """A panel for the Typing Task"""
-    def __init__(self, parent, id, trial = TypingTrial(condition = "easy",
-                                                       word = "A" * 10)):
+class TypingTask(DualTask):
+    """The logic of the Typing Task"""
+    def __init__(self, trial = TypingTrial(condition = "easy",
+                                           word = "A" * 10)):
         self.trial = trial
-        super(TypingTaskPanel, self).__init__(parent=parent, id=id,
-                                              condition = trial.condition)
-        print("Z")
-        self.entry = None
-        self.keys = None
-        self.InitUI()
-        self.SetUp()
+        super(TypingTask, self).__init__(condition = self.condition)
+        self.task_name = "typing"
 
     @property
     def size(self):
@@ -353,7 +1986,7 @@ class TypingTaskPanel(DualTaskPanel):
             return len(self.word)
         else:
             return 10
-        
+
     @property
     def trial(self):
         return self._trial
@@ -361,26 +1994,28 @@ class TypingTaskPanel(DualTaskPanel):
     @trial.setter
     def trial(self, tr):
         if isinstance(tr, TypingTrial):
+            self._trial = tr
             self.finished = False
-            self.word = tr.word
+            self._word = tr.answer
+            self.answers = None
             self.index = 0
             self.condition = CONDITIONS[tr.condition]
 
         else:
             raise Exception("Wrong object for trial: '%s'" % tr)
 
-    @DualTaskPanel.index.setter
+    @DualTask.index.setter
     def index(self, val):
         if type(val) == int:
             self._index = val
             if self.index >= self.size:
-                print("panel %s is finished" % self)
-                
+                if TRACER.enabled:
+                    TRACER.Point("task finished", self.task_name)
+
                 self.finished = True
         else:
             raise Exception("Invalid index %d" % val)
 
-        
     @property
     def word(self):
         """Returns the internal word that is displayed."""
@@ -389,140 +2024,39 @@ class TypingTaskPanel(DualTaskPanel):
     @word.setter
     def word(self, val):
         """
-        Sets the word. Value will be converted to uppercase string 
+        Sets the word. Value will be converted to uppercase string
         or to empty string if None.
         """
         if type(val) == str:
             self._word = val.upper()
             self.index = 0
-            
+
         elif val == None:
             self._word = EMPTY_STRING
             self.index = -1
-            
+
         else:
             res = "%s" % val
             self._word = res.upper()
 
-    
     @property
     def correct_response(self):
-        """Returns the correct response for a subtraction task"""
+        """Returns the correct response for a typing task"""
+        if self.answers is not None:
+            return self.answers[self.offset + self.index]
         if self.word is not None:
             return self.word[self.index]
         else:
             return None
 
-            
-    def InitUI(self):
-        """Does the layout of the panel."""
-        #self.SetBackgroundColour("#FF5555")
-        hbox = wx.BoxSizer(wx.HORIZONTAL)
-        self.SetSizer(hbox)
-        
-        vbox = wx.BoxSizer(wx.VERTICAL)
-        hbox.Add((20, 20), wx.EXPAND)
-        hbox.Add(vbox)
-        hbox.Add((20, 20), wx.EXPAND)
-
-        
-        center = wx.Panel(self, -1, style=wx.SIMPLE_BORDER)
-        cbox = wx.BoxSizer(wx.VERTICAL)
-        center.SetSizer(cbox)
-
-        entry = wx.TextCtrl(center, -1)
-        entry.SetFont(self.monofont)
-        cbox.Add(entry, proportion=1, flag=wx.EXPAND | wx.ALL, border = 20)
-
-        keyboard = wx.Panel(center, -1)
-        keys = []
-        ksizer = wx.GridSizer(6, 5, 5, 5)
-        keyboard.SetSizer(ksizer)
-        
-        for letter in string.ascii_uppercase:
-            b = wx.Button(keyboard, -1, letter)
-            b.SetFont(self.monofont)
-            ksizer.Add(b, 20)
-            keys.append(b)
-
-        cbox.Add(keyboard, 0, wx.EXPAND | wx.ALL, border = 20)
-
-
-        vbox.Add((20, 20), wx.EXPAND)
-        vbox.Add(center, wx.ALIGN_CENTRE)
-        vbox.Add((20, 20), wx.EXPAND)
-        
-        # Save the internal components
-        self.keys = keys
-        self.entry = entry
-        
-        self.Bind(wx.EVT_BUTTON,  self.OnButton)
-
-    @DualTaskPanel.active.setter
-    def active(self, status):
-        if self.entry is not None and self.keys is not None:
-            if status == True:
-                self.entry.Enable()
-                for k in self.keys:
-                    k.Enable()
-                self.SetUp()
-                self.onset = time.time()
-            elif status == False:
-                self.entry.Disable()
-                self.entry.SetValue(EMPTY_STRING)
-                for k in self.keys:
-                    k.Disable()
-        self._active = status
-
-        
-    def SetUp(self):
-        """Correctly sets up the panel according to the condition"""
-        if self.index >= 0:
-            if self.condition == EASY:
-                letter = self.word[self.index]
-                print(letter)
-                self.entry.SetValue(letter)
-            elif self.condition == HARD:
-                if self.index == 0:
-                    self.entry.SetValue(self.word)
-                else:
-                    self.entry.SetValue(EMPTY_STRING)
-            else:
-                # Throw an exception
-                raise Exception("Wrong condition for panel '%s': %s" % (self,
-                                                                        self.condition))
-        else:
-            raise Exception("Wrong index for panel '%s': %d'"  % (self,
-                                                                  self.index))
-
-    def OnButton(self, event):
-        """Updates the panel after pressing one of the buttons"""
-        tme = time.time()
-        letter = event.GetEventObject().GetLabel()
-        resp = ResponseEvent(self,
-                             response=letter,
-                             time=tme,
-                             correct = self.correct_response,
-                             index = self.index)
-        self.index += 1
-        self.BroadcastResponse(resp)
-        
 
-## ---------------------------------------------------------------- ##
-## SUBTRACTION PANEL
-## ---------------------------------------------------------------- ##
-        
-class SubtractionTaskPanel(DualTaskPanel):
-    """ A panel that implements the subtraction task of 
-    Borst et al. (2010)
-    """
-    def __init__(self, parent, id,
-                 trial = SubtractionTrial("easy", 8888888888, 7654321000)):
+class SubtractionTask(DualTask):
+    """The logic of the subtraction task of Borst et al. (2010)"""
+    def __init__(self, trial = SubtractionTrial("easy", 8888888888, 7654321000)):
+        self.solution = None
         self.trial = trial
-        super(SubtractionTaskPanel, self).__init__(parent=parent, id=id,
-                                                   condition=trial.condition)
-        self.InitUI()
-
+        super(SubtractionTask, self).__init__(condition = self.condition)
+        self.task_name = "subtraction"
 
     @property
     def trial(self):
@@ -533,315 +2067,576 @@ class SubtractionTaskPanel(DualTaskPanel):
     def trial(self, val):
         """Sets a new trial"""
         if isinstance(val, SubtractionTrial):
+            self._trial = val
             self.finished = False
-            self.SetNumbers((val.number1, val.number2))
+            self.number1 = val.number1
+            self.number2 = val.number2
+            self.solution = val.answer
+            self.answers = None
             self.index = 0
             self.condition = CONDITIONS[val.condition]
 
-        
     @property
     def size(self):
         """Returns the trial's size (length of the numbers)"""
         return len(self.number1)
 
-    @DualTaskPanel.index.setter
+    @DualTask.index.setter
     def index(self, val):
         """Updates the internal index"""
         if type(val) == int:
             self._index = val
             if self.index >= self.size:
-                print("panel %s is finished" % self)
+                if TRACER.enabled:
+                    TRACER.Point("task finished", self.task_name)
                 self.finished = True
         else:
             raise Exception("Invalid index %d" % val)
-    
-    @DualTaskPanel.active.setter
-    def active(self, status):
-        if type(status) == bool:
-            self._active = status
-            if self.text1 is not None and \
-            self.text2 is not None and \
-            self.entry is not None:
-                if status == False:
-                    for t in self.text1:
-                        t.Disable()
-                        t.SetLabel("*")
-                    for t in self.text2:
-                        t.Disable()
-                        t.SetLabel("*")
-                    for k in self.keys:
-                        k.Disable()
-                    for t in self.text3:
-                        t.Disable()
-                    
-                    self.entry.Disable()
-                    self.entry.SetValue(EMPTY_STRING)
-
-                if status == True:
-                    j = self.size - self.index # Digist up to index
-                    for i, t in enumerate(self.text1):
-                        t.Enable()
-                        if i < j:
-                            t.SetLabel(self.number1[i])
-                        else:
-                            t.SetLabel("#")  # Mask the previous numbers
-
-                    for i, t in enumerate(self.text2):
-                        t.Enable()
-                        if i < j:
-                            t.SetLabel(self.number2[i])
-                        else:
-                            t.SetLabel("#")
-                   
-                    for t in self.text3:
-                        t.Enable()
-                    for k in self.keys:
-                        k.Enable()
-                        
-                    self.entry.Enable()
-                    self.SetUp()
-
-    def SetNumbers(self, tpl):
-        """Sets the internal numbers for subtraction"""
-        self.number1 = tpl[0]
-        self.number2 = tpl[1]
-
-        # Convert
-        n1 = int(self.number1)
-        n2 = int(self.number2)
-        
-        # Calculate solution
-        s = n1 - n2
-        
-        self.solution = "%.10d" % s
 
     @property
     def correct_response(self):
         """Returns the correct response for a subtraction task"""
+        if self.answers is not None:
+            return self.answers[self.offset + self.index]
         if self.solution is not None:
             return self.solution[self.index]
         else:
             return None
-        
-    def InitUI(self):
-        """Set up the panel UI"""
-        #self.SetBackgroundColour("#5555FF")
-        hbox = wx.BoxSizer(wx.HORIZONTAL)
-        vbox = wx.BoxSizer(wx.VERTICAL)
-        self.SetSizer(hbox)
-        
-        center = wx.Panel(self, -1, style=wx.SIMPLE_BORDER)
-        cvbox = wx.BoxSizer(wx.VERTICAL)
-        center.SetSizer(cvbox)
 
-        text1 = []   # Upper number
-        text2 = []   # Lower number
-        
-        for j in range(self.size):
-            text1.append(wx.StaticText(center,
-                                       -1,
-                                       self.number1[j],
-                                       ))
-
-        for j in range(self.size):
-            text2.append(wx.StaticText(center,
-                                       -1,
-                                       self.number2[j]))
-
-        nsizer = wx.GridSizer(2, self.size, 0, 0)
-        allt = text1 + text2
-
-        ksizer = wx.GridSizer(2, 1, 0, 0)
-        text3 = []
-        for char in ["-", "="]:
-            x = wx.StaticText(center, -1, char)
-            x.SetFont(self.monofont)
-            text3.append(x)
-            ksizer.Add(x)
-       
-                   
-        for t in allt:
-            t.SetFont(self.monofont)
-            nsizer.Add(t, 5)
-
-
-        entry = wx.TextCtrl(center, -1, style=wx.TE_RIGHT)
-        entry.SetFont(self.monofont)
-
-        vbox1 = wx.BoxSizer(wx.VERTICAL)
-        vbox1.Add(nsizer, 1, wx.ALIGN_RIGHT | wx.LEFT, border = 20)
-        vbox1.Add(entry, proportion = 0, flag=wx.EXPAND | wx.BOTTOM, border = 20)
-        
-        hbox1 = wx.BoxSizer(wx.HORIZONTAL)
-        hbox1.Add(vbox1, 0, wx.ALIGN_RIGHT | wx.EXPAND, border=20)
-        hbox1.Add(ksizer, 0, wx.ALIGN_RIGHT | wx.LEFT | wx.RIGHT, border=20)
-        cvbox.Add(hbox1, 0, wx.ALIGN_RIGHT)
-                
-        keyboard = wx.Panel(center, -1)
-        ksizer = wx.GridSizer(2, 5, 5, 5)
-        keyboard.SetSizer(ksizer)
-        keys = []
-        
-        for digit in string.digits:
-            b = wx.Button(keyboard, -1, digit)
-            b.SetFont(self.monofont)
-            ksizer.Add(b, 20)
-            keys.append(b)
 
-        cvbox.Add(keyboard, 0, wx.EXPAND | wx.ALL, border = 20)
+class PointCounter():
+    """Keeps the points of a participant, and publishes a
+    PointChangeEvent on BUS (if any) whenever they change
+    """
+    def __init__(self, points = START_POINTS, bus = None, clock = CLOCK):
+        self._points = points
+        self.bus = bus
+        self.clock = clock
 
-        vbox.Add((20, 20), wx.EXPAND)
-        vbox.Add(center, wx.ALIGN_CENTER)
-        vbox.Add((20, 20), wx.EXPAND)
-        
-        hbox.Add((20, 20), wx.EXPAND | wx.ALL)
-        hbox.Add(vbox)
-        hbox.Add((20, 20), wx.EXPAND | wx.ALL)
-        
-        # Save all the important elements in internal fields
-        self.entry = entry
-        self.text1 = text1
-        self.text2 = text2
-        self.text3 = text3
-        self.keys = keys
-        
-        self.Bind(wx.EVT_BUTTON,  self.OnButton)
-    
+    @property
+    def points(self):
+        return self._points
 
-    def SetUp(self):
-        """Correctly sets up the panel according to the condition"""
-        if self.index >= 0:
-            if self.condition == EASY:
-                self.entry.SetValue("#" * self.index)
-            elif self.condition == HARD:
-                self.entry.SetValue(EMPTY_STRING)
-            else:
-                # Throw an exception
-                pass
+    @points.setter
+    def points(self, pnts):
+        change = pnts - self._points
+        self._points = pnts
+        if self.bus is not None and change:
+            self.bus.Publish(PointChangeEvent(pnts, change, self.clock.Now()))
 
-    def OnButton(self, event):
-        """Updates the panel after pressing one of the buttons"""
-        tme = time.time()
-        digit = event.GetEventObject().GetLabel()
-        resp = ResponseEvent(self,
-                             response=digit,
-                             time=tme,
-                             correct = self.correct_response,
-                             index = self.index)
-        self.index += 1
-        self.BroadcastResponse(resp)
-        
+    def Add(self, inc):
+        """Adds (or, if negative, removes) points"""
+        self.points += inc
 
-## ---------------------------------------------------------------- ##
-## Dual Task frame
-## ---------------------------------------------------------------- ##
-## This is the main window for the experiment.
-## ---------------------------------------------------------------- ##
 
-class DualTaskFrame(wx.Frame):
-    """The main experiment's window"""
-    def __init__(self, parent, title):
-        """The main panel"""
-        super(DualTaskFrame, self).__init__(parent, title=title, size=(1200,800))
-        self.trials = iter(self.LoadTrials())
+class AnswerKey():
+    """The expected responses of a whole trial list: the answers of
+    every trial of a task, one after the other, in a single string.
+    A task reads its correct response from it at trial * SIZE + index.
+    """
+    __slots__ = ("typing", "subtraction", "count")
+
+    SIZE = 10    # Responses per task in a trial
+
+    def __init__(self, typing, subtraction):
+        self.typing = typing
+        self.subtraction = subtraction
+        self.count = len(typing) // self.SIZE
+
+    @classmethod
+    def FromTrials(cls, trials):
+        """The key of a list of (typing, subtraction) trials"""
+        return cls(EMPTY_STRING.join([t.answer for t, s in trials]),
+                   EMPTY_STRING.join([s.answer for t, s in trials]))
+
+    @classmethod
+    def Of(cls, trials):
+        """The key of TRIALS: the one stored in a TrialCache, or one
+        built from a list; None if the trials are streamed
+        """
+        if isinstance(trials, TrialCache):
+            return trials.key
+        if hasattr(trials, "__len__"):
+            return cls.FromTrials(trials)
+        return None
+
+    def __len__(self):
+        return self.count
+
+
+class DualTaskSession():
+    """A whole session of the experiment, without any UI.
+
+    Holds the typing and subtraction tasks, alternates between them
+    after every response, keeps the points and moves on to the next
+    trial when both tasks are finished.
+
+    With a BUS, the session publishes the start and end of every
+    trial, the changes of points and the switches between tasks.
+    """
+    def __init__(self, trials, points = START_POINTS, clock = None,
+                 correct_points = CORRECT_POINTS, bus = None):
+        if clock is None:
+            clock = SessionClock()
+        self.clock = clock
+        self.bus = bus
+        self.journal = None        # A SessionJournal of every transition
+        self.correct_points = correct_points
+        self.trial_list = trials if hasattr(trials, "__len__") else None
+        self.key = AnswerKey.Of(trials)     # Scores all the responses
+        self.trial_number = 0      # Of the current trial, from 0
+        self.trials = iter(trials)
         self.current_trial = next(self.trials, None)
+        self.finished = self.current_trial is None
+        self.points = PointCounter(points, bus, clock)
+
         if self.current_trial is not None:
-            self.InitUI()
-            self.Centre()
-            self.Show()
+            self.typing = TypingTask(trial = self.current_trial[0])
+            self.subtraction = SubtractionTask(trial = self.current_trial[1])
+        else:
+            self.typing = TypingTask()
+            self.subtraction = SubtractionTask()
 
-    def LoadTrials(self, fname="trials.yaml"):
-        """Loads a series of trials from a YAML file"""
-        with open(fname, 'r') as stream:
-            try:
-                lst = yaml.load(stream)
-                res = []
-                for j in lst:
-                    t_dic = j['typing']
-                    s_dic = j['subtraction']
-                    t = TypingTrial(t_dic['condition'], t_dic['word'])
-                    s = SubtractionTrial(s_dic['condition'],
-                                         s_dic['number1'],
-                                         s_dic['number2'])
-                    res.append((t, s))
-
-                return tuple(res)
-            except yaml.YAMLError as exc:
-                raise Exception("Incorrect YAML format for trials: %s" % (exc,))
+        self.typing.clock = clock
+        self.subtraction.clock = clock
+        self.UseKey()
 
-        
-    def InitUI(self):
-        "Does the layout"
-        mainpanel = wx.Panel(self)
-        mainbox = wx.BoxSizer(wx.HORIZONTAL)
-        vbox = wx.BoxSizer(wx.VERTICAL)
-        hbox = wx.BoxSizer(wx.HORIZONTAL)
-
-        points = PointPanel(mainpanel, -1)
-        typing = TypingTaskPanel(mainpanel, -1,
-                                 trial = self.current_trial[0])
-        
-        hbox.Add(typing, 1, wx.EXPAND | wx.RIGHT, 10)
-        typing.active = False
-        typing.AddResponseListener(self)
-        
-        subtraction = SubtractionTaskPanel(mainpanel, -1,
-                                           trial = self.current_trial[1])
-        hbox.Add(subtraction, 1, wx.EXPAND | wx.LEFT, 10)
-        subtraction.active = True
-        subtraction.AddResponseListener(self)
-
-        vbox.Add((20, 20), 1, wx.EXPAND | wx.ALL)
-        vbox.Add(points, 0, wx.EXPAND | wx.BOTTOM, 10)
-        vbox.Add(hbox, 0, wx.TOP | wx.ALIGN_CENTER, 10)
-        vbox.Add((20, 20), 1, wx.EXPAND | wx.ALL)
-        
-        mainbox.Add((20, 20), 1, wx.EXPAND | wx.ALL)
-        mainbox.Add(vbox, 0, wx.EXPAND | wx.ALL | wx.ALIGN_CENTER)
-        mainbox.Add((20, 20), 1, wx.EXPAND | wx.ALL)
-        
-        mainpanel.SetSizer(mainbox)
+        # The subtraction task always goes first
+        self.typing.active = False
+        self.subtraction.active = not self.finished
 
-        self.typing = typing
-        self.subtraction = subtraction
-        self.points = points
-        self.points.thread.start()
+        if bus is not None and self.current_trial is not None:
+            bus.Publish(TrialStartEvent(0, self.current_trial, clock.Now()))
 
+    def UseKey(self):
+        """Points the tasks at the answers of the current trial"""
+        if self.key is not None and self.current_trial is not None:
+            offset = self.trial_number * AnswerKey.SIZE
+            self.typing.answers = self.key.typing
+            self.typing.offset = offset
+            self.subtraction.answers = self.key.subtraction
+            self.subtraction.offset = offset
 
+    @property
+    def active_task(self):
+        """Returns the task that is currently waiting for a response"""
+        if self.typing.active:
+            return self.typing
+        elif self.subtraction.active:
+            return self.subtraction
+        else:
+            return None
+
+    def Respond(self, response, tme=None):
+        """Gives a response to the active task, as a participant would"""
+        task = self.active_task
+        if task is None:
+            raise Exception("No active task in session '%s'" % self)
+        event = task.Respond(response, tme)
+        self.ProcessResponse(event)
+        return event
+
+    @Traced("DualTaskSession.ProcessResponse")
     def ProcessResponse(self, event):
         """Processes a subject's response"""
         source = event.source
         source.active = False
 
-        # Update the points in thread-friendly manner
         if event.IsCorrect():
-            wx.PostEvent(self.points, PointEvent(+10))
-        
-        # This is the part where we log the response
+            self.points.Add(self.correct_points)
 
-        # If both panels are done, move to the next step
+        # If both tasks are done, move to the next step
+        bus = self.bus
         if self.subtraction.finished and self.typing.finished:
-            print("Both panels are finished")
+            if TRACER.enabled:
+                TRACER.Point("trial finished")
+            if bus is not None:
+                bus.Publish(TrialEndEvent(self.trial_number,
+                                          self.current_trial, event.time))
             self.current_trial = next(self.trials, None)
+            self.trial_number += 1
 
             if self.current_trial is not None:
-                # If we have a new trial, update the panels
                 self.typing.trial = self.current_trial[0]
                 self.subtraction.trial = self.current_trial[1]
-                
+                self.UseKey()
+                if bus is not None:
+                    bus.Publish(TrialStartEvent(self.trial_number,
+                                                self.current_trial,
+                                                event.time))
+
             else:
-                # Quit --- we are done
-                self.points.active = False
-                sys.exit()
+                # We are done
+                self.finished = True
+                if self.journal is not None:
+                    self.journal.Append(self.State(JOURNAL_FINISHED,
+                                                   event.time))
+                return
 
-        # Just restart continue alternating
-        if source == self.typing:
+        # Just continue alternating
+        if source is self.typing:
             self.subtraction.active = True
-        elif source == self.subtraction:
+        elif source is self.subtraction:
             self.typing.active = True
+        if bus is not None:
+            bus.Publish(TaskSwitchEvent(source, self.active_task, event.time))
+        if self.journal is not None:
+            self.journal.Append(self.State(JOURNAL_RESPONSE, event.time))
+
+    def Decay(self, inc = DECAY_POINTS, tme = None):
+        """Adds the points of a tick of the point clock"""
+        self.points.Add(inc)
+        if self.journal is not None:
+            self.journal.Append(self.State(JOURNAL_DECAY, tme))
+
+    def State(self, kind = JOURNAL_START, tme = None):
+        """The SessionState of the session now (or at TME)"""
+        if tme is None:
+            tme = self.clock.Now()
+        task = self.active_task
+        return SessionState(kind, tme, self.trial_number,
+                            self.typing.index, self.subtraction.index,
+                            UNKNOWN_CODE if task is None
+                            else Code(TASK_CODES, task.task_name),
+                            self.points.points)
+
+    def Resume(self, state):
+        """Puts the session back into STATE, as saved by a journal.
+
+        The trial is read by its index, if the trials can be indexed
+        (a list or a TrialCache); otherwise, the trials before it are
+        skipped. The clock (if not virtual) goes on from the time of
+        the state.
+        """
+        if state.trial < self.trial_number:
+            raise Exception("Cannot resume trial %d after trial %d" %
+                            (state.trial, self.trial_number))
+        if state.trial > self.trial_number:
+            if self.trial_list is not None:
+                trials = self.trial_list
+                self.trials = (trials[i] for i in range(state.trial + 1,
+                                                        len(trials)))
+                self.current_trial = trials[state.trial] \
+                    if state.trial < len(trials) else None
+            else:
+                skip = state.trial - self.trial_number - 1
+                self.current_trial = next(itertools.islice(self.trials, skip,
+                                                           None), None)
+            self.trial_number = state.trial
+            if self.current_trial is not None:
+                self.typing.trial = self.current_trial[0]
+                self.subtraction.trial = self.current_trial[1]
+                self.UseKey()
+
+        self.finished = state.finished or self.current_trial is None
+        self.typing.index = state.typing
+        self.subtraction.index = state.subtraction
+        self.typing.active = not self.finished and \
+            state.active == TASK_CODES.index("typing")
+        self.subtraction.active = not self.finished and \
+            state.active == TASK_CODES.index("subtraction")
+        self.points.points = state.points
+        if not isinstance(self.clock, VirtualClock):
+            self.clock.epoch = time.perf_counter_ns() - state.time
+
+
+## ---------------------------------------------------------------- ##
+## Loading trials
+## ---------------------------------------------------------------- ##
+## Trial files are read one entry at a time from the YAML event
+## stream, so that the first trial is available as soon as it has
+## been parsed, no matter how long the file is.
+## ---------------------------------------------------------------- ##
+
+yaml = None           # Imported by ImportYAML, when first needed
+TrialLoader = None
+
+def ImportYAML():
+    """Imports PyYAML and chooses the fastest loader available"""
+    global yaml, TrialLoader
+    if yaml is None:
+        import yaml as module
+        try:
+            TrialLoader = module.CSafeLoader   # Uses libyaml, if available
+        except AttributeError:
+            TrialLoader = module.SafeLoader
+        yaml = module
+    return yaml
+
+STR_TAG = "tag:yaml.org,2002:str"
+
+
+def Position(fname, mark):
+    """Returns a 'file, line, column' string for a YAML mark"""
+    return "%s, line %d, column %d" % (fname, mark.line + 1, mark.column + 1)
+
+
+def ReadValue(loader, anchors):
+    """Builds the next value out of the YAML event stream"""
+    event = loader.get_event()
+    if isinstance(event, yaml.AliasEvent):
+        if event.anchor not in anchors:
+            raise yaml.composer.ComposerError(None, None,
+                                              "found undefined alias %r"
+                                              % event.anchor,
+                                              event.start_mark)
+        return anchors[event.anchor]
+
+    elif isinstance(event, yaml.ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == "!":
+            tag = loader.resolve(yaml.ScalarNode, event.value, event.implicit)
+        if tag == STR_TAG:
+            value = event.value
+        else:
+            node = yaml.ScalarNode(tag, event.value,
+                                   event.start_mark, event.end_mark,
+                                   style=event.style)
+            value = loader.construct_object(node)
+
+    elif isinstance(event, yaml.MappingStartEvent):
+        value = {}
+        if event.anchor is not None:
+            anchors[event.anchor] = value
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = ReadValue(loader, anchors)
+            value[key] = ReadValue(loader, anchors)
+        loader.get_event()
+
+    elif isinstance(event, yaml.SequenceStartEvent):
+        value = []
+        if event.anchor is not None:
+            anchors[event.anchor] = value
+        while not loader.check_event(yaml.SequenceEndEvent):
+            value.append(ReadValue(loader, anchors))
+        loader.get_event()
+
+    else:
+        raise yaml.composer.ComposerError(None, None,
+                                          "unexpected YAML element %s" % event,
+                                          event.start_mark)
+
+    if event.anchor is not None:
+        anchors[event.anchor] = value
+    return value
+
+
+def ReadTrials(loader, anchors, fname):
+    """Reads the next entry and returns a (typing, subtraction) pair"""
+    event = loader.get_event()
+    if not isinstance(event, yaml.MappingStartEvent):
+        raise Exception("%s: trial is not a mapping" % Position(fname,
+                                                               event.start_mark))
+    # The entry is read by hand, to know where every task starts
+    entry = {}
+    marks = {}
+    while not loader.check_event(yaml.MappingEndEvent):
+        key = ReadValue(loader, anchors)
+        marks[key] = loader.peek_event().start_mark
+        entry[key] = ReadValue(loader, anchors)
+    loader.get_event()
+
+    try:
+        t_dic = entry['typing']
+        s_dic = entry['subtraction']
+    except KeyError as exc:
+        raise Exception("%s: trial has no %s task" % (Position(fname,
+                                                               event.start_mark),
+                                                      exc))
+    try:
+        t = TypingTrial(t_dic['condition'], t_dic['word'])
+    except Exception as exc:
+        raise Exception("%s: %s" % (Position(fname, marks['typing']), exc))
+    try:
+        s = SubtractionTrial(s_dic['condition'],
+                             s_dic['number1'],
+                             s_dic['number2'])
+    except Exception as exc:
+        raise Exception("%s: %s" % (Position(fname, marks['subtraction']), exc))
+    return (t, s)
+
+
+def IterTrials(fname="trials.yaml"):
+    """Yields the (typing, subtraction) trials of a YAML file lazily"""
+    ImportYAML()
+    with open(fname, 'r') as stream:
+        loader = TrialLoader(stream)
+        try:
+            loader.get_event()  # Stream start
+            if loader.check_event(yaml.StreamEndEvent):
+                return
+            loader.get_event()  # Document start
+            if not loader.check_event(yaml.SequenceStartEvent):
+                raise Exception("%s: trials must be a list" % fname)
+            loader.get_event()
+
+            anchors = {}
+            while not loader.check_event(yaml.SequenceEndEvent):
+                yield ReadTrials(loader, anchors, fname)
+
+        except yaml.YAMLError as exc:
+            raise Exception("Incorrect YAML format for trials: %s" % (exc,))
+        finally:
+            loader.dispose()
+
+
+def LoadTrials(fname="trials.yaml"):
+    """Loads a series of trials from a YAML file"""
+    return tuple(IterTrials(fname))
+
+
+## ---------------------------------------------------------------- ##
+## Compiled trial cache
+## ---------------------------------------------------------------- ##
+## A trial file can be compiled into fixed-width binary records,
+## which are memory-mapped and read by index without any parsing.
+## The cache remembers the SHA-256 of the YAML it was compiled from
+## and is rebuilt whenever the YAML changes.
+##
+## The records are followed by the AnswerKey of the list: the typing
+## answers of all the trials (SIZE bytes each), then the subtraction
+## answers, so that opening a cache gives its key without computing
+## anything.
+## ---------------------------------------------------------------- ##
+
+TRIAL_CACHE_MAGIC = b"DUALTRC2"
+TRIALS_SUFFIX = ".trials"    # Compiled trial lists with no YAML source
+TRIAL_CACHE_HEADER = struct.Struct("<8s32sQ")    # Magic, hash, count
+TRIAL_CACHE_RECORD = struct.Struct("<BB10s10s10s")
+
+
+def TrialCacheName(fname):
+    """The name of the compiled cache of a trial file"""
+    return fname + ".cache"
+
+
+def HashFile(fname):
+    """Returns the SHA-256 digest of a file's content"""
+    import hashlib
+    digest = hashlib.sha256()
+    with open(fname, 'rb') as stream:
+        for block in iter(lambda: stream.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def CompileTrials(fname="trials.yaml", cname=None, digest=None):
+    """Compiles a YAML trial file into a binary cache"""
+    if cname is None:
+        cname = TrialCacheName(fname)
+    if digest is None:
+        digest = HashFile(fname)
+
+    tmpname = "%s.%d.tmp" % (cname, os.getpid())
+    count = 0
+    typing = []
+    subtraction = []
+    try:
+        with open(tmpname, 'wb') as out:
+            out.write(TRIAL_CACHE_HEADER.pack(TRIAL_CACHE_MAGIC, digest, 0))
+            for t, s in IterTrials(fname):
+                try:
+                    record = TRIAL_CACHE_RECORD.pack(
+                        CONDITION_CODES.index(t.condition),
+                        CONDITION_CODES.index(s.condition),
+                        t.word.encode("ascii"),
+                        s.number1.encode("ascii"),
+                        s.number2.encode("ascii"))
+                except (ValueError, UnicodeError):
+                    raise Exception("Cannot compile trial %d of '%s': %s, %s"
+                                    % (count, fname, t, s))
+                out.write(record)
+                typing.append(t.answer)
+                subtraction.append(s.answer)
+                count += 1
+            out.write(EMPTY_STRING.join(typing).encode("ascii"))
+            out.write(EMPTY_STRING.join(subtraction).encode("ascii"))
+
+            # Now that the count is known, rewrite the header
+            out.seek(0)
+            out.write(TRIAL_CACHE_HEADER.pack(TRIAL_CACHE_MAGIC, digest, count))
+
+        os.replace(tmpname, cname)
+    finally:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+    return cname
+
+
+class TrialCache():
+    """A memory-mapped, compiled list of trials"""
+    def __init__(self, cname):
+        self.file = open(cname, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+            magic, self.digest, self.count = \
+                TRIAL_CACHE_HEADER.unpack_from(self.data, 0)
+        except (ValueError, struct.error):
+            self.file.close()
+            raise Exception("Not a trial cache: '%s'" % cname)
+
+        start = TRIAL_CACHE_HEADER.size + self.count * TRIAL_CACHE_RECORD.size
+        width = self.count * AnswerKey.SIZE
+        if magic != TRIAL_CACHE_MAGIC or len(self.data) != start + 2 * width:
+            self.close()
+            raise Exception("Not a trial cache: '%s'" % cname)
+        self.key = AnswerKey(self.data[start:start + width].decode("ascii"),
+                             self.data[start + width:].decode("ascii"))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        """Returns the (typing, subtraction) trials at index I"""
+        if i < 0:
+            i += self.count
+        if i < 0 or i >= self.count:
+            raise IndexError("Trial index out of range: %d" % i)
+
+        offset = TRIAL_CACHE_HEADER.size + i * TRIAL_CACHE_RECORD.size
+        tc, sc, word, n1, n2 = TRIAL_CACHE_RECORD.unpack_from(self.data, offset)
+        return (TypingTrial(CONDITION_CODES[tc], word.decode("ascii")),
+                SubtractionTrial(CONDITION_CODES[sc],
+                                 n1.decode("ascii"),
+                                 n2.decode("ascii")))
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+def OpenTrialCache(fname="trials.yaml"):
+    """Opens the cache of a trial file, (re)compiling it if needed"""
+    cname = TrialCacheName(fname)
+    digest = HashFile(fname)
+    if os.path.exists(cname):
+        try:
+            cache = TrialCache(cname)
+            if cache.digest == digest:
+                return cache
+            cache.close()
+        except Exception:
+            pass   # Broken cache, just compile it again
+
+    CompileTrials(fname, cname, digest)
+    return TrialCache(cname)
+
+
+def OpenTrials(fname="trials.yaml"):
+    """Opens the compiled trials, or streams the YAML if impossible"""
+    if fname.endswith(TRIALS_SUFFIX):
+        return TrialCache(fname)
+    try:
+        return OpenTrialCache(fname)
+    except (IOError, OSError):
+        return IterTrials(fname)
+
 
-            
 if __name__ == "__main__":
-    app = wx.App()
-    e = DualTaskFrame(None, "Dual Task")
-    app.MainLoop()
+    import dualgui
+    dualgui.Main()
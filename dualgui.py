@@ -0,0 +1,1127 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## The wx interface of the Dual Task.
+## ---------------------------------------------------------------- ##
+## Panels and the main frame, as thin views over the headless task
+## logic of dual.py. This is the only module that imports wx, and it
+## is only imported when the experiment is run with a window.
+## ---------------------------------------------------------------- ##
+
+import wx
+import sys
+import string
+import threading
+import argparse
+
+from dual import *
+
+
+## ---------------------------------------------------------------- ##
+## Panels
+## ---------------------------------------------------------------- ##
+
+class PanelRenderer():
+    """Updates the widgets of a panel, touching only what changed.
+
+    The renderer remembers the last label, value and enable state it
+    gave to every widget. Inside a 'with' block, changes are only
+    collected; when the outermost block ends, the ones that differ
+    from what is on screen are applied in a single Freeze/Thaw.
+    """
+    def __init__(self, panel):
+        self.panel = panel
+        self.state = {}      # (widget id, attribute) -> last value
+        self.pending = {}    # (widget id, attribute) -> (widget, value)
+        self.depth = 0
+
+    def __enter__(self):
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0:
+            self.Commit()
+        return False
+
+    def Set(self, widget, attribute, value):
+        key = (id(widget), attribute)
+        if self.state.get(key, self) != value:
+            self.pending[key] = (widget, value)
+        else:
+            self.pending.pop(key, None)
+        if self.depth == 0:
+            self.Commit()
+
+    def SetLabel(self, widget, label):
+        self.Set(widget, "label", label)
+
+    def SetValue(self, widget, value):
+        self.Set(widget, "value", value)
+
+    def Enable(self, widget, status = True):
+        self.Set(widget, "enabled", status)
+
+    def Commit(self):
+        """Applies the pending changes in one Freeze/Thaw"""
+        if self.pending:
+            self.panel.Freeze()
+            try:
+                for key, (widget, value) in self.pending.items():
+                    attribute = key[1]
+                    if attribute == "label":
+                        widget.SetLabel(value)
+                    elif attribute == "value":
+                        widget.SetValue(value)
+                    elif attribute == "enabled":
+                        widget.Enable(value)
+                    self.state[key] = value
+            finally:
+                self.pending = {}
+                self.panel.Thaw()
+        self.panel.Rendered()
+
+
+class DualTaskPanel(wx.Panel):
+    """A Dual Task object, viewing the state of a DualTask"""
+    def __init__(self, parent, id, condition = EASY, task = None):
+        if task is None:
+            task = DualTask(condition)
+        self.task = task
+        super(DualTaskPanel, self).__init__(parent=parent, id=id)
+        self.onset = self.task.clock.Now()
+        self.bus = None
+        self.latency = None
+        self.render = PanelRenderer(self)
+        self.monofont = wx.Font(16,
+                                wx.FONTFAMILY_TELETYPE,  # Monospace
+                                wx.FONTSTYLE_NORMAL,     # Not slanted
+                                wx.FONTWEIGHT_BOLD)
+
+
+    @property
+    def finished(self):
+        return self.task.finished
+
+    @finished.setter
+    def finished(self, b):
+        self.task.finished = b
+        
+    @property
+    def active(self):
+        """Returns whether a panel is currently active:"""
+        return self.task.active
+
+    @active.setter
+    @Traced("DualTaskPanel.active")
+    def active(self, status):
+        """Activates or deactivates a panel"""
+        self.task.active = status
+        
+    @property
+    def condition(self):
+        return self.task.condition
+
+    @condition.setter
+    def condition(self, val):
+        self.task.condition = val
+        
+    @property
+    def task_name(self):
+        return self.task.task_name
+
+    @task_name.setter
+    def task_name(self, val):
+        self.task.task_name = val
+
+    def InitUI(self):
+        """Does nothing, really"""
+        pass
+
+    @property
+    def index(self):
+        return self.task.index
+
+    @index.setter
+    def index(self, val):
+        self.task.index = val
+
+    @property
+    def size(self):
+        return self.task.size
+
+    @property
+    def trial(self):
+        return self.task.trial
+
+    @trial.setter
+    def trial(self, tr):
+        self.task.trial = tr
+
+    @property
+    def correct_response(self):
+        return self.task.correct_response
+
+    def ResponseCorrect(self, val):
+        """Returns whether a response is correct"""
+        return True
+
+    def Press(self, key):
+        """Handles the participant pressing one of the keys"""
+        tme = self.task.clock.Now()
+        if self.latency is not None:
+            self.latency.Press(tme)
+        resp = self.task.Respond(key, tme)
+        resp.onset = self.onset
+        if self.bus is not None:
+            self.bus.Publish(resp)
+
+    def Rendered(self):
+        """Called every time the renderer has updated the panel"""
+        if self.latency is not None and self.active:
+            self.latency.Rendered()
+
+
+## ---------------------------------------------------------------- ##
+## The Point System
+## ---------------------------------------------------------------- ##
+
+EVT_RESULT_ID = wx.NewId()
+ 
+def EVT_RESULT(win, func):
+    """Define Result Event"""
+    win.Connect(-1, -1, EVT_RESULT_ID, func)
+ 
+class PointEvent(wx.PyEvent):
+    """Simple event to safely carry point updates in a thread"""
+    def __init__(self, data, deadline=None):
+        """Init Result Event."""
+        wx.PyEvent.__init__(self)
+        self.SetEventType(EVT_RESULT_ID)
+        self.data = data
+        self.deadline = deadline    # Of the tick that posted it (ns)
+            
+class PointPanel(DualTaskPanel):
+    def __init__(self, parent, id, counter = None, session = None):
+        self.tick = None
+        self.decayed = None    # Deadline of the last tick applied (ns)
+        self.session = session
+        if session is not None:
+            counter = session.points
+        if counter is None:
+            counter = PointCounter()
+        self.counter = counter
+        super(PointPanel, self).__init__(parent = parent,
+                                         id = id)
+        self.InitUI()
+        self.lock = threading.Lock()
+        self.SetUp()
+        self.active = True
+
+        # Set up event handler for any worker thread results
+        EVT_RESULT(self, self.UpdatePoints)
+    
+    def Start(self, scheduler):
+        """Starts losing points at every tick of the scheduler"""
+        self.tick = scheduler.Every(POINT_TICK, self.Tick)
+        self.decayed = self.tick.deadline - self.tick.period
+
+    def Tick(self):
+        """Called by the scheduler thread: posts the point decay"""
+        if self.active:
+            wx.PostEvent(self, PointEvent(DECAY_POINTS, self.tick.deadline))
+        else:
+            self.tick.Cancel()
+
+    def Decay(self, until, inc = DECAY_POINTS):
+        """Applies, on the UI thread, every tick due by UNTIL (ns) that
+        was not applied yet, each at the time of its deadline. A
+        response calls it first, so that a tick still waiting in the
+        event queue counts before it, as it does in a replay.
+        """
+        if self.tick is None or self.tick.cancelled:
+            return
+        while self.decayed + self.tick.period <= until:
+            self.decayed += self.tick.period
+            if self.session is not None:
+                self.session.Decay(inc, self.decayed)
+            else:
+                self.counter.Add(inc)
+        self.SetUp()
+        
+    @property
+    def points(self):
+        return self.counter.points
+    
+    @points.setter
+    def points(self, pnts):
+        self.counter.points = pnts
+        self.SetUp()
+
+    def UpdatePoints(self, evt):
+        self.Decay(evt.deadline, evt.data)
+        self.Update()
+        
+    def InitUI(self):
+        vbox = wx.BoxSizer(wx.VERTICAL)
+        self.SetSizer(vbox)
+
+        vbox.Add((20, 20), 0, wx.EXPAND | wx.ALL)
+        text = wx.StaticText(self, -1, "Points:")
+        text.SetFont(self.monofont)
+        vbox.Add(text, 0, wx.ALIGN_CENTER)
+        points = wx.StaticText(self, -1, "---")
+        points.SetFont(self.monofont)
+        vbox.Add(points, 0, wx.ALIGN_CENTER)
+
+        self.ptext = points
+
+    @Traced("PointPanel.SetUp")
+    def SetUp(self):
+        self.lock.acquire()
+        self.ptext.SetLabel("%d" % self.points)
+        if TRACER.enabled:
+            TRACER.Point("points", self.points)
+        self.lock.release()
+
+
+## ---------------------------------------------------------------- ##
+## TYPING TASK PANEL
+## ---------------------------------------------------------------- ##
+
+class TypingTaskPanel(DualTaskPanel):
+    """A panel for the Typing Task"""
+    def __init__(self, parent, id, trial = TypingTrial(condition = "easy",
+                                                       word = "A" * 10),
+                 task = None):
+        if task is None:
+            task = TypingTask(trial = trial)
+        self.entry = None
+        self.keys = None
+        super(TypingTaskPanel, self).__init__(parent=parent, id=id,
+                                              task = task)
+        self.InitUI()
+        self.SetUp()
+
+    @property
+    def word(self):
+        """Returns the internal word that is displayed."""
+        return self.task.word
+
+            
+    def InitUI(self):
+        """Does the layout of the panel."""
+        #self.SetBackgroundColour("#FF5555")
+        hbox = wx.BoxSizer(wx.HORIZONTAL)
+        self.SetSizer(hbox)
+        
+        vbox = wx.BoxSizer(wx.VERTICAL)
+        hbox.Add((20, 20), wx.EXPAND)
+        hbox.Add(vbox)
+        hbox.Add((20, 20), wx.EXPAND)
+
+        
+        center = wx.Panel(self, -1, style=wx.SIMPLE_BORDER)
+        cbox = wx.BoxSizer(wx.VERTICAL)
+        center.SetSizer(cbox)
+
+        entry = wx.TextCtrl(center, -1)
+        entry.SetFont(self.monofont)
+        cbox.Add(entry, proportion=1, flag=wx.EXPAND | wx.ALL, border = 20)
+
+        keyboard = wx.Panel(center, -1)
+        keys = []
+        ksizer = wx.GridSizer(6, 5, 5, 5)
+        keyboard.SetSizer(ksizer)
+        
+        for letter in string.ascii_uppercase:
+            b = wx.Button(keyboard, -1, letter)
+            b.SetFont(self.monofont)
+            ksizer.Add(b, 20)
+            keys.append(b)
+
+        cbox.Add(keyboard, 0, wx.EXPAND | wx.ALL, border = 20)
+
+
+        vbox.Add((20, 20), wx.EXPAND)
+        vbox.Add(center, wx.ALIGN_CENTRE)
+        vbox.Add((20, 20), wx.EXPAND)
+        
+        # Save the internal components
+        self.keys = keys
+        self.entry = entry
+        
+        self.Bind(wx.EVT_BUTTON,  self.OnButton)
+
+    @DualTaskPanel.active.setter
+    @Traced("TypingTaskPanel.active")
+    def active(self, status):
+        self.task.active = status
+        if self.entry is not None and self.keys is not None:
+            if status == True:
+                with self.render:
+                    self.render.Enable(self.entry, True)
+                    for k in self.keys:
+                        self.render.Enable(k, True)
+                    self.SetUp()
+                self.onset = self.task.clock.Now()
+            elif status == False:
+                with self.render:
+                    self.render.Enable(self.entry, False)
+                    self.render.SetValue(self.entry, EMPTY_STRING)
+                    for k in self.keys:
+                        self.render.Enable(k, False)
+
+        
+    @Traced("TypingTaskPanel.SetUp")
+    def SetUp(self):
+        """Correctly sets up the panel according to the condition"""
+        if self.index >= 0:
+            if self.condition == EASY:
+                letter = self.word[self.index]
+                if TRACER.enabled:
+                    TRACER.Point("letter", letter)
+                self.render.SetValue(self.entry, letter)
+            elif self.condition == HARD:
+                if self.index == 0:
+                    self.render.SetValue(self.entry, self.word)
+                else:
+                    self.render.SetValue(self.entry, EMPTY_STRING)
+            else:
+                # Throw an exception
+                raise Exception("Wrong condition for panel '%s': %s" % (self,
+                                                                        self.condition))
+        else:
+            raise Exception("Wrong index for panel '%s': %d'"  % (self,
+                                                                  self.index))
+
+    @Traced("TypingTaskPanel.OnButton")
+    def OnButton(self, event):
+        """Updates the panel after pressing one of the buttons"""
+        self.Press(event.GetEventObject().GetLabel())
+        
+
+## ---------------------------------------------------------------- ##
+## SUBTRACTION PANEL
+## ---------------------------------------------------------------- ##
+        
+class SubtractionTaskPanel(DualTaskPanel):
+    """ A panel that implements the subtraction task of 
+    Borst et al. (2010)
+    """
+    def __init__(self, parent, id,
+                 trial = SubtractionTrial("easy", 8888888888, 7654321000),
+                 task = None):
+        if task is None:
+            task = SubtractionTask(trial = trial)
+        self.entry = None
+        self.text1 = None
+        self.text2 = None
+        super(SubtractionTaskPanel, self).__init__(parent=parent, id=id,
+                                                   task = task)
+        self.InitUI()
+
+
+    @property
+    def number1(self):
+        return self.task.number1
+
+    @property
+    def number2(self):
+        return self.task.number2
+
+    @property
+    def solution(self):
+        return self.task.solution
+    
+    @DualTaskPanel.active.setter
+    @Traced("SubtractionTaskPanel.active")
+    def active(self, status):
+        if type(status) == bool:
+            self.task.active = status
+            if self.text1 is not None and \
+            self.text2 is not None and \
+            self.entry is not None:
+                render = self.render
+                if status == False:
+                    with render:
+                        for t in self.text1:
+                            render.Enable(t, False)
+                            render.SetLabel(t, "*")
+                        for t in self.text2:
+                            render.Enable(t, False)
+                            render.SetLabel(t, "*")
+                        for k in self.keys:
+                            render.Enable(k, False)
+                        for t in self.text3:
+                            render.Enable(t, False)
+
+                        render.Enable(self.entry, False)
+                        render.SetValue(self.entry, EMPTY_STRING)
+
+                if status == True:
+                    with render:
+                        j = self.size - self.index # Digist up to index
+                        for i, t in enumerate(self.text1):
+                            render.Enable(t, True)
+                            if i < j:
+                                render.SetLabel(t, self.number1[i])
+                            else:
+                                render.SetLabel(t, "#")  # Mask the previous numbers
+
+                        for i, t in enumerate(self.text2):
+                            render.Enable(t, True)
+                            if i < j:
+                                render.SetLabel(t, self.number2[i])
+                            else:
+                                render.SetLabel(t, "#")
+
+                        for t in self.text3:
+                            render.Enable(t, True)
+                        for k in self.keys:
+                            render.Enable(k, True)
+
+                        render.Enable(self.entry, True)
+                        self.SetUp()
+                    self.onset = self.task.clock.Now()
+
+    def InitUI(self):
+        """Set up the panel UI"""
+        #self.SetBackgroundColour("#5555FF")
+        hbox = wx.BoxSizer(wx.HORIZONTAL)
+        vbox = wx.BoxSizer(wx.VERTICAL)
+        self.SetSizer(hbox)
+        
+        center = wx.Panel(self, -1, style=wx.SIMPLE_BORDER)
+        cvbox = wx.BoxSizer(wx.VERTICAL)
+        center.SetSizer(cvbox)
+
+        text1 = []   # Upper number
+        text2 = []   # Lower number
+        
+        for j in range(self.size):
+            text1.append(wx.StaticText(center,
+                                       -1,
+                                       self.number1[j],
+                                       ))
+
+        for j in range(self.size):
+            text2.append(wx.StaticText(center,
+                                       -1,
+                                       self.number2[j]))
+
+        nsizer = wx.GridSizer(2, self.size, 0, 0)
+        allt = text1 + text2
+
+        ksizer = wx.GridSizer(2, 1, 0, 0)
+        text3 = []
+        for char in ["-", "="]:
+            x = wx.StaticText(center, -1, char)
+            x.SetFont(self.monofont)
+            text3.append(x)
+            ksizer.Add(x)
+       
+                   
+        for t in allt:
+            t.SetFont(self.monofont)
+            nsizer.Add(t, 5)
+
+
+        entry = wx.TextCtrl(center, -1, style=wx.TE_RIGHT)
+        entry.SetFont(self.monofont)
+
+        vbox1 = wx.BoxSizer(wx.VERTICAL)
+        vbox1.Add(nsizer, 1, wx.ALIGN_RIGHT | wx.LEFT, border = 20)
+        vbox1.Add(entry, proportion = 0, flag=wx.EXPAND | wx.BOTTOM, border = 20)
+        
+        hbox1 = wx.BoxSizer(wx.HORIZONTAL)
+        hbox1.Add(vbox1, 0, wx.ALIGN_RIGHT | wx.EXPAND, border=20)
+        hbox1.Add(ksizer, 0, wx.ALIGN_RIGHT | wx.LEFT | wx.RIGHT, border=20)
+        cvbox.Add(hbox1, 0, wx.ALIGN_RIGHT)
+                
+        keyboard = wx.Panel(center, -1)
+        ksizer = wx.GridSizer(2, 5, 5, 5)
+        keyboard.SetSizer(ksizer)
+        keys = []
+        
+        for digit in string.digits:
+            b = wx.Button(keyboard, -1, digit)
+            b.SetFont(self.monofont)
+            ksizer.Add(b, 20)
+            keys.append(b)
+
+        cvbox.Add(keyboard, 0, wx.EXPAND | wx.ALL, border = 20)
+
+        vbox.Add((20, 20), wx.EXPAND)
+        vbox.Add(center, wx.ALIGN_CENTER)
+        vbox.Add((20, 20), wx.EXPAND)
+        
+        hbox.Add((20, 20), wx.EXPAND | wx.ALL)
+        hbox.Add(vbox)
+        hbox.Add((20, 20), wx.EXPAND | wx.ALL)
+        
+        # Save all the important elements in internal fields
+        self.entry = entry
+        self.text1 = text1
+        self.text2 = text2
+        self.text3 = text3
+        self.keys = keys
+        
+        self.Bind(wx.EVT_BUTTON,  self.OnButton)
+    
+
+    @Traced("SubtractionTaskPanel.SetUp")
+    def SetUp(self):
+        """Correctly sets up the panel according to the condition"""
+        if self.index >= 0:
+            if self.condition == EASY:
+                self.render.SetValue(self.entry, "#" * self.index)
+            elif self.condition == HARD:
+                self.render.SetValue(self.entry, EMPTY_STRING)
+            else:
+                # Throw an exception
+                pass
+
+    @Traced("SubtractionTaskPanel.OnButton")
+    def OnButton(self, event):
+        """Updates the panel after pressing one of the buttons"""
+        self.Press(event.GetEventObject().GetLabel())
+        
+
+## ---------------------------------------------------------------- ##
+## PAINTED PANELS
+## ---------------------------------------------------------------- ##
+## Alternative task panels that draw everything (digits, letters,
+## masks and keys) on a single double-buffered surface, blitting
+## characters from a cache of pre-rendered glyphs instead of
+## relabeling dozens of native widgets. Every redraw costs the same,
+## and the keys are hit-tested against the layout computed once.
+## ---------------------------------------------------------------- ##
+
+GLYPH_PAD = 4                 # Pixels around every glyph
+KEY_PAD = 8                   # Pixels between a key's glyph and border
+KEY_GAP = 5                   # Pixels between two keys
+MARGIN = 20
+BACKGROUND_COLOUR = "#FFFFFF"
+TEXT_COLOUR = "#000000"
+DISABLED_COLOUR = "#A0A0A0"
+
+
+class GlyphCache():
+    """Pre-rendered bitmaps of single characters in a font"""
+    caches = {}   # One cache per font
+
+    @classmethod
+    def ForFont(cls, font):
+        """Returns the (shared) glyph cache of a font"""
+        key = font.GetNativeFontInfoDesc()
+        if key not in cls.caches:
+            cls.caches[key] = GlyphCache(font)
+        return cls.caches[key]
+
+    def __init__(self, font):
+        self.font = font
+        self.glyphs = {}
+        dc = wx.MemoryDC(wx.Bitmap(1, 1))
+        dc.SetFont(font)
+        w, h = dc.GetTextExtent("W")   # Monospace: all glyphs are as wide
+        dc.SelectObject(wx.NullBitmap)
+        self.width = w + 2 * GLYPH_PAD
+        self.height = h + 2 * GLYPH_PAD
+
+    def Get(self, char, enabled = True):
+        """Returns the bitmap of a character, rendering it only once"""
+        key = (char, enabled)
+        bmp = self.glyphs.get(key)
+        if bmp is None:
+            bmp = self.Render(char, enabled)
+            self.glyphs[key] = bmp
+        return bmp
+
+    def Render(self, char, enabled):
+        bmp = wx.Bitmap(self.width, self.height)
+        dc = wx.MemoryDC(bmp)
+        dc.SetBackground(wx.Brush(BACKGROUND_COLOUR))
+        dc.Clear()
+        dc.SetFont(self.font)
+        if enabled:
+            dc.SetTextForeground(TEXT_COLOUR)
+        else:
+            dc.SetTextForeground(DISABLED_COLOUR)
+        w, h = dc.GetTextExtent(char)
+        dc.DrawText(char, (self.width - w) // 2, (self.height - h) // 2)
+        dc.SelectObject(wx.NullBitmap)
+        return bmp
+
+
+class PaintedTaskPanel(DualTaskPanel):
+    """A task panel painted from a glyph cache"""
+    def __init__(self, parent, id, task):
+        super(PaintedTaskPanel, self).__init__(parent=parent, id=id,
+                                               task = task)
+        self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+        self.glyphs = GlyphCache.ForFont(self.monofont)
+        self.keys = []    # (wx.Rect, character) of every key
+        self.InitUI()
+        self.Bind(wx.EVT_PAINT, self.OnPaint)
+        self.Bind(wx.EVT_LEFT_DOWN, self.OnLeftDown)
+
+    def LayoutKeys(self, chars, columns, x, y):
+        """Places a keypad at X, Y; returns its bottom-right corner"""
+        kw = self.glyphs.width + 2 * KEY_PAD
+        kh = self.glyphs.height + 2 * KEY_PAD
+        right = bottom = 0
+        for i, char in enumerate(chars):
+            r = wx.Rect(x + (i % columns) * (kw + KEY_GAP),
+                        y + (i // columns) * (kh + KEY_GAP),
+                        kw, kh)
+            self.keys.append((r, char))
+            right = max(right, r.GetRight())
+            bottom = max(bottom, r.GetBottom())
+        return right, bottom
+
+    @DualTaskPanel.active.setter
+    @Traced("PaintedTaskPanel.active")
+    def active(self, status):
+        self.task.active = status
+        self.SetUp()
+        if status == True:
+            self.onset = self.task.clock.Now()
+
+    @Traced("PaintedTaskPanel.SetUp")
+    def SetUp(self):
+        """Redraws the panel right away"""
+        self.Refresh(False)
+        self.Update()
+
+    def DrawText(self, dc, text, x, y, enabled = True):
+        """Blits the glyphs of TEXT, starting at X, Y"""
+        for i, char in enumerate(text):
+            dc.DrawBitmap(self.glyphs.Get(char, enabled),
+                          x + i * self.glyphs.width, y)
+
+    def DrawBox(self, dc, rect, text, enabled, right = False):
+        """Draws a text box, with left- or right-aligned TEXT"""
+        dc.SetPen(wx.Pen(TEXT_COLOUR if enabled else DISABLED_COLOUR))
+        dc.SetBrush(wx.Brush(BACKGROUND_COLOUR))
+        dc.DrawRectangle(rect)
+        x = rect.x + GLYPH_PAD
+        if right:
+            x = rect.GetRight() - GLYPH_PAD - len(text) * self.glyphs.width
+        self.DrawText(dc, text, x, rect.y + GLYPH_PAD, enabled)
+
+    def DrawKeys(self, dc, enabled):
+        dc.SetPen(wx.Pen(TEXT_COLOUR if enabled else DISABLED_COLOUR))
+        dc.SetBrush(wx.Brush(BACKGROUND_COLOUR))
+        for r, char in self.keys:
+            dc.DrawRectangle(r)
+            dc.DrawBitmap(self.glyphs.Get(char, enabled),
+                          r.x + KEY_PAD, r.y + KEY_PAD)
+
+    def OnPaint(self, event):
+        dc = wx.AutoBufferedPaintDC(self)
+        dc.SetBackground(wx.Brush(BACKGROUND_COLOUR))
+        dc.Clear()
+        self.Draw(dc)
+        self.Rendered()
+
+    def Draw(self, dc):
+        """Draws the panel's content. Does nothing, really"""
+        pass
+
+    @Traced("PaintedTaskPanel.OnLeftDown")
+    def OnLeftDown(self, event):
+        """Finds the key under the mouse, if any, and presses it"""
+        if self.active:
+            pos = event.GetPosition()
+            for r, char in self.keys:
+                if r.Contains(pos):
+                    self.Press(char)
+                    return
+        event.Skip()
+
+
+class PaintedTypingPanel(PaintedTaskPanel):
+    """A painted panel for the Typing Task"""
+    def __init__(self, parent, id, task):
+        super(PaintedTypingPanel, self).__init__(parent, id, task)
+
+    @property
+    def word(self):
+        return self.task.word
+
+    def InitUI(self):
+        gw, gh = self.glyphs.width, self.glyphs.height
+        self.entry = wx.Rect(MARGIN, MARGIN,
+                             self.size * gw + 2 * GLYPH_PAD, gh + 2 * GLYPH_PAD)
+        right, bottom = self.LayoutKeys(string.ascii_uppercase, 5,
+                                        MARGIN, self.entry.GetBottom() + MARGIN)
+        right = max(right, self.entry.GetRight())
+        self.SetMinSize((right + MARGIN, bottom + MARGIN))
+
+    def Draw(self, dc):
+        text = EMPTY_STRING
+        if self.active and 0 <= self.index < self.size:
+            if self.condition == EASY:
+                text = self.word[self.index]
+            elif self.condition == HARD and self.index == 0:
+                text = self.word
+        self.DrawBox(dc, self.entry, text, self.active)
+        self.DrawKeys(dc, self.active)
+
+
+class PaintedSubtractionPanel(PaintedTaskPanel):
+    """A painted panel for the subtraction task"""
+    def __init__(self, parent, id, task):
+        super(PaintedSubtractionPanel, self).__init__(parent, id, task)
+
+    @property
+    def number1(self):
+        return self.task.number1
+
+    @property
+    def number2(self):
+        return self.task.number2
+
+    def InitUI(self):
+        gw, gh = self.glyphs.width, self.glyphs.height
+        self.rows = (MARGIN, MARGIN + gh)    # Y of the two numbers
+        self.operators = MARGIN + self.size * gw + MARGIN
+        self.entry = wx.Rect(MARGIN, MARGIN + 2 * gh + KEY_GAP,
+                             self.size * gw + 2 * GLYPH_PAD, gh + 2 * GLYPH_PAD)
+        right, bottom = self.LayoutKeys(string.digits, 5,
+                                        MARGIN, self.entry.GetBottom() + MARGIN)
+        right = max(right, self.operators + gw)
+        self.SetMinSize((right + MARGIN, bottom + MARGIN))
+
+    def Draw(self, dc):
+        active = self.active
+        if active:
+            j = self.size - self.index   # Digits up to index
+            mask = lambda num: num[:j] + "#" * (self.size - j)
+            top = mask(self.number1)
+            bottom = mask(self.number2)
+        else:
+            top = bottom = "*" * self.size
+        self.DrawText(dc, top, MARGIN, self.rows[0], active)
+        self.DrawText(dc, bottom, MARGIN, self.rows[1], active)
+        self.DrawText(dc, "-", self.operators, self.rows[0], active)
+        self.DrawText(dc, "=", self.operators, self.rows[1], active)
+
+        text = EMPTY_STRING
+        if active and self.condition == EASY:
+            text = "#" * self.index
+        self.DrawBox(dc, self.entry, text, active, right = True)
+        self.DrawKeys(dc, active)
+
+
+## ---------------------------------------------------------------- ##
+## Input capture
+## ---------------------------------------------------------------- ##
+## Mouse events go to the window under the pointer, and key events
+## to the focused one, without propagating to the parents, so the
+## capture is bound to every widget inside a panel. The handlers skip
+## the events, so that the widgets still get them, and record the
+## pointer in screen coordinates, which are the same for all panels.
+## ---------------------------------------------------------------- ##
+
+MOUSE_BINDERS = ((wx.EVT_MOTION, "motion"),
+                 (wx.EVT_LEFT_DOWN, "left_down"),
+                 (wx.EVT_LEFT_UP, "left_up"),
+                 (wx.EVT_RIGHT_DOWN, "right_down"),
+                 (wx.EVT_RIGHT_UP, "right_up"),
+                 (wx.EVT_ENTER_WINDOW, "enter"),
+                 (wx.EVT_LEAVE_WINDOW, "leave"))
+KEY_BINDERS = ((wx.EVT_KEY_DOWN, "key_down"),
+               (wx.EVT_KEY_UP, "key_up"))
+
+class InputRecorder():
+    """Feeds the low-level input events of windows to an InputCapture"""
+    def __init__(self, capture):
+        self.capture = capture
+
+    def Attach(self, window, source, children = True):
+        """Captures the input of WINDOW (and, if CHILDREN, of all the
+        windows inside it) as coming from SOURCE, a name in
+        INPUT_SOURCES
+        """
+        code = INPUT_SOURCES.index(source)
+        pending = [window]
+        while pending:
+            w = pending.pop()
+            for binder, kind in MOUSE_BINDERS:
+                w.Bind(binder, self.MouseHandler(w, INPUT_KINDS.index(kind),
+                                                 code))
+            for binder, kind in KEY_BINDERS:
+                w.Bind(binder, self.KeyHandler(w, INPUT_KINDS.index(kind),
+                                               code))
+            if children:
+                pending.extend(w.GetChildren())
+
+    def MouseHandler(self, window, kind, source):
+        record = self.capture.Record
+        def handler(event):
+            pos = window.ClientToScreen(event.GetPosition())
+            record(kind, source, pos.x, pos.y)
+            event.Skip()
+        return handler
+
+    def KeyHandler(self, window, kind, source):
+        record = self.capture.Record
+        def handler(event):
+            pos = window.ClientToScreen(event.GetPosition())
+            record(kind, source, pos.x, pos.y, event.GetKeyCode())
+            event.Skip()
+        return handler
+
+
+## ---------------------------------------------------------------- ##
+## Dual Task frame
+## ---------------------------------------------------------------- ##
+## This is the main window for the experiment.
+## ---------------------------------------------------------------- ##
+
+class DualTaskFrame(wx.Frame):
+    """The main experiment's window"""
+    def __init__(self, parent, title, logfile=None, painted=False,
+                 trials="trials.yaml", trace=None, sample_rate=None):
+        """The main panel"""
+        self.painted = painted
+        self.trace = trace
+        self.stream = None
+        super(DualTaskFrame, self).__init__(parent, title=title, size=(1200,800))
+        self.bus = EventBus()
+        self.session = DualTaskSession(self.OpenTrials(trials), bus=self.bus)
+        binary = None
+        self.capture = None
+        self.journal = None
+        resumed = False
+        if logfile is not None:
+            binary = logfile + BINLOG_SUFFIX
+            resumed = self.Resume(logfile)
+            self.capture = InputCapture(logfile + INPUT_SUFFIX,
+                                        clock = self.session.clock)
+        self.logger = Logger(logfile, background=True, binary=binary,
+                             append=resumed)
+        if logfile is not None:
+            self.journal = SessionJournal(logfile + JOURNAL_SUFFIX)
+            self.session.journal = self.journal
+            self.journal.Append(self.session.State(JOURNAL_START))
+        self.latency = LatencyMonitor(self.session.clock)
+        self.scheduler = Scheduler(self.session.clock)
+        if sample_rate is not None and self.session.current_trial is not None:
+            self.StartSamples(sample_rate, logfile)
+        if self.session.current_trial is not None:
+            self.InitUI()
+            self.Centre()
+            self.Show()
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+
+    def Resume(self, logfile):
+        """Resumes the session of LOGFILE where its journal, if any,
+        and the log agree it was; returns whether it did
+        """
+        state = ResumeState(logfile + JOURNAL_SUFFIX, logfile,
+                            logfile + BINLOG_SUFFIX)
+        if state is None:
+            return False
+        if state.finished:
+            raise Exception("The session of '%s' is already finished"
+                            % logfile)
+        self.session.Resume(state)
+        return True
+
+    def StartSamples(self, rate, logfile=None):
+        """Starts the synthetic device (see samples.py) in a process
+        of its own, and takes in its samples, saved next to the log
+        """
+        import samples
+        self.ring = SampleRing.Create(len(samples.CHANNELS), rate)
+        pname = None
+        if logfile is not None:
+            pname = logfile + SAMPLE_SUFFIX
+        self.stream = SampleStream(self.ring, pname, self.session.clock)
+        self.stream.Follow(self.bus)
+        self.stream.Mark(self.session.clock.Now(), self.session.trial_number,
+                         self.session.active_task.task_name)
+        self.generator = samples.Start(self.ring.name, rate)
+
+    def StopSamples(self):
+        """Saves the last samples and stops the device"""
+        if self.stream is not None:
+            self.stream.Close()
+            self.ring.Close()
+            self.generator.wait()
+
+    def LoadTrials(self, fname="trials.yaml"):
+        """Loads a series of trials from a YAML file"""
+        return LoadTrials(fname)
+
+    def OpenTrials(self, fname="trials.yaml"):
+        """Opens the compiled trials, or streams the YAML if impossible"""
+        return OpenTrials(fname)
+
+        
+    def InitUI(self):
+        "Does the layout"
+        mainpanel = wx.Panel(self)
+        mainbox = wx.BoxSizer(wx.HORIZONTAL)
+        vbox = wx.BoxSizer(wx.VERTICAL)
+        hbox = wx.BoxSizer(wx.HORIZONTAL)
+
+        points = PointPanel(mainpanel, -1, session = self.session)
+        if self.painted:
+            typing = PaintedTypingPanel(mainpanel, -1, self.session.typing)
+        else:
+            typing = TypingTaskPanel(mainpanel, -1,
+                                     task = self.session.typing)
+        
+        hbox.Add(typing, 1, wx.EXPAND | wx.RIGHT, 10)
+        typing.active = self.session.typing.active
+        typing.bus = self.bus
+        typing.latency = self.latency
+        
+        if self.painted:
+            subtraction = PaintedSubtractionPanel(mainpanel, -1,
+                                                  self.session.subtraction)
+        else:
+            subtraction = SubtractionTaskPanel(mainpanel, -1,
+                                               task = self.session.subtraction)
+        hbox.Add(subtraction, 1, wx.EXPAND | wx.LEFT, 10)
+        subtraction.active = self.session.subtraction.active
+        subtraction.bus = self.bus
+        subtraction.latency = self.latency
+
+        vbox.Add((20, 20), 1, wx.EXPAND | wx.ALL)
+        vbox.Add(points, 0, wx.EXPAND | wx.BOTTOM, 10)
+        vbox.Add(hbox, 0, wx.TOP | wx.ALIGN_CENTER, 10)
+        vbox.Add((20, 20), 1, wx.EXPAND | wx.ALL)
+        
+        mainbox.Add((20, 20), 1, wx.EXPAND | wx.ALL)
+        mainbox.Add(vbox, 0, wx.EXPAND | wx.ALL | wx.ALIGN_CENTER)
+        mainbox.Add((20, 20), 1, wx.EXPAND | wx.ALL)
+        
+        mainpanel.SetSizer(mainbox)
+
+        self.typing = typing
+        self.subtraction = subtraction
+        self.points = points
+
+        # The next stimulus is shown synchronously, on the UI thread;
+        # the logger gets the responses on a worker thread of its own
+        self.bus.Subscribe(ResponseEvent, self.ProcessResponse, name="frame")
+        if self.logger.log is not None:
+            self.bus.Subscribe(ResponseEvent, self.LogResponse, queued=True,
+                               name="logger")
+
+        if self.capture is not None:
+            recorder = InputRecorder(self.capture)
+            recorder.Attach(mainpanel, "frame", children = False)
+            recorder.Attach(points, "points")
+            recorder.Attach(typing, "typing")
+            recorder.Attach(subtraction, "subtraction")
+        self.points.Start(self.scheduler)
+        if self.journal is not None:
+            # Replays need to know when the point decay started
+            tick = self.points.tick
+            self.journal.Append(self.session.State(JOURNAL_TICKER,
+                                                   tick.deadline - tick.period))
+        self.scheduler.Start()
+
+
+    @Traced("DualTaskFrame.ProcessResponse")
+    def ProcessResponse(self, event):
+        """Processes a subject's response"""
+        self.points.Decay(event.time)
+        self.session.ProcessResponse(event)
+
+        # Points are changed on the UI thread, so just show them
+        self.points.SetUp()
+
+        if self.session.finished:
+            # Quit --- we are done
+            self.points.active = False
+            self.scheduler.Stop()
+            self.bus.Close()
+            self.logger.Close()
+            if self.capture is not None:
+                self.capture.Close()
+            if self.journal is not None:
+                self.journal.Close()
+            self.StopSamples()
+            self.Report()
+            sys.exit()
+
+        # Just restart continue alternating
+        self.typing.active = self.session.typing.active
+        self.subtraction.active = self.session.subtraction.active
+
+    def LogResponse(self, event):
+        """Logs a response; called by the logger's subscriber thread"""
+        self.logger.LogData(event.LogRow())
+            
+    def OnClose(self, event):
+        """Stops the point clock and saves the log when the window closes"""
+        if hasattr(self, "points"):
+            self.points.active = False
+        self.scheduler.Stop()
+        self.bus.Close()
+        self.logger.Close()
+        if self.capture is not None:
+            self.capture.Close()
+        if self.journal is not None:
+            self.journal.Close()
+        self.StopSamples()
+        self.Report()
+        event.Skip()
+
+    def Report(self):
+        """Prints the latencies, the jitter of the point clock, the
+        event deliveries, the input capture, the samples and, if
+        tracing, the spans
+        """
+        print(self.latency.Summary())
+        if hasattr(self, "points") and self.points.tick is not None:
+            tick = self.points.tick
+            mean, late = tick.Jitter()
+            print("Point clock jitter (ms) over %d ticks: mean %.3f, max %.3f"
+                  % (tick.calls, mean / 1e6, late / 1e6))
+        print(self.bus.Summary())
+        if self.capture is not None:
+            print(self.capture.Summary())
+        if self.stream is not None:
+            print(self.stream.Summary())
+        if TRACER.enabled:
+            print(TRACER.Summary())
+            if self.trace is not None:
+                TRACER.WriteChromeTrace(self.trace)
+
+
+def Main():
+    parser = argparse.ArgumentParser(description="The Dual Task experiment")
+    parser.add_argument("logfile", nargs="?", default=None,
+                        help="Log of the session; an unfinished session "
+                        "with this log is resumed")
+    parser.add_argument("--painted", action="store_true",
+                        help="Use the painted, glyph-cached panels")
+    parser.add_argument("--trials", default="trials.yaml",
+                        help="YAML or compiled (%s) trial list" % TRIALS_SUFFIX)
+    parser.add_argument("--trace", default=None,
+                        help="Trace the session into this Chrome trace file")
+    parser.add_argument("--samples", type=int, default=None, metavar="RATE",
+                        help="Take in a synthetic sample stream at RATE Hz")
+    args = parser.parse_args()
+
+    if args.trace is not None:
+        TRACER.Enable()
+
+    app = wx.App()
+    e = DualTaskFrame(None, "Dual Task", logfile = args.logfile,
+                      painted = args.painted, trials = args.trials,
+                      trace = args.trace, sample_rate = args.samples)
+    app.MainLoop()
+
+
+if __name__ == "__main__":
+    Main()
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## Fits a threaded-cognition model to the keystrokes of session logs.
+## ---------------------------------------------------------------- ##
+## The time between two keystrokes (the inter-key interval) is
+## log-normal, and its mean is the sum of:
+##
+##   typing, subtraction   Time of a keystroke of that task
+##   hard                  Extra time of a keystroke in the hard
+##                         condition, which needs a problem state
+##   interference          Extra time when the other task needs a
+##                         problem state too, so that it has to be
+##                         restored (both tasks hard)
+##   switch                Extra time when the task differs from the
+##                         one of the previous keystroke
+##
+## The log-normal sigma is not searched: for every mean it has a
+## closed-form maximum likelihood, which is used.
+##
+## The mean of a keystroke only depends on its type (task, own and
+## other condition, switch), so a log is first reduced to the count,
+## sum and sum of squares of log-intervals of every type. The
+## likelihood of a whole grid of parameters is then computed from
+## those, at once, no matter how many keystrokes there are. The grid
+## is refined around its best point REFINE times.
+##
+## Participants are fitted in parallel by a pool of processes, and
+## the fits are cached (CACHE_NAME, in the log directory) per log and
+## per grid, as in analyze.py: a log is only fitted again when it
+## changes, or with a grid it was never fitted on.
+##
+## In the standard sessions the tasks alternate after every key, so
+## every interval but the first is a switch, and the switch cost
+## cannot be told apart from the keystroke times. It is therefore
+## fixed at 0 by default; search it (--grid switch=0,1,11) only on
+## designs where the same task can be answered twice in a row.
+## ---------------------------------------------------------------- ##
+
+import os
+import sys
+import json
+import argparse
+import concurrent.futures
+import numpy as np
+
+import dual
+import analyze
+
+
+CACHE_NAME = ".fit-cache.json"
+CACHE_VERSION = 1
+PARAMETERS = ("typing", "subtraction", "hard", "interference", "switch")
+
+# Searched values of every parameter (seconds), as (low, high, steps)
+DEFAULT_GRID = {"typing" : (0.05, 2.0, 14),
+                "subtraction" : (0.05, 3.0, 14),
+                "hard" : (0.0, 1.5, 11),
+                "interference" : (0.0, 1.0, 11),
+                "switch" : (0.0, 0.0, 1)}
+REFINE = 4             # Times the grid is zoomed around its best point
+GRID_CHUNK = 65536     # Grid points evaluated at once
+
+TYPING = dual.TASK_CODES.index("typing")
+HARD = dual.CONDITION_CODES.index("hard")
+NTYPES = 16            # Task, hard, other task hard, switch
+
+
+## ---------------------------------------------------------------- ##
+## Data
+## ---------------------------------------------------------------- ##
+
+def LastOf(mask, values):
+    """For every row, the value of the last row (up to it) in MASK,
+    or -1 if there is none yet
+    """
+    n = len(mask)
+    last = np.maximum.accumulate(np.where(mask, np.arange(n), -1))
+    return np.where(last >= 0, values[np.maximum(last, 0)], -1)
+
+
+def Keystrokes(log, correct_only=True):
+    """The type and log-interval of every keystroke of a log (in the
+    columns of analyze.ReadLog); the first keystroke has no interval
+    """
+    order = np.argsort(log["time"], kind="stable")
+    task = log["task"][order].astype(np.int64)
+    cond = log["condition"][order].astype(np.int64)
+    tme = log["time"][order]
+
+    hard = cond == HARD
+    typing = task == TYPING
+    # The condition of the other task is the one of its last keystroke
+    other = np.where(typing, LastOf(~typing, cond), LastOf(typing, cond))
+    switch = np.r_[False, task[1:] != task[:-1]]
+    kind = typing * 8 + hard * 4 + (hard & (other == HARD)) * 2 + switch
+
+    iki = np.diff(tme, prepend=np.nan)
+    keep = ~np.isnan(iki) & (iki > 0)
+    if correct_only:
+        keep &= log["correct"][order]
+    return kind[keep], np.log(iki[keep])
+
+
+def Statistics(kind, y):
+    """Count, sum and sum of squares of Y for every keystroke type"""
+    return (np.bincount(kind, minlength=NTYPES).astype(np.float64),
+            np.bincount(kind, weights=y, minlength=NTYPES),
+            np.bincount(kind, weights=y * y, minlength=NTYPES))
+
+
+def Design():
+    """(NTYPES, len(PARAMETERS)) matrix: which parameters add to the
+    mean interval of every keystroke type
+    """
+    X = np.zeros((NTYPES, len(PARAMETERS)))
+    for k in range(NTYPES):
+        typing, hard, both, switch = k >> 3 & 1, k >> 2 & 1, k >> 1 & 1, k & 1
+        X[k] = [typing, 1 - typing, hard, both, switch]
+    return X
+
+DESIGN = Design()
+
+
+## ---------------------------------------------------------------- ##
+## Likelihood
+## ---------------------------------------------------------------- ##
+
+def LogLikelihood(theta, stats):
+    """Log-likelihood of every row of THETA (points, parameters) and
+    the maximum-likelihood sigma of each, from the statistics of a
+    participant. Points with a non-positive mean get -inf.
+    """
+    n, s1, s2 = stats
+    seen = n > 0
+    K = n.sum()
+    mean = theta @ DESIGN[seen].T                  # (points, types)
+    valid = (mean > 0).all(axis=1)
+    L = np.log(np.where(mean > 0, mean, 1.0))
+
+    # Sums over the keystrokes of (y - log mean) and its square
+    n, s1, s2 = n[seen], s1[seen], s2[seen]
+    d1 = s1.sum() - L @ n
+    d2 = s2.sum() - 2 * (L @ s1) + (L * L) @ n
+
+    # With mu = log(mean) - sigma^2 / 2, the likelihood is maximized
+    # by sigma^2 = 2 (sqrt(1 + d2 / K) - 1)
+    var = 2 * (np.sqrt(1 + np.maximum(d2, 0) / K) - 1)
+    var = np.maximum(var, 1e-12)
+    c = var / 2
+    ll = (-s1.sum() - K / 2 * np.log(2 * np.pi) - K / 2 * np.log(var)
+          - (d2 + 2 * c * d1 + K * c * c) / (2 * var))
+    return np.where(valid, ll, -np.inf), np.sqrt(var)
+
+
+def Axes(grid):
+    return [np.linspace(*grid[p]) for p in PARAMETERS]
+
+
+def Search(stats, grid):
+    """The best point of GRID, as (log-likelihood, sigma, theta)"""
+    axes = Axes(grid)
+    shape = [len(a) for a in axes]
+    total = int(np.prod(shape))
+    best = (-np.inf, None, None)
+    for start in range(0, total, GRID_CHUNK):
+        index = np.unravel_index(np.arange(start, min(total,
+                                                      start + GRID_CHUNK)),
+                                 shape)
+        theta = np.stack([a[i] for a, i in zip(axes, index)], axis=1)
+        ll, sigma = LogLikelihood(theta, stats)
+        i = int(np.argmax(ll))
+        if ll[i] > best[0]:
+            best = (float(ll[i]), float(sigma[i]), theta[i])
+    return best
+
+
+def Zoom(grid, theta, bounds):
+    """A grid as fine as GRID around THETA, one step either side"""
+    zoomed = {}
+    for p, v in zip(PARAMETERS, theta):
+        low, high, steps = grid[p]
+        if steps < 2:
+            zoomed[p] = grid[p]
+            continue
+        step = (high - low) / (steps - 1)
+        zoomed[p] = (max(bounds[p][0], v - step),
+                     min(bounds[p][1], v + step), steps)
+    return zoomed
+
+
+def Fit(stats, grid=DEFAULT_GRID, refine=REFINE):
+    """Fits the statistics of a participant; returns a dict with the
+    parameters, sigma, log-likelihood, number of keystrokes and AIC
+    """
+    K = int(stats[0].sum())
+    result = {"n" : K}
+    if K == 0:
+        return result
+    current = grid
+    ll, sigma, theta = Search(stats, current)
+    for r in range(refine):
+        if theta is None:
+            break
+        current = Zoom(current, theta, grid)
+        better = Search(stats, current)
+        if better[0] >= ll:
+            ll, sigma, theta = better
+    if theta is None:
+        return result
+    free = sum(1 for p in PARAMETERS if grid[p][2] > 1) + 1
+    result.update(zip(PARAMETERS, [float(v) for v in theta]))
+    result["sigma"] = sigma
+    result["loglik"] = ll
+    result["aic"] = 2 * free - 2 * ll
+    return result
+
+
+def FitLog(args):
+    """Fits one log file; ARGS is (fname, grid, refine, correct_only)"""
+    fname, grid, refine, correct_only = args
+    kind, y = Keystrokes(analyze.ReadLog(fname), correct_only)
+    return Fit(Statistics(kind, y), grid, refine)
+
+
+## ---------------------------------------------------------------- ##
+## Study
+## ---------------------------------------------------------------- ##
+
+def GridKey(grid, refine, correct_only):
+    """What a cached fit must have been made with"""
+    return json.dumps({"grid" : [list(grid[p]) for p in PARAMETERS],
+                       "refine" : refine,
+                       "correct_only" : correct_only}, sort_keys=True)
+
+
+def FitStudy(directory, grid=DEFAULT_GRID, refine=REFINE, correct_only=True,
+             workers=None, use_hash=False, cache_name=None):
+    """Fits all the logs of DIRECTORY, using and updating the cache.
+    Returns the rows of the table, the number of logs, and the number
+    of logs that had to be fitted.
+    """
+    if cache_name is None:
+        cache_name = os.path.join(directory, CACHE_NAME)
+    cache = analyze.LoadCache(cache_name, CACHE_VERSION)
+    logs = analyze.FindLogs(directory)
+    key = GridKey(grid, refine, correct_only)
+
+    todo = []
+    signatures = {}
+    for path in logs:
+        name = os.path.basename(path)
+        signatures[name] = analyze.Signature(path, use_hash)
+        entry = cache.get(name)
+        if entry is None or entry["signature"] != signatures[name]:
+            entry = cache[name] = {"signature" : signatures[name], "fits" : {}}
+        if key not in entry["fits"]:
+            todo.append(path)
+
+    if todo:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        chunk = max(1, len(todo) // (4 * workers))
+        jobs = [(path, grid, refine, correct_only) for path in todo]
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            for path, result in zip(todo, pool.map(FitLog, jobs,
+                                                   chunksize=chunk)):
+                cache[os.path.basename(path)]["fits"][key] = result
+
+    # Forget the logs that are gone
+    for name in list(cache):
+        if name not in signatures:
+            del cache[name]
+    if todo or len(cache) != len(signatures):
+        analyze.SaveCache(cache, cache_name, CACHE_VERSION)
+
+    table = []
+    for path in logs:
+        name = os.path.basename(path)
+        participant = os.path.splitext(name)[0]
+        table.append(dict(cache[name]["fits"][key], participant=participant))
+    return table, len(logs), len(todo)
+
+
+def ParseGrid(specs):
+    """Parses NAME=LOW,HIGH,STEPS (or NAME=VALUE, to fix it) options
+    into a copy of DEFAULT_GRID
+    """
+    grid = dict(DEFAULT_GRID)
+    for spec in specs:
+        name, sep, values = spec.partition("=")
+        if name not in grid or not sep:
+            raise Exception("Invalid grid '%s': parameters are %s" %
+                            (spec, ", ".join(PARAMETERS)))
+        values = values.split(",")
+        if len(values) == 1:
+            grid[name] = (float(values[0]), float(values[0]), 1)
+        elif len(values) == 3:
+            grid[name] = (float(values[0]), float(values[1]), int(values[2]))
+        else:
+            raise Exception("Invalid grid '%s'" % spec)
+    return grid
+
+
+COLUMNS = ("participant", "n") + PARAMETERS + ("sigma", "loglik", "aic")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fits the session logs")
+    parser.add_argument("directory")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Tab-separated table (default: standard output)")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--grid", action="append", default=[],
+                        help="NAME=LOW,HIGH,STEPS or NAME=VALUE (repeatable)")
+    parser.add_argument("--refine", type=int, default=REFINE)
+    parser.add_argument("--all-keys", action="store_true",
+                        help="Also fit the intervals of wrong keystrokes")
+    parser.add_argument("--hash", action="store_true",
+                        help="Validate the cache by content, not by mtime")
+    args = parser.parse_args()
+
+    table, nlogs, fitted = FitStudy(args.directory, ParseGrid(args.grid),
+                                    args.refine, not args.all_keys,
+                                    args.workers, args.hash)
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        out.write("\t".join(COLUMNS) + "\n")
+        for row in table:
+            out.write("\t".join([analyze.FormatValue(row.get(c))
+                                 for c in COLUMNS]) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    sys.stderr.write("%d logs, %d fitted\n" % (nlogs, fitted))
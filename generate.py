@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## Generates trial lists for many participants at once.
+## ---------------------------------------------------------------- ##
+## Every participant gets the four combinations of typing and
+## subtraction conditions equally often. The order of the
+## combinations is counterbalanced with a balanced Latin square:
+## block B of participant P follows row (P + B) of the square.
+##
+##  - Hard typing trials are real 10-letter words; easy ones are
+##    scrambles of other words, sharing no bigram with the word they
+##    come from (see lexicon.py).
+##  - Easy subtractions need no borrowing; in hard ones, a number
+##    of columns (see HARD_BORROWS) need a borrow (see borrows.py).
+##
+## All the random draws are NumPy arrays over trials. Every
+## participant is generated with a seed of its own, derived from the
+## main seed and the participant's number, so the list of a
+## participant only depends on those two. With --unique, no word is
+## given to more than one participant: participants are then drawn
+## together, in chunks, and lists also depend on the participants
+## generated before.
+## ---------------------------------------------------------------- ##
+
+import os
+import hashlib
+import argparse
+import numpy as np
+
+import dual
+import lexicon
+import borrows
+
+
+HARD_BORROWS = (3, 6)    # Smallest and largest number of borrows
+CHUNK = 10000            # Participants generated at once, with --unique
+
+# The four combinations of (typing, subtraction) conditions
+COMBINATIONS = (("easy", "easy"), ("easy", "hard"),
+                ("hard", "easy"), ("hard", "hard"))
+
+# Balanced Latin square for four conditions: every combination
+# comes first once, and follows every other one once.
+LATIN_SQUARE = np.array([[0, 1, 3, 2],
+                         [1, 2, 0, 3],
+                         [2, 3, 1, 0],
+                         [3, 0, 2, 1]])
+
+# Same layout as dual.TRIAL_CACHE_RECORD
+RECORD_DTYPE = np.dtype([("typing", np.uint8),
+                         ("subtraction", np.uint8),
+                         ("word", "S10"),
+                         ("number1", "S10"),
+                         ("number2", "S10")])
+assert RECORD_DTYPE.itemsize == dual.TRIAL_CACHE_RECORD.size
+
+
+def Conditions(first, n, ntrials):
+    """Returns the (typing, subtraction) condition codes of the trials
+    of N participants, starting from participant FIRST.
+    """
+    participants = np.arange(first, first + n)[:, None]
+    blocks = np.arange(ntrials // 4)[None, :]
+    rows = (participants + blocks) % 4
+    combos = LATIN_SQUARE[rows].reshape(n, -1)
+    codes = np.array([[dual.CONDITION_CODES.index(t),
+                       dual.CONDITION_CODES.index(s)]
+                      for t, s in COMBINATIONS], dtype=np.uint8)
+    return codes[combos, 0], codes[combos, 1]
+
+
+def DistinctRows(rng, n, k, high):
+    """Returns N rows of K distinct integers in [0, HIGH)"""
+    if k > high:
+        raise Exception("Cannot pick %d distinct words out of %d" % (k, high))
+    idx = rng.integers(0, high, size=(n, k))
+    while True:
+        srt = np.sort(idx, axis=1)
+        bad = np.flatnonzero((srt[:, 1:] == srt[:, :-1]).any(axis=1))
+        if len(bad) == 0:
+            return idx
+        # Duplicates are rare: only draw those rows again
+        idx[bad] = rng.integers(0, high, size=(len(bad), k))
+
+
+def Subtractions(rng, hard):
+    """Returns the digits of the two numbers of every subtraction.
+    Easy ones have no borrows, HARD ones (a boolean array) between
+    HARD_BORROWS[0] and HARD_BORROWS[1], in random columns.
+    """
+    counts = np.where(hard,
+                      rng.integers(HARD_BORROWS[0], HARD_BORROWS[1] + 1,
+                                   size=hard.shape),
+                      0)
+    return borrows.Construct(rng, borrows.Profiles(rng, counts))
+
+
+def Words(lex, rng, easy, band=None, unique=False):
+    """Returns the letters of the typing trials, an (N, NTRIALS, 10)
+    array. Every trial of a participant gets a different word, and
+    the EASY ones a scramble of it.
+    """
+    n, ntrials = easy.shape
+    letters = np.empty((n, ntrials, lexicon.WORD_LENGTH), dtype=np.uint8)
+    if unique:
+        idx, letters[easy] = lex.Draw(int(easy.sum()), band, True, rng)
+        letters[~easy] = lex.letters[lex.Draw(int((~easy).sum()), band)]
+        return letters
+
+    words = np.flatnonzero(lex.bands == band) if band is not None \
+        else np.arange(len(lex))
+    todo = np.arange(n)
+    while len(todo):
+        idx = words[DistinctRows(rng, len(todo), ntrials, len(words))]
+        scrambles = lex.Scramble(idx[easy[todo]], rng)
+        rows = lex.letters[idx]
+        rows[easy[todo]] = scrambles
+        letters[todo] = rows
+        # Participants who got an unscramblable word are drawn again
+        bad = (lex.unscramblable[idx] & easy[todo]).any(axis=1)
+        words = words[~lex.unscramblable[words]]
+        todo = todo[bad]
+    return letters
+
+
+def Generate(lex, first, n, ntrials, seed, band=None, unique=False):
+    """Generates the trials of N participants, starting from FIRST.
+    Returns an (N, NTRIALS) array of RECORD_DTYPE.
+    """
+    rng = np.random.default_rng([seed, first])
+    tcond, scond = Conditions(first, n, ntrials)
+
+    easy = tcond == dual.CONDITION_CODES.index("easy")
+    letters = Words(lex, rng, easy, band, unique)
+
+    hard = scond == dual.CONDITION_CODES.index("hard")
+    top, bottom = Subtractions(rng, hard)
+
+    records = np.empty((n, ntrials), dtype=RECORD_DTYPE)
+    records["typing"] = tcond
+    records["subtraction"] = scond
+    records["word"] = letters.view("S10")[..., 0]
+    records["number1"] = borrows.Numbers(top)
+    records["number2"] = borrows.Numbers(bottom)
+    return records
+
+
+def Answers(records):
+    """The typing and subtraction answers of the records, as the
+    AnswerKey blocks of the compiled format
+    """
+    typing = np.char.upper(records["word"])
+    diff = records["number1"].astype(np.int64) - \
+        records["number2"].astype(np.int64)
+    subtraction = np.char.zfill(diff.astype("S10"), 10)
+    return typing.tobytes(), subtraction.tobytes()
+
+
+def WriteBinary(records, fname):
+    """Writes one participant's trials in the compiled trial format"""
+    data = records.tobytes()
+    digest = hashlib.sha256(data).digest()
+    typing, subtraction = Answers(records)
+    with open(fname, 'wb') as out:
+        out.write(dual.TRIAL_CACHE_HEADER.pack(dual.TRIAL_CACHE_MAGIC,
+                                               digest, len(records)))
+        out.write(data)
+        out.write(typing)
+        out.write(subtraction)
+
+
+YAML_ENTRY = """- typing:
+      condition : %s
+      word : %s
+  subtraction:
+      condition : %s
+      number1 : "%s"
+      number2 : "%s"
+"""
+
+def WriteYAML(records, fname):
+    """Writes one participant's trials in the layout of trials.yaml"""
+    names = dual.CONDITION_CODES
+    with open(fname, 'w') as out:
+        out.write("".join([YAML_ENTRY % (names[r["typing"]],
+                                         r["word"].decode("ascii"),
+                                         names[r["subtraction"]],
+                                         r["number1"].decode("ascii"),
+                                         r["number2"].decode("ascii"))
+                           for r in records]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates trial lists")
+    parser.add_argument("outdir")
+    parser.add_argument("-n", type=int, default=1,
+                        help="Number of participants")
+    parser.add_argument("--trials", type=int, default=40,
+                        help="Trials per participant (a multiple of 4)")
+    parser.add_argument("--words", default="words.txt",
+                        help="Word list, one word (and count) per line")
+    parser.add_argument("--band", type=int, default=None,
+                        help="Only use words from this frequency band")
+    parser.add_argument("--unique", action="store_true",
+                        help="Never give the same word to two participants")
+    parser.add_argument("--exclude", action="append", default=[],
+                        help="Word list of words not to be used")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--first", type=int, default=0,
+                        help="Number of the first participant")
+    parser.add_argument("--format", choices=("yaml", "binary"),
+                        default="binary")
+    args = parser.parse_args()
+
+    if args.trials % 4 != 0:
+        parser.error("--trials must be a multiple of 4")
+
+    lex = lexicon.LoadLexicon(args.words, seed=args.seed)
+    if args.band is not None and not 0 <= args.band < lex.nbands:
+        parser.error("--band must be between 0 and %d" % (lex.nbands - 1))
+    for fname in args.exclude:
+        with open(fname, 'r') as stream:
+            lex.Exclude([line.split()[0].lower()
+                         for line in stream if line.strip()])
+    if not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+
+    if args.format == "yaml":
+        write, suffix = WriteYAML, ".yaml"
+    else:
+        write, suffix = WriteBinary, dual.TRIALS_SUFFIX
+
+    # Unless words are unique, every participant is generated alone,
+    # so that its list does not depend on --first and -n
+    p = args.first
+    last = args.first + args.n
+    while p < last:
+        size = min(CHUNK, last - p) if args.unique else 1
+        records = Generate(lex, p, size, args.trials, args.seed,
+                           args.band, args.unique)
+        for q in range(p, p + size):
+            write(records[q - p],
+                  os.path.join(args.outdir, "participant-%06d%s" % (q, suffix)))
+        p += size
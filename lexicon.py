@@ -0,0 +1,215 @@
+## ---------------------------------------------------------------- ##
+## An indexed lexicon of 10-letter words for the typing task.
+## ---------------------------------------------------------------- ##
+## The word list is read once and kept as NumPy arrays:
+##
+##  - the letters of every word, as an (N, 10) array of uint8;
+##  - its letter multiset (the sorted letters), which groups anagrams;
+##  - its set of bigrams, as nine integer codes;
+##  - its frequency band, from the counts in the list or, when there
+##    are none, from the order of the words (most frequent first).
+##
+## Every band keeps its words in a shuffled pool with a cursor, so
+## drawing N unused words costs O(N), whatever the size of the list.
+## Words are marked as used when drawn (or excluded explicitly), so
+## that they are never given again, also to other participants.
+## ---------------------------------------------------------------- ##
+
+import numpy as np
+
+
+WORD_LENGTH = 10
+NBANDS = 5               # Frequency bands, 0 being the most frequent
+SCRAMBLE_ROUNDS = 64     # Attempts before a word is declared unscramblable
+
+LETTERS = 26
+
+
+def Bigrams(letters):
+    """Returns the bigram codes of an (..., L) array of letters"""
+    codes = letters.astype(np.int32) - ord("a")
+    return codes[..., :-1] * LETTERS + codes[..., 1:]
+
+
+class Lexicon():
+    """An index of the 10-letter words in a word list"""
+    def __init__(self, words, counts=None, nbands=NBANDS, seed=None):
+        """WORDS is a sequence of distinct lowercase words; COUNTS,
+        when given, their frequencies. Otherwise, the words are
+        assumed to be sorted by decreasing frequency.
+        """
+        n = len(words)
+        if n == 0:
+            raise Exception("No %d-letter words in the lexicon" % WORD_LENGTH)
+        self.words = np.array(words, dtype="S%d" % WORD_LENGTH)
+        self.letters = self.words.view(np.uint8).reshape(n, WORD_LENGTH)
+        self.multisets = np.sort(self.letters, axis=1).view("S%d" % WORD_LENGTH)[:, 0]
+        self.bigrams = np.sort(Bigrams(self.letters), axis=1)
+        self.order = np.argsort(self.words)
+
+        # Frequency bands of (nearly) equal size
+        if counts is None:
+            rank = np.arange(n)
+        else:
+            order = np.argsort(-np.asarray(counts), kind="stable")
+            rank = np.empty(n, dtype=np.int64)
+            rank[order] = np.arange(n)
+        self.nbands = nbands
+        self.bands = (rank * nbands // n).astype(np.uint8)
+
+        # Words sharing their multiset with another word: a scramble
+        # of theirs must not be one of the others
+        _, inverse, sizes = np.unique(self.multisets, return_inverse=True,
+                                      return_counts=True)
+        self.anagrams = sizes[inverse] > 1
+        self.anagram_words = set(self.words[self.anagrams].tolist())
+
+        self.used = np.zeros(n, dtype=bool)
+        self.unscramblable = np.zeros(n, dtype=bool)
+
+        rng = np.random.default_rng(seed)
+        self.pools = []
+        self.cursors = np.zeros(nbands, dtype=np.int64)
+        for b in range(nbands):
+            pool = np.flatnonzero(self.bands == b)
+            rng.shuffle(pool)
+            self.pools.append(pool)
+
+    def __len__(self):
+        return len(self.words)
+
+    @property
+    def available(self):
+        """Number of words not used yet"""
+        return int((~self.used).sum())
+
+    def Word(self, i):
+        return self.words[i].decode("ascii")
+
+    def Lookup(self, words):
+        """Returns the indices of WORDS (-1 for words not in the lexicon)"""
+        words = np.asarray(words, dtype="S%d" % WORD_LENGTH)
+        pos = np.searchsorted(self.words, words, sorter=self.order)
+        pos = np.minimum(pos, len(self.words) - 1)
+        idx = self.order[pos]
+        return np.where(self.words[idx] == words, idx, -1)
+
+    def Exclude(self, words):
+        """Marks WORDS (strings, or indices) as used"""
+        idx = np.asarray(words)
+        if idx.dtype.kind in "SU":
+            idx = self.Lookup(idx)
+            idx = idx[idx >= 0]
+        self.used[idx] = True
+
+    def Draw(self, n, band=None, scrambled=False, rng=None):
+        """Draws N unused words, from the given frequency BAND or from
+        all bands in turn. Returns their indices, marking them as used,
+        and, if SCRAMBLED, also their scrambles (see Scramble).
+        """
+        bands = list(range(self.nbands)) if band is None else [band]
+        out = []
+        need = n
+        while need > 0:
+            # Spread what is missing over the bands that still have words
+            share = -(-need // len(bands))
+            left = []
+            for b in bands:
+                got = self.Take(b, min(share, need), scrambled)
+                out.append(got)
+                need -= len(got)
+                if self.cursors[b] < len(self.pools[b]):
+                    left.append(b)
+            if need > 0 and not left:
+                raise Exception("Only %d unused words left" % (n - need))
+            bands = left
+        idx = np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
+        if not scrambled:
+            return idx
+
+        letters = self.Scramble(idx, rng)
+        # Words that turned out unscramblable are replaced
+        bad = self.unscramblable[idx]
+        if bad.any():
+            more, extra = self.Draw(int(bad.sum()), band, True, rng)
+            idx[bad] = more
+            letters[bad] = extra
+        return idx, letters
+
+    def Take(self, band, n, scrambled=False):
+        """Takes up to N unused words from the pool of BAND"""
+        pool = self.pools[band]
+        c = self.cursors[band]
+        taken = []
+        need = n
+        while need > 0 and c < len(pool):
+            chunk = pool[c:c + need]
+            c += len(chunk)
+            keep = ~self.used[chunk]
+            if scrambled:
+                keep &= ~self.unscramblable[chunk]
+            chunk = chunk[keep]
+            taken.append(chunk)
+            need -= len(chunk)
+        self.cursors[band] = c
+        idx = np.concatenate(taken) if taken else np.zeros(0, dtype=np.int64)
+        self.used[idx] = True
+        return idx
+
+    def Scramble(self, idx, rng=None):
+        """Returns scrambles of the words IDX as an (N, 10) letter array.
+        A scramble shares no bigram with its word, and is not a word
+        of the lexicon. Words for which none is found are flagged in
+        self.unscramblable (and returned unchanged).
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        idx = np.asarray(idx)
+        letters = self.letters[idx]
+        out = letters.copy()
+        todo = np.arange(len(idx))
+        for _ in range(SCRAMBLE_ROUNDS):
+            if len(todo) == 0:
+                break
+            perm = rng.random((len(todo), WORD_LENGTH)).argsort(axis=1)
+            cand = np.take_along_axis(letters[todo], perm, axis=1)
+
+            # Compare the 9 bigrams of the candidate with the 9 of the word
+            shared = (Bigrams(cand)[:, :, None] ==
+                      self.bigrams[idx[todo]][:, None, :]).any(axis=(1, 2))
+            ok = ~shared
+            if self.anagram_words:
+                check = np.flatnonzero(ok & self.anagrams[idx[todo]])
+                for k in check:
+                    if cand[k].tobytes() in self.anagram_words:
+                        ok[k] = False
+            out[todo[ok]] = cand[ok]
+            todo = todo[~ok]
+        self.unscramblable[idx[todo]] = True
+        return out
+
+
+def LoadLexicon(fname, nbands=NBANDS, seed=None):
+    """Reads a word list, one word per line, optionally followed by
+    its frequency count. Only lowercase 10-letter words are kept.
+    """
+    words = []
+    counts = []
+    seen = set()
+    with open(fname, 'r') as stream:
+        for line in stream:
+            fields = line.split()
+            if not fields:
+                continue
+            w = fields[0].lower()
+            if len(w) != WORD_LENGTH or not w.isalpha() or not w.isascii():
+                continue
+            if w in seen:
+                continue
+            seen.add(w)
+            words.append(w)
+            if len(fields) > 1:
+                counts.append(float(fields[1]))
+    if counts and len(counts) != len(words):
+        raise Exception("Word list '%s' has counts for some words only" % fname)
+    return Lexicon(words, counts or None, nbands, seed)
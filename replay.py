@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## Replays logged sessions through the task logic.
+## ---------------------------------------------------------------- ##
+## The responses of a log are given again, with their own times, to
+## a DualTaskSession running on a VirtualClock. The point decay runs
+## on a Scheduler that is advanced up to every response, so a
+## session is replayed as fast as the logic allows, and always with
+## the same result.
+##
+## Every replayed response is logged again, and compared with the
+## original row: task, condition, correctness, index and times must
+## be identical. The rules (points per correct response, decay and
+## tick) can be changed, to score old data in a new way.
+##
+## If the session journal is next to the log, the point ticker is
+## started (and restarted, after a resume) when the journal says it
+## was, and the points are checked against every state it holds
+## (unless the rules were changed).
+## Without a journal, --tick-offset gives the start of the ticker.
+## ---------------------------------------------------------------- ##
+
+import argparse
+
+import dual
+
+
+LOG_FIELDS = 7   # Fields of a row written by the panels, after stddata
+
+
+class LoggedResponse():
+    """One row of a log"""
+    def __init__(self, task, condition, response, correct, time, rt, index):
+        self.task = task
+        self.condition = condition
+        self.response = response
+        self.correct = correct
+        self.time = time      # Seconds, as logged
+        self.rt = rt
+        self.index = index
+
+    @property
+    def ns(self):
+        """The time of the response, back in nanoseconds"""
+        return int(round(self.time * dual.NS))
+
+    @property
+    def onset(self):
+        """The onset (ns) that the RT was measured from"""
+        return int(round((self.time - self.rt) * dual.NS))
+
+    @property
+    def row(self):
+        return [self.task, self.condition, self.response, self.correct,
+                self.time, self.rt, self.index]
+
+
+def ReadLog(fname):
+    """Reads the responses of a text or binary log"""
+    if fname.endswith(dual.BINLOG_SUFFIX):
+        cols = dual.ReadBinaryLog(fname)
+        return [LoggedResponse(dual.TASK_CODES[cols["task"][i]],
+                               dual.CONDITION_CODES[cols["condition"][i]],
+                               cols["response"][i].decode(),
+                               bool(cols["correct"][i]),
+                               float(cols["time"][i]),
+                               float(cols["rt"][i]),
+                               int(cols["index"][i]))
+                for i in range(len(cols["time"]))]
+
+    rows = []
+    with open(fname, "r") as stream:
+        for line in stream:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < LOG_FIELDS:
+                continue
+            task, cond, resp, correct, tme, rt, index = fields[-LOG_FIELDS:]
+            rows.append(LoggedResponse(task, cond, resp, correct == "True",
+                                       float(tme), float(rt), int(index)))
+    return rows
+
+
+def JournalName(fname):
+    """The journal that goes with a text or binary log"""
+    if fname.endswith(dual.BINLOG_SUFFIX):
+        fname = fname[:-len(dual.BINLOG_SUFFIX)]
+    return fname + dual.JOURNAL_SUFFIX
+
+
+class Replay():
+    """The result of replaying a log on a trial list"""
+    def __init__(self, trials, responses, points = dual.START_POINTS,
+                 correct_points = dual.CORRECT_POINTS,
+                 decay = dual.DECAY_POINTS, tick = dual.POINT_TICK,
+                 tick_offset = 0, journal = None):
+        self.clock = dual.VirtualClock()
+        self.session = dual.DualTaskSession(trials, points, self.clock,
+                                            correct_points)
+        self.scheduler = dual.Scheduler(self.clock)
+        self.decay = decay
+        self.tick = tick
+        self.ticker = None
+        self.journal = list(journal or [])   # SessionStates to check
+        self.checked = 0                     # States checked so far
+        self.rescored = (points, correct_points, decay, tick) != \
+            (dual.START_POINTS, dual.CORRECT_POINTS, dual.DECAY_POINTS,
+             dual.POINT_TICK)
+        self.mismatches = []    # (row number, field, logged, replayed)
+        self.points = []        # Points right after every response
+        self.rows = []
+
+        # The point decay, at the deadline of every tick, as PointPanel
+        # applies it; TICK_OFFSET (s) is when the ticker was started,
+        # from the session epoch, unless the journal tells
+        if not any(state.kind == dual.JOURNAL_TICKER
+                   for state in self.journal):
+            self.StartTicker(int(tick_offset * dual.NS))
+
+        for n, logged in enumerate(responses):
+            self.Step(n, logged)
+            if self.session.finished:
+                if n + 1 < len(responses):
+                    self.mismatches.append((n + 1, "rows", len(responses),
+                                            n + 1))
+                break
+        if self.journal:
+            self.Check(len(self.rows), self.journal[-1].time)
+
+    def Decay(self):
+        self.session.points.Add(self.decay)
+
+    def StartTicker(self, tme):
+        """Starts the point decay at TME (ns), as PointPanel.Start does"""
+        if self.ticker is not None:
+            self.ticker.Cancel()
+        self.clock.Set(tme)
+        self.ticker = self.scheduler.Every(self.tick, self.Decay)
+
+    def Check(self, n, until, inclusive=True):
+        """Checks the points against the journaled states up to UNTIL
+        (ns), and starts the ticker where the journal did
+        """
+        while self.checked < len(self.journal):
+            state = self.journal[self.checked]
+            if state.time > until or (state.time == until and not inclusive):
+                return
+            self.checked += 1
+            if state.time > self.clock.Now():
+                self.scheduler.RunUntil(state.time)
+                self.clock.Set(state.time)
+            if not self.rescored and \
+               state.points != self.session.points.points:
+                self.mismatches.append((n, "points", state.points,
+                                        self.session.points.points))
+            if state.kind == dual.JOURNAL_TICKER:
+                self.StartTicker(state.time)
+
+    def Step(self, n, logged):
+        tme = logged.ns
+        self.Check(n, tme, inclusive=False)
+        if tme < self.clock.Now():
+            self.mismatches.append((n, "time", logged.time,
+                                    dual.SessionClock.Seconds(self.clock.Now())))
+            tme = self.clock.Now()
+        self.scheduler.RunUntil(tme)
+        self.clock.Set(tme)
+
+        task = self.session.active_task
+        if task is None:
+            self.mismatches.append((n, "task", logged.task, None))
+            return
+        event = self.session.Respond(logged.response, tme)
+        row = event.LogRow(logged.onset)
+        self.rows.append(row)
+        self.points.append(self.session.points.points)
+        self.Check(n, tme)
+
+        for name, a, b in zip(("task", "condition", "response", "correct",
+                               "time", "rt", "index"),
+                              logged.row, row):
+            if a != b:
+                self.mismatches.append((n, name, a, b))
+
+    @property
+    def ok(self):
+        return not self.mismatches and self.session.finished
+
+    @property
+    def final_points(self):
+        return self.session.points.points
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays logged sessions")
+    parser.add_argument("trials", help="Trial list the sessions were run on")
+    parser.add_argument("logs", nargs="+", help="Text or binary logs")
+    parser.add_argument("--points", type=int, default=dual.START_POINTS)
+    parser.add_argument("--correct-points", type=int,
+                        default=dual.CORRECT_POINTS)
+    parser.add_argument("--decay", type=int, default=dual.DECAY_POINTS)
+    parser.add_argument("--tick", type=float, default=dual.POINT_TICK)
+    parser.add_argument("--tick-offset", type=float, default=0.0,
+                        help="When the point ticker started (s), for logs "
+                        "without a journal")
+    args = parser.parse_args()
+
+    failed = 0
+    for fname in args.logs:
+        replay = Replay(dual.OpenTrials(args.trials), ReadLog(fname),
+                        args.points, args.correct_points, args.decay,
+                        args.tick, args.tick_offset,
+                        dual.ReadJournalStates(JournalName(fname)))
+        status = "ok" if replay.ok else "MISMATCH"
+        if not replay.session.finished and not replay.mismatches:
+            status = "unfinished"
+        print("%s: %s, %d responses, %d points" %
+              (fname, status, len(replay.rows), replay.final_points))
+        for n, field, logged, replayed in replay.mismatches[:10]:
+            print("    row %d: %s logged %r, replayed %r" %
+                  (n, field, logged, replayed))
+        failed += not replay.ok
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## A synthetic device writing samples into a SampleRing.
+## ---------------------------------------------------------------- ##
+## Stands in for an eye tracker: the gaze (x, y, in pixels) rests on
+## fixations and jumps between them with saccades, and the pupil
+## diameter drifts slowly, all with some noise. Samples are produced
+## at RATE Hz on the perf_counter_ns clock, and written in small
+## batches, at absolute times, so that the rate does not drift.
+##
+##   python samples.py NAME --rate 1000   # Writes into ring NAME
+##
+## The generator stops when the ring is closed by its owner, or
+## after --duration seconds. Start() runs it as a separate process
+## for the experiment.
+## ---------------------------------------------------------------- ##
+
+import sys
+import time
+import argparse
+import subprocess
+import numpy as np
+
+import dual
+
+
+CHANNELS = ("x", "y", "pupil")
+BATCH = 0.002             # Seconds between two writes
+FIXATION = 0.25           # Mean duration (s) of a fixation
+SCREEN = (1200, 800)      # Size of the window, in pixels
+NOISE = 2.0               # Pixels of gaze noise
+
+
+class Gaze():
+    """The synthetic signal, one batch of samples at a time"""
+    def __init__(self, rate, seed=None):
+        self.rate = rate
+        self.rng = np.random.default_rng(seed)
+        self.target = np.array(SCREEN, dtype=np.float64) / 2
+        self.left = 0               # Samples left in this fixation
+        self.pupil = 3.5            # Millimeters
+        self.phase = 0.0
+
+    def Next(self, n):
+        """The (n, channels) values of the next N samples"""
+        values = np.empty((n, len(CHANNELS)), dtype=np.float32)
+        done = 0
+        while done < n:
+            if self.left == 0:
+                self.target = self.rng.uniform((0, 0), SCREEN)
+                self.left = max(1, int(self.rng.exponential(FIXATION) *
+                                       self.rate))
+            k = min(n - done, self.left)
+            values[done:done + k, :2] = self.target + \
+                self.rng.normal(0, NOISE, (k, 2))
+            self.left -= k
+            done += k
+        t = self.phase + np.arange(n) / self.rate
+        values[:, 2] = self.pupil + 0.3 * np.sin(2 * np.pi * 0.1 * t) + \
+            self.rng.normal(0, 0.01, n)
+        self.phase += n / self.rate
+        return values
+
+
+def Generate(name, rate, duration=None, seed=None):
+    """Writes RATE samples per second into ring NAME until it is
+    closed, or for DURATION seconds
+    """
+    ring = dual.SampleRing.Attach(name)
+    gaze = Gaze(rate, seed)
+    period = dual.NS / rate
+    start = time.perf_counter_ns()
+    written = 0
+    try:
+        while not ring.closed:
+            now = time.perf_counter_ns()
+            if duration is not None and now - start >= duration * dual.NS:
+                break
+            due = int((now - start) / period) + 1
+            if due > written:
+                times = start + (np.arange(written, due) *
+                                 period).astype(np.int64)
+                ring.Write(times, gaze.Next(due - written))
+                written = due
+            time.sleep(max(0.0, BATCH - (time.perf_counter_ns() - now) / dual.NS))
+    finally:
+        ring.Close()
+    return written
+
+
+def Start(name, rate, seed=None):
+    """Runs the generator for ring NAME as a separate process"""
+    command = [sys.executable, __file__, name, "--rate", "%d" % rate]
+    if seed is not None:
+        command += ["--seed", "%d" % seed]
+    return subprocess.Popen(command)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic sample generator")
+    parser.add_argument("name", help="Shared memory name of the ring")
+    parser.add_argument("--rate", type=int, default=1000,
+                        help="Samples per second")
+    parser.add_argument("--duration", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    Generate(args.name, args.rate, args.duration, args.seed)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## Serves many Dual Task sessions from a single process.
+## ---------------------------------------------------------------- ##
+## Every connection is one participant, with its own trial list,
+## point ticker and logger, all driven by one asyncio event loop.
+## The protocol is line-based: every message is a JSON object on a
+## line of its own, with an "op" field.
+##
+## Client to server:
+##   {"op": "start", "participant": "p01", "trials": "trials.yaml"}
+##   {"op": "key", "key": "5"}
+##   {"op": "quit"}
+##
+## Server to client:
+##   {"op": "state", "task": ..., "condition": ..., "index": ...,
+##    "word": ... or "number1": ..., "number2": ..., "points": ...}
+##   {"op": "result", "key": ..., "correct": ..., "points": ...}
+##   {"op": "points", "points": ...}
+##   {"op": "finished", "points": ...}
+##   {"op": "error", "message": ...}
+##
+## The server listens on TCP (--host, --port) or on a Unix socket
+## (--unix). client.py is a scripted participant for it.
+##
+## A client may only name a trial list that is a plain file name in
+## the server's --trialdir; without one, every session gets --trials.
+##
+## The logs of all the sessions are written by a single writer thread,
+## so that the event loop never waits for the disk, not even when a
+## participant leaves and the log is closed.
+## ---------------------------------------------------------------- ##
+
+import os
+import json
+import asyncio
+import argparse
+import concurrent.futures
+
+import dual
+
+
+DEFAULT_PORT = 8765
+LINE_LIMIT = 4096    # Longest message accepted from a client
+BACKLOG = 1024       # Connections waiting to be accepted
+
+
+class RemoteSession():
+    """A participant's session, seen through a network connection.
+    Its log is only written by LOGWRITER, an executor of one thread.
+    """
+    def __init__(self, participant, trials, writer, logdir=None,
+                 logwriter=None):
+        self.participant = participant
+        self.writer = writer
+        self.logwriter = logwriter
+        self.session = dual.DualTaskSession(trials)
+        self.onset = self.session.clock.Now()
+        self.shown = None    # The (trial, task) on the client's screen
+        self.logger = None
+        if logdir is not None:
+            logfile = os.path.join(logdir, "%s.txt" % participant)
+            self.logger = dual.Logger(logfile,
+                                      binary=logfile + dual.BINLOG_SUFFIX)
+            self.logger.stddata = [participant]
+        self.ticker = None
+
+    @property
+    def points(self):
+        return self.session.points.points
+
+    def Send(self, **message):
+        """Queues a message for the client"""
+        self.writer.write((json.dumps(message) + "\n").encode())
+
+    def SendState(self):
+        """Tells the client what is on screen now"""
+        if self.session.finished:
+            self.Send(op="finished", points=self.points)
+            return
+        task = self.session.active_task
+        shown = (self.session.trial_number, task)
+        if shown != self.shown:
+            # A new stimulus: RTs are measured from now, as when a
+            # panel is activated in the GUI
+            self.onset = self.session.clock.Now()
+            self.shown = shown
+        state = {"op" : "state",
+                 "task" : task.task_name,
+                 "condition" : dual.CONDITIONS[task.condition],
+                 "index" : task.index,
+                 "points" : self.points}
+        if task is self.session.typing:
+            state["word"] = task.word
+        else:
+            state["number1"] = task.number1
+            state["number2"] = task.number2
+        self.Send(**state)
+
+    def Key(self, key):
+        """Processes a keystroke of the participant"""
+        if self.session.finished:
+            raise Exception("Session is finished")
+        event = self.session.Respond(key)
+        if self.logger is not None:
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(self.logwriter, self.logger.LogData,
+                                 event.LogRow(self.onset))
+        self.Send(op="result", key=key, correct=event.IsCorrect(),
+                  points=self.points)
+        self.SendState()
+
+    async def Tick(self):
+        """Removes points at every tick, as PointPanel does. Ticks are
+        scheduled at absolute times, so that they do not drift.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + dual.POINT_TICK
+        while not self.session.finished:
+            await asyncio.sleep(deadline - loop.time())
+            if self.session.finished:
+                break
+            self.session.points.Add(dual.DECAY_POINTS)
+            self.Send(op="points", points=self.points)
+            deadline += dual.POINT_TICK
+
+    def Start(self):
+        self.ticker = asyncio.ensure_future(self.Tick())
+        self.SendState()
+
+    async def Close(self):
+        """Stops the ticker, and closes the log after its last rows"""
+        if self.ticker is not None:
+            self.ticker.cancel()
+        if self.logger is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.logwriter, self.logger.Close)
+
+
+class DualTaskServer():
+    """Accepts connections and runs one RemoteSession for each"""
+    def __init__(self, trials="trials.yaml", logdir=None, trialdir=None):
+        self.trials = trials
+        self.logdir = logdir
+        self.trialdir = trialdir
+        self.sessions = {}
+        self.started = 0
+        self.logwriter = None
+        if logdir is not None:
+            self.logwriter = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="Logger")
+
+    @staticmethod
+    def SendError(writer, message):
+        writer.write((json.dumps({"op" : "error", "message" : message})
+                      + "\n").encode())
+
+    async def Handle(self, reader, writer):
+        """Runs the session of one connection"""
+        remote = None
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    self.SendError(writer, "Message longer than %d bytes"
+                                   % LINE_LIMIT)
+                    await writer.drain()
+                    break
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                    op = msg["op"]
+                    if op == "start":
+                        if remote is not None:
+                            raise Exception("Session already started")
+                        self.started += 1
+                        participant = "%s" % msg.get("participant",
+                                                     "p%06d" % self.started)
+                        if participant in self.sessions:
+                            raise Exception("Participant '%s' is already connected"
+                                            % participant)
+                        trials = self.OpenTrials(msg.get("trials"))
+                        remote = RemoteSession(participant, trials, writer,
+                                               self.logdir, self.logwriter)
+                        self.sessions[participant] = remote
+                        remote.Start()
+                    elif op == "key":
+                        if remote is None:
+                            raise Exception("Session not started")
+                        remote.Key("%s" % msg["key"])
+                    elif op == "quit":
+                        break
+                    else:
+                        raise Exception("Unknown op '%s'" % op)
+                except Exception as exc:
+                    self.SendError(writer, "%s" % exc)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if remote is not None:
+                try:
+                    await remote.Close()
+                finally:
+                    del self.sessions[remote.participant]
+            writer.close()
+
+    def OpenTrials(self, name=None):
+        """Opens the trial list NAME, in the trial directory, or the
+        default list when NAME is not given. Errors do not tell the
+        client anything about the server's files.
+        """
+        if name is None:
+            fname = self.trials
+        else:
+            name = "%s" % name
+            if self.trialdir is None or name != os.path.basename(name) \
+               or name.startswith("."):
+                raise Exception("Unknown trial list '%s'" % name)
+            fname = os.path.join(self.trialdir, name)
+            if not os.path.isfile(fname):
+                raise Exception("Unknown trial list '%s'" % name)
+        try:
+            return dual.OpenTrials(fname)
+        except Exception:
+            raise Exception("Cannot load trial list '%s'" %
+                            (name if name is not None else "default"))
+
+    async def Serve(self, host="127.0.0.1", port=DEFAULT_PORT, path=None):
+        if path is not None:
+            server = await asyncio.start_unix_server(self.Handle, path,
+                                                     limit=LINE_LIMIT,
+                                                     backlog=BACKLOG)
+        else:
+            server = await asyncio.start_server(self.Handle, host, port,
+                                                limit=LINE_LIMIT,
+                                                backlog=BACKLOG)
+        async with server:
+            await server.serve_forever()
+
+    def Close(self):
+        """Waits for the logs still being written"""
+        if self.logwriter is not None:
+            self.logwriter.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves Dual Task sessions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", default=None,
+                        help="Listen on this Unix socket instead")
+    parser.add_argument("--trials", default="trials.yaml",
+                        help="Trial list of sessions that do not name one")
+    parser.add_argument("--trialdir", default=None,
+                        help="Directory of the trial lists clients may name")
+    parser.add_argument("--logdir", default=None,
+                        help="Directory of the participants' logs")
+    args = parser.parse_args()
+
+    if args.logdir is not None and not os.path.isdir(args.logdir):
+        os.makedirs(args.logdir)
+
+    server = DualTaskServer(args.trials, args.logdir, args.trialdir)
+    try:
+        asyncio.run(server.Serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.Close()
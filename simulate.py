@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## Batch simulation of synthetic participants for the Dual Task.
+## ---------------------------------------------------------------- ##
+## The order of the keystrokes is fixed by the trial list, so it is
+## computed once by running the headless DualTaskSession. All the
+## random parts (keystroke RTs, errors, switch costs) are then drawn
+## as NumPy arrays of shape (participants, keystrokes).
+## ---------------------------------------------------------------- ##
+
+import string
+import argparse
+import numpy as np
+
+import dual
+
+
+TASKS = dual.TASK_CODES
+CONDITION_NAMES = dual.CONDITION_CODES
+
+# The keys available in each task. Responses of both tasks are coded
+# as positions in ALPHABET; typing keys start after the ten digits.
+KEYS = {"subtraction" : string.digits,
+        "typing" : string.ascii_uppercase}
+ALPHABET = np.frombuffer((string.digits + string.ascii_uppercase).encode(),
+                         dtype=np.uint8)
+KEY_BASE = {"subtraction" : 0, "typing" : len(string.digits)}
+
+# Mean and standard deviation (in seconds) of the keystroke RT, and
+# probability of an error, for every task and condition.
+DEFAULT_PARAMETERS = {
+    ("subtraction", "easy") : {"rt" : 0.90, "sd" : 0.40, "error" : 0.02},
+    ("subtraction", "hard") : {"rt" : 1.60, "sd" : 0.80, "error" : 0.08},
+    ("typing", "easy")      : {"rt" : 0.60, "sd" : 0.25, "error" : 0.02},
+    ("typing", "hard")      : {"rt" : 0.75, "sd" : 0.35, "error" : 0.04},
+}
+
+# Extra time paid when switching to the other task: every participant
+# has a mean switch cost, and every switch is drawn around it.
+SWITCH_COST = 0.25
+SWITCH_SD = 0.10
+
+# One row of the log, as written by DualTaskFrame.LogResponse:
+# task name, condition, response, correct flag, time, RT, index.
+LOG_DTYPE = np.dtype([("task", np.uint8),         # Index in TASKS
+                      ("condition", np.uint8),    # Index in CONDITION_NAMES
+                      ("response", "S1"),
+                      ("correct", np.bool_),
+                      ("time", np.float64),       # From session start
+                      ("rt", np.float64),
+                      ("index", np.int32)])
+
+
+class Schedule():
+    """The fixed sequence of keystrokes that a trial list asks for"""
+    def __init__(self, trials):
+        task = []
+        condition = []
+        correct = []
+        index = []
+
+        # Drive the real session logic with correct answers
+        session = dual.DualTaskSession(trials)
+        while not session.finished:
+            source = session.active_task
+            task.append(TASKS.index(source.task_name))
+            condition.append(CONDITION_NAMES.index(dual.CONDITIONS[source.condition]))
+            key = KEYS[source.task_name].index(source.correct_response)
+            correct.append(key)
+            index.append(source.index)
+            session.Respond(source.correct_response, tme=0.0)
+
+        self.task = np.array(task, dtype=np.uint8)
+        self.condition = np.array(condition, dtype=np.uint8)
+        self.correct = np.array(correct, dtype=np.int64)
+        self.index = np.array(index, dtype=np.int32)
+
+        # Switches happen at every keystroke but the very first one
+        self.switch = np.ones(len(self), dtype=bool)
+        self.switch[:1] = False
+
+        self.nkeys = np.array([len(KEYS[TASKS[t]]) for t in self.task],
+                              dtype=np.int64)
+        self.base = np.array([KEY_BASE[TASKS[t]] for t in self.task],
+                             dtype=np.int64)
+
+    def __len__(self):
+        return len(self.task)
+
+
+def LogNormal(mean, sd):
+    """Converts a mean and sd into the mu and sigma of a log-normal"""
+    sigma2 = np.log1p((sd / mean) ** 2)
+    return np.log(mean) - sigma2 / 2, np.sqrt(sigma2)
+
+
+def Simulate(schedule, n, parameters=None, switch_cost=SWITCH_COST,
+             switch_sd=SWITCH_SD, rng=None):
+    """Simulates N participants; returns an (N, keystrokes) log array"""
+    if parameters is None:
+        parameters = DEFAULT_PARAMETERS
+    if rng is None:
+        rng = np.random.default_rng()
+
+    k = len(schedule)
+    mean = np.empty(k)
+    sd = np.empty(k)
+    perr = np.empty(k)
+    for (t, c), p in parameters.items():
+        mask = (schedule.task == TASKS.index(t)) & \
+               (schedule.condition == CONDITION_NAMES.index(c))
+        mean[mask] = p["rt"]
+        sd[mask] = p["sd"]
+        perr[mask] = p["error"]
+
+    mu, sigma = LogNormal(mean, sd)
+    rt = rng.lognormal(mu, sigma, size=(n, k))
+
+    # Participant-level switch cost, applied to every switch
+    cost = np.maximum(rng.normal(switch_cost, switch_sd, size=(n, 1)), 0.0)
+    rt += cost * schedule.switch
+
+    # Errors are a random key other than the correct one
+    error = rng.random((n, k)) < perr
+    shift = rng.integers(1, schedule.nkeys, size=(n, k))
+    key = np.where(error,
+                   (schedule.correct + shift) % schedule.nkeys,
+                   schedule.correct)
+
+    log = np.empty((n, k), dtype=LOG_DTYPE)
+    log["task"] = schedule.task
+    log["condition"] = schedule.condition
+    log["response"] = ALPHABET[schedule.base + key].view("S1")
+    log["correct"] = ~error
+    log["rt"] = rt
+    log["time"] = np.cumsum(rt, axis=1)
+    log["index"] = schedule.index
+    return log
+
+
+def SimulateChunks(schedule, n, chunk=10000, seed=None, **kwargs):
+    """Yields logs for N participants, CHUNK participants at a time"""
+    rng = np.random.default_rng(seed)
+    done = 0
+    while done < n:
+        size = min(chunk, n - done)
+        yield Simulate(schedule, size, rng=rng, **kwargs)
+        done += size
+
+
+def Points(log, tick=1.0):
+    """Final points of every participant in a simulated log"""
+    correct = log["correct"].sum(axis=1)
+    ticks = np.floor(log["time"][:, -1] / tick)
+    return (dual.START_POINTS
+            + dual.CORRECT_POINTS * correct
+            + dual.DECAY_POINTS * ticks).astype(np.int64)
+
+
+def LogRows(log, participant):
+    """Converts one participant's log into the Logger's row format"""
+    rows = []
+    for r in log[participant]:
+        rows.append([TASKS[r["task"]],
+                     CONDITION_NAMES[r["condition"]],
+                     r["response"].decode(),
+                     bool(r["correct"]),
+                     float(r["time"]),
+                     float(r["rt"]),
+                     int(r["index"])])
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulates participants")
+    parser.add_argument("trials", nargs="?", default="trials.yaml")
+    parser.add_argument("-n", type=int, default=1000,
+                        help="Number of participants")
+    parser.add_argument("--chunk", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    schedule = Schedule(dual.LoadTrials(args.trials))
+    ncorrect = np.zeros(len(schedule))
+    rtsum = np.zeros(len(schedule))
+    points = []
+    for log in SimulateChunks(schedule, args.n, args.chunk, args.seed):
+        ncorrect += log["correct"].sum(axis=0)
+        rtsum += log["rt"].sum(axis=0)
+        points.append(Points(log))
+
+    for t, tname in enumerate(TASKS):
+        for c, cname in enumerate(CONDITION_NAMES):
+            mask = (schedule.task == t) & (schedule.condition == c)
+            if mask.any():
+                total = args.n * mask.sum()
+                print("%-12s %-5s accuracy %.3f  mean RT %.3f" %
+                      (tname, cname,
+                       ncorrect[mask].sum() / total,
+                       rtsum[mask].sum() / total))
+    print("Mean points: %.1f" % np.concatenate(points).mean())